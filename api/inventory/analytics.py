@@ -0,0 +1,256 @@
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .archive import archive_cutoff
+from .cache import PRODUCTS, version
+from .models import ArchivedSale, Product, Purchase, Sale
+
+REVENUE = 'revenue'
+QUANTITY = 'quantity'
+
+
+class Table:
+    """
+    仕入・売上を (id, product, quantity, date) の列で保持し、id の watermark 以降を追加で読み込む
+    """
+
+    def __init__(self, model, date_field):
+        self.model = model
+        self.date_field = date_field
+        self.frame = self.load(self.model.objects.none())
+        self.watermark = 0
+
+    def load(self, queryset):
+        rows = queryset.order_by('id').values_list(
+            'id', 'product_id', 'quantity', self.date_field)
+        frame = pd.DataFrame.from_records(
+            rows.iterator(chunk_size=settings.INVENTORY_EXPORT_CHUNK_SIZE),
+            columns=['id', 'product', 'quantity', 'date'])
+        # 日時は datetime64 のまま比較できるよう、タイムゾーンなしのUTCで保持する
+        frame['date'] = pd.to_datetime(frame['date'], utc=True).dt.tz_localize(None)
+        return frame.astype({'id': np.int64, 'product': np.int64, 'quantity': np.int64})
+
+    def refresh(self):
+        """
+        watermark 以降に登録された行を読み込む
+        watermark 以前の行が更新・削除されて件数が合わない場合は全件を読み直す
+        """
+        stats = self.model.objects.aggregate(count=Count('id'), last=Max('id'))
+        if stats['count'] == len(self.frame) and (stats['last'] or 0) == self.watermark:
+            return
+        added = self.load(self.model.objects.filter(id__gt=self.watermark))
+        if len(self.frame) + len(added) == stats['count']:
+            self.frame = pd.concat([self.frame, added], ignore_index=True) if len(self.frame) else added
+        else:
+            self.frame = self.load(self.model.objects.all())
+        self.watermark = int(self.frame['id'].iloc[-1]) if len(self.frame) else 0
+
+
+class AnalyticsEngine:
+    """
+    売上・仕入・商品の価格をメモリ上の列に保持して集計する
+    INVENTORY_ANALYTICS_REFRESH_SECONDS ごとに差分だけを読み込むため、
+    リクエストごとに売上・仕入のテーブルを集計しない
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._sales = None
+            self._archived = None
+            self._all_sales = (None, None, None)
+            self._purchases = None
+            self._products = None
+            self._products_version = None
+            self._refreshed_at = None
+
+    def refresh(self, force=False):
+        """
+        前回の読み込みから一定時間が過ぎていれば差分を読み込み、(売上, 仕入, 商品) を返す
+        """
+        with self._lock:
+            now = time.monotonic()
+            expired = (force or self._refreshed_at is None
+                       or now - self._refreshed_at >= settings.INVENTORY_ANALYTICS_REFRESH_SECONDS)
+            if expired:
+                if self._sales is None:
+                    self._sales = Table(Sale, 'sale_date')
+                    self._archived = Table(ArchivedSale, 'sale_date')
+                    self._purchases = Table(Purchase, 'purchase_date')
+                self._sales.refresh()
+                # アーカイブ済み売上はアーカイブを実行した場合のみ読む
+                if archive_cutoff() is not None:
+                    self._archived.refresh()
+                self._purchases.refresh()
+                self._refreshed_at = now
+
+            # 商品はAPIで変更された場合は更新間隔を待たずに読み直す
+            products_version = version(PRODUCTS)
+            if expired or products_version != self._products_version:
+                self._products = pd.DataFrame.from_records(
+                    Product.objects.values_list('id', 'name', 'price'),
+                    columns=['id', 'name', 'price'], index='id')
+                self._products_version = products_version
+            return self._sales_frame(), self._purchases.frame, self._products
+
+    def _sales_frame(self):
+        """
+        売上とアーカイブ済み売上を連結した列(どちらかを読み直した場合のみ連結し直す)
+        """
+        hot, archived = self._sales.frame, self._archived.frame
+        if not len(archived):
+            return hot
+        if self._all_sales[0] is not hot or self._all_sales[1] is not archived:
+            self._all_sales = (hot, archived, pd.concat([archived, hot], ignore_index=True))
+        return self._all_sales[2]
+
+
+engine = AnalyticsEngine()
+
+
+def _utc(value):
+    return pd.Timestamp(value).tz_convert('UTC').tz_localize(None).to_datetime64()
+
+
+def _mask(frame, date_from=None, date_to=None):
+    """
+    期間内の行の真偽値の配列(期間の指定がなければ None)
+    """
+    if date_from is None and date_to is None:
+        return None
+    dates = frame['date'].to_numpy()
+    mask = np.ones(len(frame), dtype=bool)
+    if date_from is not None:
+        mask &= dates >= _utc(date_from)
+    if date_to is not None:
+        mask &= dates <= _utc(date_to)
+    return mask
+
+
+def _totals(frame, size, date_from=None, date_to=None):
+    """
+    商品IDを添字とした数量の合計と行数の配列(groupby より速く、一時的なメモリも少ない)
+    """
+    product = frame['product'].to_numpy()
+    quantity = frame['quantity'].to_numpy()
+    mask = _mask(frame, date_from, date_to)
+    if mask is not None:
+        product, quantity = product[mask], quantity[mask]
+    totals = np.bincount(product, weights=quantity, minlength=size)[:size].astype(np.int64)
+    counts = np.bincount(product, minlength=size)[:size]
+    return totals, counts
+
+
+def _product_size(sales, products):
+    ids = [products.index.max() if len(products) else 0,
+           sales['product'].max() if len(sales) else 0]
+    return int(max(ids)) + 1
+
+
+def _records(frame):
+    """
+    DataFrame を NaN を None にした辞書のリストにする
+    """
+    names = list(frame.columns)
+    columns = [
+        [None if value != value else value for value in frame[name].tolist()]
+        if frame[name].dtype.kind == 'f' else frame[name].tolist()
+        for name in names
+    ]
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def _revenue(date_from=None, date_to=None):
+    sales, _, products = engine.refresh()
+    totals, counts = _totals(sales, _product_size(sales, products), date_from, date_to)
+    ids = products.index.to_numpy(np.int64)
+    sold = counts[ids] > 0
+    return pd.DataFrame({
+        'product': ids[sold],
+        'name': products['name'].to_numpy()[sold],
+        'quantity': totals[ids][sold],
+        'revenue': totals[ids][sold] * products['price'].to_numpy()[sold],
+    })
+
+
+def revenue(date_from=None, date_to=None):
+    """
+    商品ごとの売上数量・売上金額(現在の価格で計算する)を売上金額の多い順に返す
+    """
+    frame = _revenue(date_from, date_to)
+    return _records(frame.sort_values(['revenue', 'product'], ascending=[False, True]))
+
+
+def top_products(limit, by=REVENUE, date_from=None, date_to=None):
+    """
+    売上金額または売上数量の上位 limit 件の商品を返す
+    """
+    frame = _revenue(date_from, date_to)
+    frame = frame.sort_values([by, 'product'], ascending=[False, True]).head(limit)
+    return _records(frame)
+
+
+def rolling(window, product=None, date_from=None, date_to=None):
+    """
+    日ごとの売上数量・売上金額と、直近 window 日間の合計を返す
+    """
+    sales, _, products = engine.refresh()
+    if product is not None:
+        sales = sales[sales['product'].to_numpy() == product]
+    mask = _mask(sales, date_from, date_to)
+    if mask is not None:
+        sales = sales[mask]
+    if not len(sales):
+        return []
+
+    prices = products['price'].reindex(sales['product']).fillna(0).to_numpy(np.int64)
+    daily = pd.DataFrame({
+        'quantity': sales['quantity'].to_numpy(),
+        'revenue': sales['quantity'].to_numpy() * prices,
+    }, index=sales['date'].dt.floor('D').to_numpy()).groupby(level=0).sum().asfreq('D', fill_value=0)
+    summed = daily.rolling(window, min_periods=1).sum().astype(np.int64)
+    return _records(pd.DataFrame({
+        'date': daily.index.strftime('%Y-%m-%d'),
+        'quantity': daily['quantity'].to_numpy(),
+        'revenue': daily['revenue'].to_numpy(),
+        'rolling_quantity': summed['quantity'].to_numpy(),
+        'rolling_revenue': summed['revenue'].to_numpy(),
+    }))
+
+
+def stock_cover(window, now=None):
+    """
+    商品ごとの仕入数量・売上数量・在庫数量・消化率(売上数量/仕入数量)と、
+    直近 window 日間の1日あたり売上数量から計算した在庫日数を返す
+    """
+    sales, purchases, products = engine.refresh()
+    since = (now or timezone.now()) - timedelta(days=window)
+    size = _product_size(sales, products)
+    size = max(size, int(purchases['product'].max()) + 1 if len(purchases) else 0)
+    ids = products.index.to_numpy(np.int64)
+    purchased = _totals(purchases, size)[0][ids]
+    sold = _totals(sales, size)[0][ids]
+    recent = _totals(sales, size, since)[0][ids]
+    stock = purchased - sold
+    frame = pd.DataFrame({
+        'product': ids,
+        'name': products['name'].to_numpy(),
+        'purchased': purchased,
+        'sold': sold,
+        'stock': stock,
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frame['sell_through'] = np.where(purchased > 0, np.round(sold / purchased, 4), np.nan)
+        daily = recent / window
+        frame['days_of_cover'] = np.where(daily > 0, np.round(stock / daily, 1), np.nan)
+    return _records(frame)
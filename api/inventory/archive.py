@@ -0,0 +1,158 @@
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Case, F, Max, Value, When
+
+from .cache import get_version_cache
+from .models import ArchivedSale, Sale, SalesArchive, SalesCarryForward
+
+# 1回のクエリでまとめて更新する繰越の行数
+BATCH_SIZE = 300
+
+# アーカイブの基準日時を保持するキャッシュのキー
+CUTOFF_KEY = 'inventory-api:archive-cutoff'
+
+_archiving = ContextVar('archiving', default=False)
+
+
+def archiving():
+    """
+    アーカイブ済み売上への移動のために売上を削除しているか
+    """
+    return _archiving.get()
+
+
+def _latest_cutoff():
+    return SalesArchive.objects.aggregate(cutoff=Max('cutoff'))['cutoff']
+
+
+def archive_cutoff():
+    """
+    アーカイブの基準日時(アーカイブしていない場合は None)
+    他のプロセスで実行したアーカイブも反映されるよう、世代番号と同じく
+    すべてのプロセスで共有するキャッシュに保持し、ない場合のみデータベースから取得する
+    """
+    cache = get_version_cache()
+    cached = cache.get(CUTOFF_KEY)
+    if cached is None:
+        # アーカイブしていない場合も None と区別してキャッシュする
+        cached = (_latest_cutoff(),)
+        # 取得中に archive_sales() が登録した基準日時を上書きしない
+        cache.add(CUTOFF_KEY, cached, None)
+    return cached[0]
+
+
+async def aarchive_cutoff():
+    """
+    archive_cutoff() の非同期版
+    """
+    cache = get_version_cache()
+    cached = await cache.aget(CUTOFF_KEY)
+    if cached is None:
+        cached = ((await SalesArchive.objects.aaggregate(cutoff=Max('cutoff')))['cutoff'],)
+        await cache.aadd(CUTOFF_KEY, cached, None)
+    return cached[0]
+
+
+def reads_archive(date_from, cutoff):
+    """
+    期間の開始が date_from の読み取りでアーカイブ済み売上を読む必要があるか
+    """
+    return cutoff is not None and (date_from is None or date_from < cutoff)
+
+
+def sale_models(date_from=None):
+    """
+    期間の開始が date_from の売上を読むモデルの一覧
+    """
+    return [Sale, ArchivedSale] if reads_archive(date_from, archive_cutoff()) else [Sale]
+
+
+async def asale_models(date_from=None):
+    """
+    sale_models() の非同期版
+    """
+    return [Sale, ArchivedSale] if reads_archive(date_from, await aarchive_cutoff()) else [Sale]
+
+
+def carried_forward(product_ids=None):
+    """
+    アーカイブ済み売上の商品ごとの数量の合計を {商品ID: 数量} で返す
+    """
+    rows = SalesCarryForward.objects.all()
+    if product_ids is not None:
+        rows = rows.filter(product_id__in=product_ids)
+    return dict(rows.values_list('product_id', 'quantity'))
+
+
+def _carry_forward(totals):
+    """
+    商品ごとの (数量, 件数) を繰越に加算する(行がなければ作成する)
+    """
+    items = list(totals.items())
+    for offset in range(0, len(items), BATCH_SIZE):
+        batch = items[offset:offset + BATCH_SIZE]
+        SalesCarryForward.objects.bulk_create(
+            [SalesCarryForward(product_id=product_id) for product_id, _ in batch],
+            ignore_conflicts=True)
+        product_ids = [product_id for product_id, _ in batch]
+        SalesCarryForward.objects.filter(product_id__in=product_ids).update(
+            quantity=F('quantity') + Case(
+                *[When(product_id=product_id, then=Value(quantity))
+                  for product_id, (quantity, _) in batch],
+                default=Value(0)),
+            count=F('count') + Case(
+                *[When(product_id=product_id, then=Value(count))
+                  for product_id, (_, count) in batch],
+                default=Value(0)))
+
+
+def _archive_batch(cutoff, batch_size):
+    """
+    cutoff より前の売上を batch_size 件までアーカイブ済み売上に移動し、移動した件数を返す
+    在庫数量・売上集計は変わらないため、売上の削除時のシグナルでは何もしない(archiving())
+    """
+    with transaction.atomic():
+        # 売上日時のインデックス順に読み、古い売上から移動する
+        rows = list(Sale.objects.select_for_update().filter(sale_date__lt=cutoff).order_by(
+            'sale_date', 'id').values_list(
+            'id', 'product_id', 'quantity', 'sale_date', 'import_file_id')[:batch_size])
+        if not rows:
+            return 0
+        ArchivedSale.objects.bulk_create(
+            [ArchivedSale(id=id, product_id=product_id, quantity=quantity, sale_date=sale_date,
+                          import_file_id=import_file_id)
+             for id, product_id, quantity, sale_date, import_file_id in rows],
+            batch_size=1000)
+
+        totals = {}
+        for _, product_id, quantity, _, _ in rows:
+            total_quantity, count = totals.get(product_id, (0, 0))
+            totals[product_id] = (total_quantity + quantity, count + 1)
+        _carry_forward(totals)
+
+        token = _archiving.set(True)
+        try:
+            Sale.objects.filter(id__in=[row[0] for row in rows]).delete()
+        finally:
+            _archiving.reset(token)
+    return len(rows)
+
+
+def archive_sales(cutoff, batch_size):
+    """
+    cutoff より前の売上を batch_size 件ずつアーカイブ済み売上に移動し、移動した件数を返す
+    読み取りが移動中の売上も読むよう、先に基準日時を登録し、共有するキャッシュに反映してから移動する
+    """
+    archive = SalesArchive.objects.create(cutoff=cutoff)
+    get_version_cache().set(CUTOFF_KEY, (_latest_cutoff(),), None)
+
+    archived = 0
+    while True:
+        moved = _archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        archived += moved
+
+    SalesArchive.objects.filter(pk=archive.pk).update(rows=archived)
+    return archived
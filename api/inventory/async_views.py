@@ -0,0 +1,115 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+
+from . import views
+from .archive import asale_models
+from .cache import PRODUCTS, acached_response, inventory_scope, product_scope
+from .ledger import ledger_querysets, ledger_union
+from .models import Product
+from .renderers import FastJSONRenderer
+from .rollups import month_start
+from .serializers import (
+    DateRangeSerializer,
+    InventorySerializer,
+    ProductSerializer,
+    SalesSerializer,
+)
+
+
+def render(data, status=status.HTTP_200_OK):
+    """
+    同期のビューと同じJSONのレスポンスを作成する
+    """
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def date_range(request):
+    """
+    date_from / date_to を検証して返す(不正な場合は None とエラーのレスポンス)
+    """
+    filters = DateRangeSerializer(data=request.GET)
+    if not filters.is_valid():
+        return None, render(filters.errors, status.HTTP_400_BAD_REQUEST)
+    return filters.validated_data, None
+
+
+class AsyncView(View):
+    """
+    Django の非同期ORMで読み取りを行うビュー
+    ページ分割はDRFのページネーションに合わせるため、page_size の指定されたリクエストは
+    sync_view に処理させる
+    """
+    sync_view = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method == 'GET' and 'page_size' in request.GET:
+            return await sync_to_async(self.get_sync)(request, *args, **kwargs)
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_sync(self, request, *args, **kwargs):
+        return self.sync_view.as_view()(request, *args, **kwargs).render()
+
+
+class AsyncProductView(AsyncView):
+    sync_view = views.ProductView
+
+    async def get(self, request, id=None):
+        """
+        商品情報を取得する
+        """
+        if id is None:
+            return await acached_response(request, [PRODUCTS], self.list_products, render)
+
+        async def build():
+            return ProductSerializer(await Product.objects.aget(pk=id)).data
+
+        try:
+            return await acached_response(request, [product_scope(id)], build, render)
+        except Product.DoesNotExist:
+            return render({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+
+    async def list_products(self):
+        return ProductSerializer([product async for product in Product.objects.all()], many=True).data
+
+
+class AsyncInventoryView(AsyncView):
+    sync_view = views.InventoryView
+
+    async def get(self, request, id):
+        """
+        指定された商品の仕入れ・売上情報を日時順に取得する
+        """
+        filters, error = date_range(request)
+        if error is not None:
+            return error
+
+        async def build():
+            models = await asale_models(filters.get('date_from'))
+            queryset = ledger_union(ledger_querysets(
+                id, filters.get('date_from'), filters.get('date_to'), models))
+            return InventorySerializer([row async for row in queryset], many=True).data
+
+        return await acached_response(
+            request, [inventory_scope(id), product_scope(id)], build, render)
+
+
+class AsyncSalesList(AsyncView):
+    sync_view = views.SalesList
+
+    async def get(self, request):
+        """
+        月ごとの売上数量を取得する
+        """
+        filters, error = date_range(request)
+        if error is not None:
+            return error
+
+        queryset = views.SalesList.queryset.all()
+        if 'date_from' in filters:
+            queryset = queryset.filter(month__gte=month_start(filters['date_from']))
+        if 'date_to' in filters:
+            queryset = queryset.filter(month__lte=filters['date_to'])
+        return render(SalesSerializer([row async for row in queryset], many=True).data)
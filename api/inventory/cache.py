@@ -0,0 +1,130 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+PRODUCTS = 'products'
+
+
+def product_scope(id):
+    return f'product:{id}'
+
+
+def inventory_scope(id):
+    return f'inventory:{id}'
+
+
+def get_cache():
+    """
+    APIのレスポンスキャッシュに使用するキャッシュを取得する
+    """
+    return caches[settings.INVENTORY_CACHE_ALIAS]
+
+
+def get_version_cache():
+    """
+    スコープの世代番号を保存するキャッシュを取得する
+    他のプロセスでの更新も反映されるよう、すべてのプロセスで共有するキャッシュを使用する
+    """
+    return caches[settings.INVENTORY_VERSION_CACHE_ALIAS]
+
+
+def _version_key(scope):
+    return f'inventory-api:version:{scope}'
+
+
+def version(scope):
+    """
+    スコープの世代番号を取得する
+    未登録・追い出し済みの場合は現在時刻で初期化し、過去の世代と重複しないようにする
+    """
+    cache = get_version_cache()
+    key = _version_key(scope)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def invalidate(*scopes):
+    """
+    スコープの世代番号を進めて、キャッシュ済みのレスポンスを無効にする
+    """
+    cache = get_version_cache()
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), time.time_ns(), None)
+
+
+def _etag(request, versions):
+    versions = ':'.join(str(version) for version in versions)
+    return hashlib.sha1(f'{request.build_absolute_uri()}|{versions}'.encode()).hexdigest()
+
+
+def _not_modified(request, etag):
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return etag in etags or '*' in etags
+
+
+def cached_response(request, scopes, build):
+    """
+    スコープの世代番号とURLからETagを作成し、
+    If-None-Match が一致すれば304を、キャッシュがあればキャッシュしたデータを返す
+    """
+    digest = _etag(request, [version(scope) for scope in scopes])
+    etag = f'"{digest}"'
+    headers = {'ETag': etag}
+    if _not_modified(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cache = get_cache()
+    key = f'inventory-api:response:{digest}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.INVENTORY_CACHE_TIMEOUT)
+    return Response(data, status.HTTP_200_OK, headers=headers)
+
+
+async def aversion(scope):
+    """
+    version() の非同期版
+    """
+    cache = get_version_cache()
+    key = _version_key(scope)
+    value = await cache.aget(key)
+    if value is None:
+        await cache.aadd(key, time.time_ns(), None)
+        value = await cache.aget(key)
+    return value
+
+
+async def acached_response(request, scopes, build, render):
+    """
+    cached_response() の非同期版
+    build はデータを作成するコルーチン関数、render はデータからレスポンスを作成する関数
+    """
+    digest = _etag(request, [await aversion(scope) for scope in scopes])
+    etag = f'"{digest}"'
+    if _not_modified(request, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    cache = get_cache()
+    key = f'inventory-api:response:{digest}'
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, settings.INVENTORY_CACHE_TIMEOUT)
+    response = render(data)
+    response['ETag'] = etag
+    return response
@@ -1,6 +1,12 @@
 from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, ValidationError
 
 
 class BusinessException(ValidationError):
     status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'payload_too_large'
@@ -0,0 +1,94 @@
+import csv
+import heapq
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+
+from .ledger import ledger_querysets
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson',
+    CSV: 'text/csv; charset=utf-8',
+}
+
+
+def inventory_ledger(product_id, date_from=None, date_to=None):
+    """
+    商品の仕入・売上を (日時, 種別, ID) の順に1件ずつ返す
+    仕入・売上それぞれをインデックス順に読み出して併合するため、全件をメモリに載せない
+    期間の開始がアーカイブの基準日時より前の場合はアーカイブ済み売上も併合する
+    """
+    chunk_size = settings.INVENTORY_EXPORT_CHUNK_SIZE
+    return heapq.merge(
+        *[queryset.order_by('date', 'id').iterator(chunk_size=chunk_size)
+          for _, queryset in ledger_querysets(product_id, date_from, date_to)],
+        key=lambda row: (row['date'], row['type'], row['id']))
+
+
+def sales_rows(queryset):
+    """
+    売上を1件ずつ返す
+    """
+    return queryset.values('id', 'product', 'quantity', 'sale_date', 'import_file').iterator(
+        chunk_size=settings.INVENTORY_EXPORT_CHUNK_SIZE)
+
+
+def merge_rows(querysets, key):
+    """
+    同じ順に並べた売上・アーカイブ済み売上のクエリセットを併合して1件ずつ返す
+    """
+    if len(querysets) == 1:
+        return sales_rows(querysets[0])
+    return heapq.merge(*[sales_rows(queryset) for queryset in querysets], key=key)
+
+
+class _Echo:
+    """
+    csv.writer の書き込み先として、書き込まれた文字列をそのまま返す
+    """
+
+    def write(self, value):
+        return value
+
+
+def encode(rows, serializer_class, fmt):
+    """
+    行をシリアライザで変換し、NDJSON またはCSVのバイト列として少しずつ返す
+    """
+    fields = list(serializer_class().fields)
+    rows = serializer_class(many=True).iter_representation(rows)
+    if fmt == CSV:
+        writer = csv.writer(_Echo())
+        lines = map(lambda row: writer.writerow([row[name] for name in fields]), rows)
+        header = writer.writerow(fields)
+    else:
+        lines = map(lambda row: json.dumps(
+            row, ensure_ascii=False, separators=(',', ':')) + '\n', rows)
+        header = ''
+
+    # 1行ずつ送らずに、エクスポートのチャンク単位でまとめて送る
+    buffer = [header]
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= settings.INVENTORY_EXPORT_CHUNK_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def export_response(rows, serializer_class, fmt, filename):
+    """
+    行をストリーミングで返すレスポンスを作成する
+    """
+    if fmt not in CONTENT_TYPES:
+        raise NotFound(f'Unsupported export format: {fmt}')
+    response = StreamingHttpResponse(
+        encode(rows, serializer_class, fmt), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
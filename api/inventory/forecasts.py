@@ -0,0 +1,110 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DailySales, Product, SalesForecast
+
+
+def sales_matrix(start, end):
+    """
+    商品ID(昇順)の配列と、商品 × start から end までの日ごとの売上数量の行列を返す
+    売上のない日は0とする
+    """
+    ids = np.fromiter(Product.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    matrix = np.zeros((len(ids), (end - start).days + 1))
+    rows = DailySales.objects.filter(date__range=(start, end)).values_list(
+        'product_id', 'date', 'quantity')
+    frame = pd.DataFrame.from_records(
+        rows.iterator(chunk_size=settings.INVENTORY_EXPORT_CHUNK_SIZE),
+        columns=['product', 'date', 'quantity'])
+    if not len(frame) or not len(ids):
+        return ids, matrix
+
+    product = frame['product'].to_numpy(np.int64)
+    index = np.searchsorted(ids, product).clip(max=len(ids) - 1)
+    # 商品の一覧を読んだ後に登録された商品の売上は含めない
+    known = ids[index] == product
+    days = (pd.to_datetime(frame['date']) - pd.Timestamp(start)).dt.days.to_numpy()
+    matrix[index[known], days[known]] = frame['quantity'].to_numpy()[known]
+    return ids, matrix
+
+
+def moving_average(matrix, window):
+    """
+    商品ごとの直近 window 日の1日あたり売上数量
+    """
+    if not matrix.shape[1]:
+        return np.zeros(len(matrix))
+    return matrix[:, -window:].mean(axis=1)
+
+
+def exponential_smoothing(matrix, alpha):
+    """
+    商品ごとの単純指数平滑化による1日あたり売上数量(初日の売上数量を初期値とする)
+    漸化式 s_t = alpha * x_t + (1 - alpha) * s_{t-1} を展開した重みとの積で全商品をまとめて計算する
+    """
+    days = matrix.shape[1]
+    if not days:
+        return np.zeros(len(matrix))
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1)
+    weights[0] = (1 - alpha) ** (days - 1)
+    return matrix @ weights
+
+
+def forecast(matrix, window, alpha):
+    """
+    商品ごとの (移動平均, 指数平滑) の行列を返す(プロセスプールで実行するため DB を使わない)
+    """
+    return np.column_stack([moving_average(matrix, window), exponential_smoothing(matrix, alpha)])
+
+
+def compute(matrix, window, alpha, processes=1):
+    """
+    商品を INVENTORY_FORECAST_CHUNK_SIZE ずつに分けて予測する
+    複数の塊になる場合は processes 個のプロセスで並列に計算する
+    """
+    chunk_size = settings.INVENTORY_FORECAST_CHUNK_SIZE
+    chunks = [matrix[offset:offset + chunk_size] for offset in range(0, len(matrix), chunk_size)]
+    task = partial(forecast, window=window, alpha=alpha)
+    if processes > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks)),
+                                 mp_context=multiprocessing.get_context('fork')) as pool:
+            results = list(pool.map(task, chunks))
+    else:
+        results = [task(chunk) for chunk in chunks]
+    return np.concatenate(results) if results else np.zeros((0, 2))
+
+
+def run_forecasts(as_of=None, window=None, alpha=None, horizon=None, processes=None):
+    """
+    as_of(省略時は前日)までの INVENTORY_FORECAST_HISTORY_DAYS 日間の日次売上集計から
+    全商品の売上予測を計算して保存し、保存した件数を返す
+    予測数量は指数平滑の1日あたり売上数量の horizon 日分とする
+    """
+    as_of = as_of or timezone.localdate() - timedelta(days=1)
+    window = window or settings.INVENTORY_FORECAST_WINDOW
+    alpha = alpha or settings.INVENTORY_FORECAST_ALPHA
+    horizon = horizon or settings.INVENTORY_FORECAST_HORIZON
+    processes = processes or settings.INVENTORY_FORECAST_PROCESSES
+
+    ids, matrix = sales_matrix(
+        as_of - timedelta(days=settings.INVENTORY_FORECAST_HISTORY_DAYS - 1), as_of)
+    results = compute(matrix, window, alpha, processes)
+    created_at = timezone.now()
+    forecasts = [
+        SalesForecast(product_id=product_id, as_of=as_of, window=window, alpha=alpha,
+                      moving_average=average, smoothed=smoothed, horizon=horizon,
+                      quantity=smoothed * horizon, created_at=created_at)
+        for product_id, (average, smoothed) in zip(ids.tolist(), results.tolist())
+    ]
+    SalesForecast.objects.bulk_create(
+        forecasts, batch_size=1000, update_conflicts=True, unique_fields=['product'],
+        update_fields=['as_of', 'window', 'alpha', 'moving_average', 'smoothed', 'horizon',
+                       'quantity', 'created_at'])
+    return len(forecasts)
@@ -0,0 +1,357 @@
+import csv
+import io
+import itertools
+import logging
+import os
+import time
+from dataclasses import dataclass
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .cache import inventory_scope, invalidate
+from .loaders import load_sales
+from .models import Product, SalesFile, Status
+from .stocks import add_stocks, lock_stocks
+from .uploads import error_report_path
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['product', 'date', 'quantity']
+
+# 在庫数量を超える売上の扱い
+REJECT = 'reject'
+FLAG = 'flag'
+
+# 商品ID・数量の上限(int64 に変換する前に範囲外の値を除く)
+MAX_INTEGER = 2**31 - 1
+
+# 列ごとのエラー内容
+ERRORS = {
+    'product': 'unknown product',
+    'quantity': f'quantity must be an integer between 0 and {MAX_INTEGER}',
+    'date': 'invalid date',
+    'fields': 'too many fields',
+}
+
+AWARE_SUFFIX = r'(?:Z|[+-]\d{2}:?\d{2})$'
+
+# ヘッダーより多い列の値を読み込む列
+EXTRA = '<extra>'
+
+
+class InvalidSalesFile(Exception):
+    """
+    売上CSVを解析できない
+    """
+
+
+@dataclass
+class IngestionResult:
+    """
+    取込結果
+    """
+    rows: int = 0
+    errors: int = 0
+    overruns: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def missing_columns(path):
+    """
+    売上CSVのヘッダーにない列の一覧を返す(ヘッダーを読めない場合はすべての列)
+    """
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            columns = next(csv.reader(f), [])
+    except (csv.Error, UnicodeDecodeError):
+        return COLUMNS
+    return [column for column in COLUMNS if column not in columns]
+
+
+class _HeaderStream:
+    """
+    列名の行を読ませてから、ファイルの残り(読み進めた位置以降)を読ませる
+    read_csv はこの行の列数で各行を読むため、ヘッダーより多い列を EXTRA 列として読み込める
+    """
+
+    def __init__(self, names, f):
+        line = io.StringIO()
+        csv.writer(line).writerow(names)
+        self.header = line.getvalue()
+        self.f = f
+
+    def read(self, size=-1):
+        if self.header:
+            header, self.header = self.header, ''
+            return header
+        return self.f.read(size)
+
+    def __iter__(self):
+        return itertools.chain([self.read()], self.f)
+
+
+def read_chunks(path, chunk_size=None, skip_rows=0):
+    """
+    売上CSVを固定行数ごとに読み込む
+    skip_rows を指定した場合はヘッダーを除く先頭の行を読み飛ばす
+    読み飛ばす行番号の集合を作らないよう、ファイルを1行ずつ読み進めてから残りを読み込む
+    ヘッダーより列の多い行は、ヘッダーの次の列の値を EXTRA 列に読み込む
+    解析できない場合は InvalidSalesFile を送出する
+    """
+    chunk_size = chunk_size or settings.SALES_IMPORT_CHUNK_SIZE
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            rows = csv.reader(f)
+            names = next(rows, []) + [EXTRA]
+            if len(set(names)) != len(names):
+                raise InvalidSalesFile('duplicate columns in header')
+            # read_csv と同じく空行は行数に数えない
+            skipped = 0
+            while skipped < skip_rows:
+                row = next(rows, None)
+                if row is None:
+                    break
+                skipped += bool(row)
+            with pd.read_csv(_HeaderStream(names, f), usecols=COLUMNS + [EXTRA],
+                             dtype={EXTRA: 'string'}, chunksize=chunk_size) as reader:
+                # 最後の行まで読み飛ばした場合は空のチャンクになる
+                yield from (chunk for chunk in reader if len(chunk))
+    except (pd.errors.ParserError, csv.Error, UnicodeDecodeError) as e:
+        raise InvalidSalesFile(str(e).strip()) from e
+
+
+def parse_dates(values):
+    """
+    日時の列を変換する(変換できない値は NaT)
+    """
+    dates = pd.to_datetime(values, format='ISO8601', utc=True, errors='coerce')
+    naive = ~values.astype(str).str.contains(AWARE_SUFFIX)
+    if naive.any() and timezone.get_default_timezone_name() != 'UTC':
+        # タイムゾーン指定のない日時は既定のタイムゾーンとして扱う
+        dates[naive] = dates[naive].dt.tz_localize(None).dt.tz_localize(
+            timezone.get_default_timezone_name()).dt.tz_convert('UTC')
+    return dates
+
+
+def product_ids():
+    """
+    登録済みの商品IDを検証用に1回のクエリで取得する
+    """
+    return np.fromiter(Product.objects.values_list('id', flat=True), dtype='int64')
+
+
+def validate_chunk(chunk, products, offset=0):
+    """
+    CSVの列を列単位で検証・変換し、(取り込む行, エラーの行) を返す
+    エラーの行には先頭からの行番号(ヘッダーを除き1始まり)とエラー内容を付ける
+    """
+    product = pd.to_numeric(chunk['product'], errors='coerce')
+    quantity = pd.to_numeric(chunk['quantity'], errors='coerce')
+    dates = parse_dates(chunk['date'])
+    invalid = pd.DataFrame({
+        'product': ~(product.isin(products) & (product <= MAX_INTEGER)),
+        # Sale.quantity の MinValueValidator(0) と同じ下限、IntegerField の上限
+        'quantity': ~((quantity >= 0) & (quantity <= MAX_INTEGER) & (quantity % 1 == 0)),
+        'date': dates.isna(),
+        'fields': chunk[EXTRA].notna(),
+    }, index=chunk.index)
+    rejected = invalid.any(axis=1).to_numpy()
+
+    # 取り込む行の index はCSVの行番号(ヘッダーを除き1始まり)とする
+    rows = offset + 1 + np.arange(len(chunk))
+    frame = pd.DataFrame({
+        'product': product[~rejected].astype('int64').to_numpy(),
+        'quantity': quantity[~rejected].astype('int64').to_numpy(),
+        'date': dates[~rejected].to_numpy(),
+    }, index=rows[~rejected])
+
+    messages = pd.Series('', index=chunk.index)[rejected]
+    for column, message in ERRORS.items():
+        messages = messages.where(~invalid.loc[rejected, column], messages + message + '; ')
+    return frame, report_rows(chunk, offset, rows[rejected], messages.str.rstrip('; ').to_numpy())
+
+
+def check_stock(chunk, frame, offset, policy=None):
+    """
+    チャンクの商品ごとの売上数量の合計を現在の在庫数量と1回のクエリで比較する
+    在庫数量を超える商品の行は、policy が reject の場合は取り込む行から除き、
+    flag の場合はそのまま取り込んでエラーレポートにのみ記録する
+    戻り値は (取り込む行, エラーレポートに記録する行, 除外した行数)
+    """
+    policy = policy or settings.SALES_IMPORT_STOCK_POLICY
+    totals = frame.groupby('product')['quantity'].sum()
+    stocks = pd.Series(lock_stocks(totals.index.tolist()), dtype='int64').reindex(totals.index)
+    exceeded = totals.index[(totals > stocks).to_numpy()]
+    if exceeded.empty:
+        return frame, report_rows(chunk, offset, [], []), 0
+
+    hit = frame['product'].isin(exceeded).to_numpy()
+    message = 'exceeds stock' if policy == REJECT else 'exceeds stock (imported)'
+    report = report_rows(chunk, offset, frame.index[hit], message)
+    if policy == REJECT:
+        return frame[~hit], report, int(hit.sum())
+    return frame, report, 0
+
+
+def report_rows(chunk, offset, rows, messages):
+    """
+    指定した行番号の元の値とエラー内容をエラーレポートの行にする
+    """
+    rows = np.asarray(rows, dtype='int64')
+    errors = chunk.iloc[rows - offset - 1][COLUMNS].copy()
+    for column in ['product', 'quantity']:
+        # 小数や空欄を含む列は float として読み込まれるため、範囲内の整数の値は元の表記に戻す
+        if errors[column].dtype.kind == 'f':
+            errors[column] = pd.Series(
+                [int(value) if value.is_integer() and abs(value) <= MAX_INTEGER else value
+                 for value in errors[column]],
+                index=errors.index, dtype=object)
+    errors.insert(0, 'row', rows)
+    errors['errors'] = messages
+    return errors
+
+
+def write_errors(sales_file, *reports):
+    """
+    エラーの行を行番号順に売上ファイルのエラーレポート(CSV)に追記する
+    """
+    reports = [report for report in reports if not report.empty]
+    if not reports:
+        return
+    errors = pd.concat(reports).sort_values('row', kind='stable')
+    path = error_report_path(sales_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    errors.to_csv(path, mode='a', header=not path.exists(), index=False)
+    sales_file.error_report = path.name
+
+
+def truncate_errors(sales_file, rows):
+    """
+    エラーレポートから行番号が rows より後の行を除く
+    ロールバックされたチャンクの行は追記済みのため、再開前にチェックポイントまで戻す
+    """
+    path = error_report_path(sales_file)
+    if not path.exists():
+        return
+    partial = path.with_name(f'{path.name}.part')
+    with open(path, encoding='utf-8', newline='') as source, \
+            open(partial, 'w', encoding='utf-8', newline='') as target:
+        reader = csv.reader(source)
+        writer = csv.writer(target, lineterminator=os.linesep)
+        writer.writerow(next(reader, []))
+        writer.writerows(row for row in reader if row and int(row[0]) <= rows)
+    os.replace(partial, path)
+
+
+class CheckpointLost(Exception):
+    """
+    他のワーカーが取込を引き継いだため、チェックポイントを更新できなかった
+    """
+
+
+def import_frame(frame, sales_file, batch_size):
+    """
+    変換済みのチャンクを売上として登録し、在庫数量・集計に反映する
+    """
+    load_sales(frame, sales_file.id, batch_size)
+    add_stocks(-frame.groupby('product')['quantity'].sum())
+    rollups.add_sales(frame)
+    scopes = [inventory_scope(id) for id in frame['product'].unique().tolist()]
+    transaction.on_commit(partial(invalidate, *scopes))
+
+
+def ingest_sales(path, sales_file, chunk_size=None, batch_size=None):
+    """
+    売上CSVをチャンク単位で取り込み、在庫数量に反映する
+    """
+    batch_size = batch_size or settings.SALES_IMPORT_BATCH_SIZE
+    result = IngestionResult()
+    started = time.perf_counter()
+
+    products = product_ids()
+
+    for chunk in read_chunks(path, chunk_size):
+        frame, errors = validate_chunk(chunk, products, result.rows)
+        frame, overruns, rejected = check_stock(chunk, frame, result.rows)
+        import_frame(frame, sales_file, batch_size)
+        write_errors(sales_file, errors, overruns)
+        result.rows += len(chunk)
+        result.errors += len(errors) + rejected
+        result.overruns += len(overruns)
+
+    sales_file.row_count = result.rows
+    sales_file.error_count = result.errors
+    sales_file.stock_overruns = result.overruns
+    sales_file.save(update_fields=['row_count', 'error_count', 'stock_overruns', 'error_report'])
+
+    result.elapsed = time.perf_counter() - started
+    logger.info('imported %s: %d rows (%d rejected) in %.2fs (%.0f rows/sec)',
+                path, result.rows, result.errors, result.elapsed, result.rows_per_sec)
+    return result
+
+
+def resume_sales(path, sales_file, chunk_size=None, batch_size=None, stop=None):
+    """
+    売上CSVをチャンクごとにコミットしながら取り込み、最後に処理済にする
+    チャンクの登録とチェックポイント(取込済みの行数)の更新を同じトランザクションで行い、
+    中断した場合はチェックポイントの次の行から再開する
+    チャンクのコミット後に停止要求(stop)を受けた場合は未処理に戻して終了する
+    チェックポイントが他のワーカーに更新されていた場合は CheckpointLost を送出する
+    """
+    batch_size = batch_size or settings.SALES_IMPORT_BATCH_SIZE
+    result = IngestionResult()
+    started = time.perf_counter()
+    offset = sales_file.checkpoint_rows
+    products = product_ids()
+    truncate_errors(sales_file, offset)
+
+    for chunk in read_chunks(path, chunk_size, skip_rows=offset):
+        frame, errors = validate_chunk(chunk, products, offset)
+        with transaction.atomic():
+            frame, overruns, rejected = check_stock(chunk, frame, offset)
+            import_frame(frame, sales_file, batch_size)
+            write_errors(sales_file, errors, overruns)
+            # チェックポイントが進んだため、失敗の試行回数を数え直す
+            advance(sales_file, offset, checkpoint_rows=offset + len(chunk), attempts=0,
+                    error_count=sales_file.error_count + len(errors) + rejected,
+                    stock_overruns=sales_file.stock_overruns + len(overruns),
+                    error_report=sales_file.error_report)
+        offset += len(chunk)
+        result.rows += len(chunk)
+        result.errors += len(errors) + rejected
+        result.overruns += len(overruns)
+        if stop is not None and stop.is_set():
+            # ハートビートが途絶えるのを待たずに他のワーカーが再開できるようにする
+            advance(sales_file, offset, status=Status.ASYNC_UNPROCESSED)
+            logger.info('stopped importing %s at row %d', path, offset)
+            return result
+
+    advance(sales_file, offset, status=Status.ASYNC_PROCESSED, row_count=offset)
+
+    result.elapsed = time.perf_counter() - started
+    logger.info('imported %s: %d rows (%d rejected) from row %d in %.2fs (%.0f rows/sec)',
+                path, result.rows, result.errors, offset - result.rows + 1, result.elapsed,
+                result.rows_per_sec)
+    return result
+
+
+def advance(sales_file, offset, **fields):
+    """
+    チェックポイントが offset のままの場合のみ売上ファイルを更新し、ハートビートを記録する
+    """
+    fields['heartbeat_at'] = timezone.now()
+    updated = SalesFile.objects.filter(pk=sales_file.pk, checkpoint_rows=offset).update(**fields)
+    if not updated:
+        raise CheckpointLost(f'sales file {sales_file.pk} was taken over at row {offset}')
+    for name, value in fields.items():
+        setattr(sales_file, name, value)
@@ -0,0 +1,39 @@
+from django.db.models import F, Value
+
+from .archive import sale_models
+from .models import Purchase
+
+# 在庫履歴の行の種別(同じ日時の行は仕入、売上の順に並べる)
+PURCHASE = '1'
+SALE = '2'
+
+
+def ledger_querysets(product_id, date_from=None, date_to=None, models=None):
+    """
+    商品の仕入・売上を (種別, クエリセット) の一覧で返す
+    各行は id・quantity・type・date・unit の辞書とし、期間で絞り込む
+    売上のモデルは models (省略時は sale_models(date_from))とし、
+    非同期のビューは asale_models() で取得して渡す
+    """
+    if models is None:
+        models = sale_models(date_from)
+    sources = [(PURCHASE, Purchase, 'purchase_date')] + [(SALE, model, 'sale_date') for model in models]
+
+    querysets = []
+    for type_, model, field in sources:
+        queryset = model.objects.filter(product_id=product_id)
+        if date_from is not None:
+            queryset = queryset.filter(**{f'{field}__gte': date_from})
+        if date_to is not None:
+            queryset = queryset.filter(**{f'{field}__lte': date_to})
+        querysets.append((type_, queryset.values(
+            'id', 'quantity', type=Value(type_), date=F(field), unit=F('product__price'))))
+    return querysets
+
+
+def ledger_union(querysets):
+    """
+    ledger_querysets() の一覧を (日時, 種別, ID) の順の1つのクエリセットにまとめる
+    """
+    (_, first), *rest = querysets
+    return first.union(*(queryset for _, queryset in rest)).order_by(F('date'), 'type', 'id')
@@ -0,0 +1,113 @@
+import csv
+import io
+from itertools import repeat
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Sale
+
+COPY = 'copy'
+EXECUTEMANY = 'executemany'
+BULK_CREATE = 'bulk_create'
+
+COLUMNS = ['product_id', 'quantity', 'sale_date', 'import_file_id']
+
+
+def sqlite_datetimes(dates):
+    """
+    UTCの日時の列を Django が SQLite に保存する文字列と同じ書式に変換する
+    (マイクロ秒が0の場合は省略する)
+    """
+    dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+    seconds = dates.dt.strftime('%Y-%m-%d %H:%M:%S')
+    microseconds = dates.dt.microsecond
+    return seconds.where(microseconds == 0, seconds + '.' + microseconds.astype(str).str.zfill(6))
+
+
+def load_with_copy(frame, import_file_id, batch_size):
+    """
+    PostgreSQL の COPY FROM STDIN で登録する
+    """
+    sql = f'COPY {Sale._meta.db_table} ({", ".join(COLUMNS)}) FROM STDIN'
+    rows = zip(frame['product'].tolist(), frame['quantity'].tolist(),
+               frame['date'].tolist(), repeat(import_file_id))
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            # psycopg2
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(
+                (product, quantity, date.isoformat(), '' if file_id is None else file_id)
+                for product, quantity, date, file_id in rows)
+            buffer.seek(0)
+            raw.copy_expert(f"{sql} WITH (FORMAT csv, NULL '')", buffer)
+
+
+def load_with_executemany(frame, import_file_id, batch_size):
+    """
+    SQLite に列の配列から作成したパラメータで executemany する
+    """
+    sql = (f'INSERT INTO {Sale._meta.db_table} ({", ".join(COLUMNS)}) '
+           f'VALUES ({", ".join(["%s"] * len(COLUMNS))})')
+    rows = list(zip(frame['product'].tolist(), frame['quantity'].tolist(),
+                    sqlite_datetimes(frame['date']).tolist(), repeat(import_file_id)))
+    with connection.cursor() as cursor:
+        # 大きすぎる executemany でメモリを使い過ぎないよう batch_size の数倍ごとに分ける
+        step = max(batch_size * 50, 1)
+        for offset in range(0, len(rows), step):
+            cursor.executemany(sql, rows[offset:offset + step])
+
+
+def load_with_bulk_create(frame, import_file_id, batch_size):
+    """
+    Sale のインスタンスを作成して bulk_create で登録する
+    """
+    Sale.objects.bulk_create([
+        Sale(product_id=product_id, quantity=quantity,
+             sale_date=sale_date, import_file_id=import_file_id)
+        for product_id, quantity, sale_date in zip(
+            frame['product'].tolist(), frame['quantity'].tolist(), frame['date'].tolist())
+    ], batch_size=batch_size)
+
+
+LOADERS = {
+    COPY: load_with_copy,
+    EXECUTEMANY: load_with_executemany,
+    BULK_CREATE: load_with_bulk_create,
+}
+
+
+def available_loaders():
+    """
+    接続中のデータベースで使用できる登録方式
+    """
+    if connection.vendor == 'postgresql':
+        return [COPY, BULK_CREATE]
+    if connection.vendor == 'sqlite':
+        return [EXECUTEMANY, BULK_CREATE]
+    return [BULK_CREATE]
+
+
+def get_loader(name=None):
+    """
+    登録方式を取得する(auto の場合はデータベースごとに最も速い方式)
+    """
+    name = name or settings.SALES_IMPORT_LOADER
+    if name == 'auto':
+        name = available_loaders()[0]
+    return LOADERS[name]
+
+
+def load_sales(frame, import_file_id, batch_size, loader=None):
+    """
+    変換済みのチャンク(product, quantity, date の列)を売上として一括登録する
+    シグナルは送信されないため、在庫数量・集計は呼び出し側で反映する
+    """
+    if len(frame):
+        get_loader(loader)(frame, import_file_id, batch_size)
@@ -0,0 +1,190 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+# 計測中のリクエストの RequestMetrics(サンプリングされなかったリクエストでは None)
+_current = ContextVar('inventory_request_metrics', default=None)
+
+# 集計に残すSQLの最大文字数
+SQL_MAX_LENGTH = 500
+
+
+@dataclass
+class RequestMetrics:
+    """
+    1リクエストで実行したクエリ・シリアライズの計測値(時間は秒)
+    """
+    queries: int = 0
+    sql_time: float = 0.0
+    slowest_time: float = 0.0
+    slowest_sql: str = ''
+    serialize_time: float = 0.0
+
+
+@dataclass
+class RouteCounters:
+    """
+    エンドポイントごとの計測値の累計(時間はミリ秒)
+    """
+    requests: int = 0
+    queries: int = 0
+    sql_ms: float = 0.0
+    serialize_ms: float = 0.0
+    total_ms: float = 0.0
+    slowest_ms: float = 0.0
+    slowest_sql: str = ''
+
+
+# URLパターンに一致しなかったリクエストの累計のキー
+UNMATCHED = '<unmatched>'
+
+_counters = {}
+_lock = threading.Lock()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    execute_wrapper: 計測中のリクエストであればクエリの件数・時間を記録する
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.sql_time += elapsed
+        if elapsed > metrics.slowest_time:
+            metrics.slowest_time = elapsed
+            metrics.slowest_sql = sql[:SQL_MAX_LENGTH]
+
+
+def install(connection, **kwargs):
+    """
+    connection_created: 作成された接続に record_query を登録する
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializing():
+    """
+    シリアライズにかかった時間を記録する(途中で実行したクエリの時間は含めない)
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    started, sql_time = time.perf_counter(), metrics.sql_time
+    try:
+        yield
+    finally:
+        metrics.serialize_time += (time.perf_counter() - started) - (metrics.sql_time - sql_time)
+
+
+def server_timing(metrics, total):
+    """
+    Server-Timing ヘッダの値を作成する
+    """
+    return ', '.join([
+        f'db;dur={metrics.sql_time * 1000:.2f};desc="{metrics.queries} queries"',
+        f'db-slowest;dur={metrics.slowest_time * 1000:.2f}',
+        f'serialize;dur={metrics.serialize_time * 1000:.2f}',
+        f'total;dur={total * 1000:.2f}',
+    ])
+
+
+def aggregate(route, metrics, total):
+    """
+    エンドポイントごとの累計に1リクエストの計測値を加算する
+    """
+    with _lock:
+        counters = _counters.setdefault(route, RouteCounters())
+        counters.requests += 1
+        counters.queries += metrics.queries
+        counters.sql_ms += metrics.sql_time * 1000
+        counters.serialize_ms += metrics.serialize_time * 1000
+        counters.total_ms += total * 1000
+        if metrics.slowest_time * 1000 > counters.slowest_ms:
+            counters.slowest_ms = metrics.slowest_time * 1000
+            counters.slowest_sql = metrics.slowest_sql
+
+
+def snapshot():
+    """
+    エンドポイントごとの累計(このプロセスで計測したリクエストのみ)
+    """
+    with _lock:
+        return {route: asdict(counters) for route, counters in sorted(_counters.items())}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+def _start():
+    if random.random() >= settings.INVENTORY_METRICS_SAMPLE_RATE:
+        return None, None
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def _finish(request, response, metrics, token, started):
+    _current.reset(token)
+    total = time.perf_counter() - started
+    response['Server-Timing'] = server_timing(metrics, total)
+    match = getattr(request, 'resolver_match', None)
+    # URLパターンに一致しないリクエストはパスごとに累計を増やさないよう1件にまとめる
+    route = f'{request.method} {match.route if match else UNMATCHED}'
+    aggregate(route, metrics, total)
+    return response
+
+
+@sync_and_async_middleware
+def query_metrics_middleware(get_response):
+    """
+    INVENTORY_METRICS_SAMPLE_RATE の割合のリクエストについて、クエリ数・SQLの時間・
+    最も遅いクエリ・シリアライズの時間を計測し、Server-Timing ヘッダと累計に出力する
+    サンプリングされなかったリクエストは計測しない
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            metrics, token = _start()
+            if metrics is None:
+                return await get_response(request)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                _current.reset(token)
+                raise
+            return _finish(request, response, metrics, token, started)
+
+        return middleware
+
+    def middleware(request):
+        started = time.perf_counter()
+        metrics, token = _start()
+        if metrics is None:
+            return get_response(request)
+        try:
+            response = get_response(request)
+        except BaseException:
+            _current.reset(token)
+            raise
+        return _finish(request, response, metrics, token, started)
+
+    return middleware
@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-18 15:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_stocks(apps, schema_editor):
+    Product = apps.get_model("inventory", "Product")
+    Purchase = apps.get_model("inventory", "Purchase")
+    Sale = apps.get_model("inventory", "Sale")
+    Stock = apps.get_model("inventory", "Stock")
+
+    quantities = dict.fromkeys(Product.objects.values_list("id", flat=True), 0)
+    for product_id, total in (
+        Purchase.objects.values("product")
+        .annotate(total=Sum("quantity"))
+        .values_list("product", "total")
+    ):
+        quantities[product_id] += total
+    for product_id, total in (
+        Sale.objects.values("product")
+        .annotate(total=Sum("quantity"))
+        .values_list("product", "total")
+    ):
+        quantities[product_id] -= total
+
+    Stock.objects.bulk_create(
+        [
+            Stock(product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0002_salesfile_sale_import_file"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Stock",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="inventory.product",
+                    ),
+                ),
+                ("quantity", models.IntegerField(default=0, verbose_name="在庫数量")),
+            ],
+            options={
+                "verbose_name": "在庫",
+                "verbose_name_plural": "在庫一覧",
+                "db_table": "stocks",
+            },
+        ),
+        migrations.RunPython(populate_stocks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2 on 2026-10-18 15:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+
+
+def populate_rollups(apps, schema_editor):
+    Sale = apps.get_model("inventory", "Sale")
+    DailySales = apps.get_model("inventory", "DailySales")
+    MonthlySales = apps.get_model("inventory", "MonthlySales")
+
+    DailySales.objects.bulk_create(
+        [
+            DailySales(
+                product_id=row["product"],
+                date=row["date"],
+                quantity=row["quantity"],
+                count=row["count"],
+            )
+            for row in Sale.objects.annotate(date=TruncDate("sale_date"))
+            .values("product", "date")
+            .annotate(quantity=Sum("quantity"), count=Count("id"))
+        ]
+    )
+    MonthlySales.objects.bulk_create(
+        [
+            MonthlySales(
+                month=row["month"], quantity=row["quantity"], count=row["count"]
+            )
+            for row in Sale.objects.annotate(month=TruncMonth("sale_date"))
+            .values("month")
+            .annotate(quantity=Sum("quantity"), count=Count("id"))
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0003_stock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateTimeField(unique=True, verbose_name="売上月")),
+                ("quantity", models.IntegerField(default=0, verbose_name="数量")),
+                ("count", models.IntegerField(default=0, verbose_name="件数")),
+            ],
+            options={
+                "verbose_name": "月次売上集計",
+                "verbose_name_plural": "月次売上集計一覧",
+                "db_table": "monthly_sales",
+            },
+        ),
+        migrations.CreateModel(
+            name="DailySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="売上日")),
+                ("quantity", models.IntegerField(default=0, verbose_name="数量")),
+                ("count", models.IntegerField(default=0, verbose_name="件数")),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "日次売上集計",
+                "verbose_name_plural": "日次売上集計一覧",
+                "db_table": "daily_sales",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "date"),
+                        name="daily_sales_product_date_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
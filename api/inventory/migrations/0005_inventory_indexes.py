@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0004_sales_rollups"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="purchase",
+            index=models.Index(
+                fields=["product", "purchase_date"], name="purchases_product_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                fields=["product", "sale_date"], name="sales_product_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(fields=["sale_date"], name="sales_sale_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="salesfile",
+            index=models.Index(
+                condition=models.Q(("status", 1)),
+                fields=["id"],
+                name="sales_files_unprocessed_idx",
+            ),
+        ),
+    ]
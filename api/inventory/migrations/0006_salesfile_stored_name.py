@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0005_inventory_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesfile",
+            name="stored_name",
+            field=models.CharField(
+                blank=True, default="", max_length=100, verbose_name="保存ファイル名"
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0006_salesfile_stored_name"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesfile",
+            name="digest",
+            field=models.CharField(
+                blank=True,
+                max_length=64,
+                null=True,
+                unique=True,
+                verbose_name="SHA-256",
+            ),
+        ),
+        migrations.AddField(
+            model_name="salesfile",
+            name="idempotency_key",
+            field=models.CharField(
+                blank=True,
+                max_length=255,
+                null=True,
+                unique=True,
+                verbose_name="冪等キー",
+            ),
+        ),
+        migrations.AddField(
+            model_name="salesfile",
+            name="row_count",
+            field=models.IntegerField(blank=True, null=True, verbose_name="行数"),
+        ),
+    ]
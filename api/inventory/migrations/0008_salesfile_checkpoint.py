@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0007_salesfile_digest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesfile",
+            name="checkpoint_rows",
+            field=models.IntegerField(default=0, verbose_name="取込済み行数"),
+        ),
+        migrations.AddField(
+            model_name="salesfile",
+            name="heartbeat_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="ハートビート日時"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="salesfile",
+            name="status",
+            field=models.IntegerField(
+                choices=[
+                    (0, "同期"),
+                    (1, "非同期_未処理"),
+                    (2, "非同期_処理済"),
+                    (3, "非同期_処理中"),
+                ],
+                verbose_name="状態",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="salesfile",
+            index=models.Index(
+                condition=models.Q(("status", 3)),
+                fields=["heartbeat_at"],
+                name="sales_files_in_progress_idx",
+            ),
+        ),
+    ]
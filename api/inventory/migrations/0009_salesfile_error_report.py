@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 16:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0008_salesfile_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesfile",
+            name="error_count",
+            field=models.IntegerField(default=0, verbose_name="エラー行数"),
+        ),
+        migrations.AddField(
+            model_name="salesfile",
+            name="error_report",
+            field=models.CharField(
+                blank=True, default="", max_length=100, verbose_name="エラーレポート"
+            ),
+        ),
+    ]
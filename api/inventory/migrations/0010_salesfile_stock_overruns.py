@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0009_salesfile_error_report"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesfile",
+            name="stock_overruns",
+            field=models.IntegerField(default=0, verbose_name="在庫超過行数"),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 17:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0010_salesfile_stock_overruns"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("taken_at", models.DateTimeField(verbose_name="基準日時")),
+                ("quantity", models.IntegerField(verbose_name="在庫数量")),
+                (
+                    "purchase_watermark",
+                    models.BigIntegerField(default=0, verbose_name="仕入ID"),
+                ),
+                (
+                    "sale_watermark",
+                    models.BigIntegerField(default=0, verbose_name="売上ID"),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "在庫スナップショット",
+                "verbose_name_plural": "在庫スナップショット一覧",
+                "db_table": "stock_snapshots",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "taken_at"),
+                        name="stock_snapshots_product_taken_at_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 17:11
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def create_missing_stocks(apps, schema_editor):
+    """
+    仕入・売上のない商品にも在庫行を作成し、在庫僅少の一覧に含まれるようにする
+    """
+    Product = apps.get_model("inventory", "Product")
+    Stock = apps.get_model("inventory", "Stock")
+    Stock.objects.bulk_create(
+        [Stock(product_id=id) for id in Product.objects.filter(stock=None).values_list("id", flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0011_stock_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="reorder_point",
+            field=models.IntegerField(
+                default=0,
+                validators=[django.core.validators.MinValueValidator(0)],
+                verbose_name="発注点",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stock",
+            name="reorder_point",
+            field=models.IntegerField(default=0, verbose_name="発注点"),
+        ),
+        migrations.AddIndex(
+            model_name="stock",
+            index=models.Index(
+                condition=models.Q(("quantity__lte", models.F("reorder_point"))),
+                fields=["product"],
+                name="stocks_low_idx",
+            ),
+        ),
+        migrations.RunPython(create_missing_stocks, migrations.RunPython.noop),
+    ]
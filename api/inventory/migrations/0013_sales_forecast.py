@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 17:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0012_reorder_point"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesForecast",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="inventory.product",
+                    ),
+                ),
+                ("as_of", models.DateField(verbose_name="基準日")),
+                ("window", models.IntegerField(verbose_name="移動平均の日数")),
+                ("alpha", models.FloatField(verbose_name="平滑化係数")),
+                ("moving_average", models.FloatField(verbose_name="移動平均")),
+                ("smoothed", models.FloatField(verbose_name="指数平滑")),
+                ("horizon", models.IntegerField(verbose_name="予測日数")),
+                ("quantity", models.FloatField(verbose_name="予測数量")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="作成日時"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "売上予測",
+                "verbose_name_plural": "売上予測一覧",
+                "db_table": "sales_forecasts",
+            },
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2 on 2026-10-18 17:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0013_sales_forecast"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("cutoff", models.DateTimeField(verbose_name="基準日時")),
+                ("rows", models.IntegerField(default=0, verbose_name="件数")),
+                (
+                    "archived_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="アーカイブ日時"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "売上のアーカイブ",
+                "verbose_name_plural": "売上のアーカイブ一覧",
+                "db_table": "sales_archives",
+            },
+        ),
+        migrations.CreateModel(
+            name="SalesCarryForward",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="inventory.product",
+                    ),
+                ),
+                ("quantity", models.IntegerField(default=0, verbose_name="数量")),
+                ("count", models.IntegerField(default=0, verbose_name="件数")),
+            ],
+            options={
+                "verbose_name": "売上の繰越",
+                "verbose_name_plural": "売上の繰越一覧",
+                "db_table": "sales_carry_forwards",
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedSale",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("quantity", models.IntegerField(verbose_name="数量")),
+                ("sale_date", models.DateTimeField(verbose_name="売上日時")),
+                (
+                    "import_file",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="inventory.salesfile",
+                        verbose_name="売上ファイルID",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "アーカイブ済み売上",
+                "verbose_name_plural": "アーカイブ済み売上一覧",
+                "db_table": "archived_sales",
+                "indexes": [
+                    models.Index(
+                        fields=["product", "sale_date", "id"],
+                        name="archived_product_date_idx",
+                    ),
+                    models.Index(
+                        fields=["sale_date", "id"], name="archived_sale_date_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
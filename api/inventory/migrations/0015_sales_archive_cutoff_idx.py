@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0014_sales_archive"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="salesarchive",
+            index=models.Index(fields=["cutoff"], name="sales_archives_cutoff_idx"),
+        ),
+    ]
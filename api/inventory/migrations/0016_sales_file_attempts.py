@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0015_sales_archive_cutoff_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesfile",
+            name="attempts",
+            field=models.IntegerField(default=0, verbose_name="試行回数"),
+        ),
+        migrations.AddField(
+            model_name="salesfile",
+            name="last_error",
+            field=models.TextField(blank=True, default="", verbose_name="エラー内容"),
+        ),
+        migrations.AlterField(
+            model_name="salesfile",
+            name="status",
+            field=models.IntegerField(
+                choices=[
+                    (0, "同期"),
+                    (1, "非同期_未処理"),
+                    (2, "非同期_処理済"),
+                    (3, "非同期_処理中"),
+                    (4, "非同期_失敗"),
+                ],
+                verbose_name="状態",
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0016_sales_file_attempts"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="archivedsale",
+            name="archived_product_date_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="archivedsale",
+            name="archived_sale_date_idx",
+        ),
+        migrations.AddConstraint(
+            model_name="archivedsale",
+            constraint=models.UniqueConstraint(
+                fields=("product", "sale_date", "id"),
+                name="archived_product_date_unique",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="archivedsale",
+            constraint=models.UniqueConstraint(
+                fields=("sale_date", "id"), name="archived_sale_date_unique"
+            ),
+        ),
+    ]
@@ -10,6 +10,8 @@ class Status(models.IntegerChoices):
     SYNC = 0, '同期'
     ASYNC_UNPROCESSED = 1, '非同期_未処理'
     ASYNC_PROCESSED = 2, '非同期_処理済'
+    ASYNC_IN_PROGRESS = 3, '非同期_処理中'
+    ASYNC_FAILED = 4, '非同期_失敗'
 
 
 class Product(models.Model):
@@ -20,6 +22,9 @@ class Product(models.Model):
     price = models.IntegerField(
         verbose_name='価格', validators=[MinValueValidator(0)])
     description = models.TextField(verbose_name='商品説明', null=True, blank=True)
+    # 在庫数量がこの数量以下になった商品を在庫僅少とする
+    reorder_point = models.IntegerField(
+        verbose_name='発注点', default=0, validators=[MinValueValidator(0)])
 
     class Meta:
         db_table = 'products'
@@ -27,6 +32,50 @@ class Product(models.Model):
         verbose_name_plural = '商品一覧'
 
 
+class Stock(models.Model):
+    """
+    在庫
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True)
+    quantity = models.IntegerField(verbose_name='在庫数量', default=0)
+    # 在庫僅少の商品をインデックスだけで探せるよう Product.reorder_point を複製する
+    reorder_point = models.IntegerField(verbose_name='発注点', default=0)
+
+    class Meta:
+        db_table = 'stocks'
+        verbose_name = '在庫'
+        verbose_name_plural = '在庫一覧'
+        indexes = [
+            # 在庫僅少の商品のみを対象とした部分インデックス(在庫数量の更新時にDBが出し入れする)
+            models.Index(fields=['product'], condition=models.Q(quantity__lte=models.F('reorder_point')),
+                         name='stocks_low_idx'),
+        ]
+
+
+class StockSnapshot(models.Model):
+    """
+    在庫スナップショット
+    taken_at 以前の仕入・売上を合計した在庫数量
+    作成時点の仕入・売上の最大IDを保持し、作成後に登録された taken_at 以前の仕入・売上を
+    後から加算できるようにする
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    taken_at = models.DateTimeField(verbose_name='基準日時')
+    quantity = models.IntegerField(verbose_name='在庫数量')
+    purchase_watermark = models.BigIntegerField(verbose_name='仕入ID', default=0)
+    sale_watermark = models.BigIntegerField(verbose_name='売上ID', default=0)
+
+    class Meta:
+        db_table = 'stock_snapshots'
+        verbose_name = '在庫スナップショット'
+        verbose_name_plural = '在庫スナップショット一覧'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'taken_at'], name='stock_snapshots_product_taken_at_unique'),
+        ]
+
+
 class Purchase(models.Model):
     """
     仕入
@@ -40,6 +89,10 @@ class Purchase(models.Model):
         db_table = 'purchases'
         verbose_name = '仕入'
         verbose_name_plural = '仕入一覧'
+        indexes = [
+            models.Index(fields=['product', 'purchase_date'],
+                         name='purchases_product_date_idx'),
+        ]
 
 
 class SalesFile(models.Model):
@@ -47,12 +100,39 @@ class SalesFile(models.Model):
     売上ファイル
     """
     file_name = models.CharField(max_length=100, verbose_name='ファイル名')
+    stored_name = models.CharField(max_length=100, verbose_name='保存ファイル名', blank=True, default='')
     status = models.IntegerField(verbose_name='状態', choices=Status.choices)
+    # 同じ内容・同じ冪等キーのアップロードを重複して取り込まないよう一意にする
+    digest = models.CharField(
+        max_length=64, verbose_name='SHA-256', null=True, blank=True, unique=True)
+    idempotency_key = models.CharField(
+        max_length=255, verbose_name='冪等キー', null=True, blank=True, unique=True)
+    row_count = models.IntegerField(verbose_name='行数', null=True, blank=True)
+    # 検証で除外した行数と、除外した行を書き出したエラーレポートのファイル名
+    error_count = models.IntegerField(verbose_name='エラー行数', default=0)
+    error_report = models.CharField(
+        max_length=100, verbose_name='エラーレポート', blank=True, default='')
+    # 在庫数量を超えた商品の行数(SALES_IMPORT_STOCK_POLICY が reject の場合はエラー行数にも含む)
+    stock_overruns = models.IntegerField(verbose_name='在庫超過行数', default=0)
+    # 非同期の取込で取込済みの行数(ヘッダーを除く)と、処理中のワーカーが最後に記録した日時
+    checkpoint_rows = models.IntegerField(verbose_name='取込済み行数', default=0)
+    heartbeat_at = models.DateTimeField(verbose_name='ハートビート日時', null=True, blank=True)
+    # チェックポイントが進まないまま確保した回数と、最後に取込に失敗した際のエラー
+    attempts = models.IntegerField(verbose_name='試行回数', default=0)
+    last_error = models.TextField(verbose_name='エラー内容', blank=True, default='')
 
     class Meta:
         db_table = 'sales_files'
         verbose_name = '売上ファイル'
         verbose_name_plural = '売上ファイル一覧'
+        indexes = [
+            # 未処理の売上ファイルのみを対象とした部分インデックス
+            models.Index(fields=['id'], condition=models.Q(status=Status.ASYNC_UNPROCESSED),
+                         name='sales_files_unprocessed_idx'),
+            # 処理中のまま中断した売上ファイルを探すための部分インデックス
+            models.Index(fields=['heartbeat_at'], condition=models.Q(status=Status.ASYNC_IN_PROGRESS),
+                         name='sales_files_in_progress_idx'),
+        ]
 
 
 class Sale(models.Model):
@@ -75,3 +155,132 @@ class Sale(models.Model):
         db_table = 'sales'
         verbose_name = '売上'
         verbose_name_plural = '売上一覧'
+        indexes = [
+            models.Index(fields=['product', 'sale_date'],
+                         name='sales_product_date_idx'),
+            models.Index(fields=['sale_date'], name='sales_sale_date_idx'),
+        ]
+
+
+class ArchivedSale(models.Model):
+    """
+    アーカイブ済み売上
+    archive_sales コマンドが基準日時より前の売上を同じIDのまま移動する
+    """
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField(verbose_name='数量')
+    sale_date = models.DateTimeField(verbose_name='売上日時')
+    # 売上ファイルを削除してもアーカイブ済みの履歴は残す
+    import_file = models.ForeignKey(
+        SalesFile,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name='売上ファイルID',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        db_table = 'archived_sales'
+        verbose_name = 'アーカイブ済み売上'
+        verbose_name_plural = 'アーカイブ済み売上一覧'
+        # id は SQLite の rowid ではないため、(日時, ID) の順に読めるようインデックスに含める
+        # 一意であることを示し、売上との UNION でもインデックスの順のまま併合させる
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'sale_date', 'id'],
+                                    name='archived_product_date_unique'),
+            models.UniqueConstraint(fields=['sale_date', 'id'], name='archived_sale_date_unique'),
+        ]
+
+
+class SalesArchive(models.Model):
+    """
+    売上のアーカイブ
+    cutoff より前の売上はアーカイブ済み売上にも存在しうるため、期間の開始が cutoff より前の場合のみ
+    アーカイブ済み売上を読む
+    """
+    cutoff = models.DateTimeField(verbose_name='基準日時')
+    rows = models.IntegerField(verbose_name='件数', default=0)
+    archived_at = models.DateTimeField(verbose_name='アーカイブ日時', default=now)
+
+    class Meta:
+        db_table = 'sales_archives'
+        verbose_name = '売上のアーカイブ'
+        verbose_name_plural = '売上のアーカイブ一覧'
+        indexes = [
+            # 読み取りのたびに最新の基準日時をインデックスの末尾から取得する
+            models.Index(fields=['cutoff'], name='sales_archives_cutoff_idx'),
+        ]
+
+
+class SalesCarryForward(models.Model):
+    """
+    アーカイブ済み売上の商品ごとの繰越
+    在庫数量の再構築ではアーカイブ済み売上を読まずにこの合計を使用する
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True)
+    quantity = models.IntegerField(verbose_name='数量', default=0)
+    count = models.IntegerField(verbose_name='件数', default=0)
+
+    class Meta:
+        db_table = 'sales_carry_forwards'
+        verbose_name = '売上の繰越'
+        verbose_name_plural = '売上の繰越一覧'
+
+
+class DailySales(models.Model):
+    """
+    日次売上集計
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    date = models.DateField(verbose_name='売上日')
+    quantity = models.IntegerField(verbose_name='数量', default=0)
+    count = models.IntegerField(verbose_name='件数', default=0)
+
+    class Meta:
+        db_table = 'daily_sales'
+        verbose_name = '日次売上集計'
+        verbose_name_plural = '日次売上集計一覧'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'date'], name='daily_sales_product_date_unique'),
+        ]
+
+
+class MonthlySales(models.Model):
+    """
+    月次売上集計
+    """
+    month = models.DateTimeField(verbose_name='売上月', unique=True)
+    quantity = models.IntegerField(verbose_name='数量', default=0)
+    count = models.IntegerField(verbose_name='件数', default=0)
+
+    class Meta:
+        db_table = 'monthly_sales'
+        verbose_name = '月次売上集計'
+        verbose_name_plural = '月次売上集計一覧'
+
+
+class SalesForecast(models.Model):
+    """
+    売上予測
+    基準日までの日次売上集計から forecast_sales コマンドが商品ごとに計算する
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True)
+    as_of = models.DateField(verbose_name='基準日')
+    window = models.IntegerField(verbose_name='移動平均の日数')
+    alpha = models.FloatField(verbose_name='平滑化係数')
+    # いずれも1日あたりの売上数量
+    moving_average = models.FloatField(verbose_name='移動平均')
+    smoothed = models.FloatField(verbose_name='指数平滑')
+    horizon = models.IntegerField(verbose_name='予測日数')
+    quantity = models.FloatField(verbose_name='予測数量')
+    created_at = models.DateTimeField(verbose_name='作成日時', default=now)
+
+    class Meta:
+        db_table = 'sales_forecasts'
+        verbose_name = '売上予測'
+        verbose_name_plural = '売上予測一覧'
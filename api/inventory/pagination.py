@@ -0,0 +1,104 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    IDの昇順によるカーソルページネーション
+    page_size が指定された場合のみページ分割する
+    """
+    ordering = 'id'
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class MonthlyCursorPagination(IdCursorPagination):
+    """
+    売上月の昇順によるカーソルページネーション
+    """
+    ordering = 'monthly_date'
+
+
+class ProductCursorPagination(IdCursorPagination):
+    """
+    商品IDの昇順によるカーソルページネーション(在庫僅少・売上予測の一覧)
+    """
+    ordering = 'product'
+
+
+class InventoryCursorPagination(IdCursorPagination):
+    """
+    仕入・売上を (日時, 種別, ID) の順に並べたカーソルページネーション
+    種別ごとのクエリをカーソル位置から page_size 件だけ取得して併合する
+    """
+    ordering = ('date', 'type', 'id')
+
+    def paginate_querysets(self, querysets, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+        self.position = self.parse_position(self.cursor.position) if self.cursor else None
+
+        rows = []
+        for type_, queryset in querysets:
+            if self.position is not None:
+                queryset = queryset.filter(self.after(type_, reverse))
+            ordering = ('-date', '-id') if reverse else ('date', 'id')
+            rows.extend(queryset.order_by(*ordering)[:self.page_size + 1])
+        rows.sort(key=self.sort_key, reverse=reverse)
+
+        self.page = rows[:self.page_size]
+        has_more = len(rows) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        return self.page
+
+    def sort_key(self, row):
+        return (row['date'], row['type'], row['id'])
+
+    def parse_position(self, position):
+        try:
+            date, type_, id_ = position.split('|')
+            date = parse_datetime(date)
+            if date is None:
+                raise ValueError
+            return (date, type_, int(id_))
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, type_, reverse):
+        """
+        カーソル位置より後(reverse の場合は前)の行を絞り込む条件
+        """
+        date, cursor_type, cursor_id = self.position
+        op = 'lt' if reverse else 'gt'
+        condition = Q(**{f'date__{op}': date})
+        if type_ == cursor_type:
+            condition |= Q(date=date, **{f'id__{op}': cursor_id})
+        elif (type_ > cursor_type) != reverse:
+            condition |= Q(date=date)
+        return condition
+
+    def encode_position(self, row, reverse):
+        position = f"{row['date'].isoformat()}|{row['type']}|{row['id']}"
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_position(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_position(self.page[0], reverse=True)
@@ -0,0 +1,63 @@
+import numbers
+from decimal import Decimal
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import serializing
+
+
+def _has_float(data):
+    """
+    浮動小数点数(Decimal を含む)を含むか
+    orjson は 1e16 や 1e-7 を json モジュールと異なる表記で出力し、NaN を null にするため
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, Decimal) or (
+                isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral)):
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    orjson でJSONに変換する
+    JSONRenderer と同じバイト列を出力できない場合(インデント指定・ASCIIエスケープ・
+    浮動小数点数を含む値・orjson で変換できない値)は JSONRenderer に任せる
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serializing():
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if data is None:
+            return b''
+        if self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if _has_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self._default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+    def _default(self, obj):
+        """
+        encoder_class で変換し、変換後の値が浮動小数点数を含む場合は JSONRenderer に任せる
+        """
+        value = self.encoder_class().default(obj)
+        if _has_float(value):
+            raise TypeError('float values are rendered by JSONRenderer')
+        return value
@@ -0,0 +1,190 @@
+from collections import Counter
+from datetime import datetime
+from functools import reduce
+from operator import or_
+
+import pandas as pd
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ArchivedSale, DailySales, MonthlySales, Sale
+
+# 1回のクエリでまとめて更新する集計行数
+BATCH_SIZE = 100
+
+
+def _add(model, lookup, quantity, count):
+    """
+    集計行に数量・件数を加算する(加算時に行がなければ作成する)
+    """
+    updated = model.objects.filter(**lookup).update(
+        quantity=F('quantity') + quantity, count=F('count') + count)
+    if updated or count < 0:
+        return
+
+    model.objects.get_or_create(**lookup)
+    model.objects.filter(**lookup).update(
+        quantity=F('quantity') + quantity, count=F('count') + count)
+
+
+def _add_many(model, fields, totals):
+    """
+    集計行に数量・件数をまとめて加算する(行がなければ作成する)
+    totals は fields の値のタプルをキー、(数量, 件数) を値とする
+    """
+    items = list(totals.items())
+    for offset in range(0, len(items), BATCH_SIZE):
+        batch = [(dict(zip(fields, key)), quantity, count)
+                 for key, (quantity, count) in items[offset:offset + BATCH_SIZE]]
+        model.objects.bulk_create(
+            [model(**lookup) for lookup, _, _ in batch], ignore_conflicts=True)
+        model.objects.filter(reduce(or_, (Q(**lookup) for lookup, _, _ in batch))).update(
+            quantity=F('quantity') + Case(
+                *[When(Q(**lookup), then=Value(quantity)) for lookup, quantity, _ in batch],
+                default=Value(0)),
+            count=F('count') + Case(
+                *[When(Q(**lookup), then=Value(count)) for lookup, _, count in batch],
+                default=Value(0)))
+
+
+def month_start(value):
+    """
+    日時が属する月の初日0時を返す
+    """
+    local = timezone.localtime(value)
+    return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_sale(product_id, sale_date, quantity, count=1):
+    """
+    売上1件を日次・月次集計に反映する(取消時は負数を指定する)
+    """
+    if isinstance(sale_date, str):
+        sale_date = parse_datetime(sale_date)
+    if timezone.is_naive(sale_date):
+        sale_date = timezone.make_aware(sale_date)
+    _add(DailySales, {'product_id': product_id, 'date': timezone.localdate(sale_date)},
+         quantity, count)
+    _add(MonthlySales, {'month': month_start(sale_date)}, quantity, count)
+
+
+def add_sale_rows(rows):
+    """
+    売上 (商品ID, 売上日時, 数量) の一覧を日次・月次集計にまとめて反映する
+    """
+    daily = {}
+    monthly = {}
+    for product_id, sale_date, quantity in rows:
+        for totals, key in ((daily, (product_id, timezone.localdate(sale_date))),
+                            (monthly, (month_start(sale_date),))):
+            total, count = totals.get(key, (0, 0))
+            totals[key] = (total + quantity, count + 1)
+
+    _add_many(DailySales, ('product_id', 'date'), daily)
+    _add_many(MonthlySales, ('month',), monthly)
+
+
+def add_sales(frame):
+    """
+    取込済みの売上(product, date, quantity列)を日次・月次集計にまとめて反映する
+    """
+    if frame.empty:
+        return
+
+    local = frame['date'].dt.tz_convert(timezone.get_current_timezone())
+    days = local.dt.normalize()
+    months = days - pd.to_timedelta(local.dt.day - 1, unit='D')
+
+    daily = frame.groupby([frame['product'], days.dt.date])['quantity'].agg(['sum', 'count'])
+    _add_many(DailySales, ('product_id', 'date'), {
+        (int(product_id), date): (int(row['sum']), int(row['count']))
+        for (product_id, date), row in daily.iterrows()
+    })
+
+    monthly = frame.groupby(months)['quantity'].agg(['sum', 'count'])
+    _add_many(MonthlySales, ('month',), {
+        (month.to_pydatetime(),): (int(row['sum']), int(row['count']))
+        for month, row in monthly.iterrows()
+    })
+
+
+def remove_product_sales(product_id):
+    """
+    削除する商品の売上(アーカイブ済み売上を含む)を日次集計から月ごとにまとめて月次集計から減算する
+    日次集計は商品とともに削除される
+    """
+    monthly = {}
+    for row in DailySales.objects.filter(product_id=product_id).values('date', 'quantity', 'count'):
+        key = (timezone.make_aware(datetime(row['date'].year, row['date'].month, 1)),)
+        quantity, count = monthly.get(key, (0, 0))
+        monthly[key] = (quantity - row['quantity'], count - row['count'])
+    _add_many(MonthlySales, ('month',), monthly)
+
+
+def _accumulate(totals, key, row):
+    """
+    集計行の数量・件数を totals に加算する
+    """
+    quantity, count = totals.get(key, (0, 0))
+    totals[key] = (quantity + row['quantity'], count + row['count'])
+
+
+def calculate_rollups():
+    """
+    売上の履歴(アーカイブ済み売上を含む)から日次・月次集計を算出する
+    """
+    daily = {}
+    monthly = {}
+    for model in (Sale, ArchivedSale):
+        for row in model.objects.annotate(date=TruncDate('sale_date')).values(
+                'product', 'date').annotate(quantity=Sum('quantity'), count=Count('id')):
+            _accumulate(daily, (row['product'], row['date']), row)
+        for row in model.objects.annotate(month=TruncMonth('sale_date')).values(
+                'month').annotate(quantity=Sum('quantity'), count=Count('id')):
+            _accumulate(monthly, row['month'], row)
+    return daily, monthly
+
+
+def _rebuild(model, expected, recorded, build, dry_run):
+    """
+    集計行を期待値に合わせて一括で作成・更新・削除し、差異のあった件数を返す
+    """
+    created = []
+    updated = []
+    for key, (quantity, count) in expected.items():
+        row = recorded.pop(key, None)
+        if row is None:
+            created.append(build(key, quantity, count))
+        elif (row.quantity, row.count) != (quantity, count):
+            row.quantity, row.count = quantity, count
+            updated.append(row)
+
+    if not dry_run:
+        model.objects.bulk_create(created, batch_size=1000)
+        model.objects.bulk_update(updated, ['quantity', 'count'], batch_size=1000)
+        stale = [row.pk for row in recorded.values()]
+        for offset in range(0, len(stale), 1000):
+            model.objects.filter(pk__in=stale[offset:offset + 1000]).delete()
+    return len(created) + len(updated) + len(recorded)
+
+
+def rebuild_rollups(dry_run=False):
+    """
+    日次・月次集計を履歴から再構築し、差異のあった件数を返す
+    """
+    daily, monthly = calculate_rollups()
+    drifts = Counter()
+    drifts['daily'] = _rebuild(
+        DailySales, daily,
+        {(row.product_id, row.date): row for row in DailySales.objects.all()},
+        lambda key, quantity, count: DailySales(
+            product_id=key[0], date=key[1], quantity=quantity, count=count),
+        dry_run)
+    drifts['monthly'] = _rebuild(
+        MonthlySales, monthly,
+        {row.month: row for row in MonthlySales.objects.all()},
+        lambda key, quantity, count: MonthlySales(month=key, quantity=quantity, count=count),
+        dry_run)
+    return drifts
@@ -1,6 +1,10 @@
-from rest_framework import serializers
+from django.db import models
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 
-from .models import Product, Purchase, Sale
+from .metrics import serializing
+from .models import Product, Purchase, Sale, SalesFile
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -9,16 +13,124 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ProductRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    一括登録時は ProductListSerializer が読み込んだ商品から検索する
+    """
+
+    def to_internal_value(self, data):
+        products = self.context.get('products')
+        if products is not None and not isinstance(data, bool):
+            try:
+                return products[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class ProductListSerializer(serializers.ListSerializer):
+    """
+    一括登録時に商品の存在確認を1回のクエリにまとめる
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            ids = set()
+            for item in data:
+                try:
+                    ids.add(int(item['product']))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            self.context['products'] = Product.objects.in_bulk(ids)
+        return super().to_internal_value(data)
+
+
 class PurchaseSerializer(serializers.ModelSerializer):
+    product = ProductRelatedField(queryset=Product.objects.all())
+
     class Meta:
         model = Purchase
         fields = '__all__'
+        list_serializer_class = ProductListSerializer
 
 
 class SaleSerializer(serializers.ModelSerializer):
+    product = ProductRelatedField(queryset=Product.objects.all())
+
     class Meta:
         model = Sale
         fields = '__all__'
+        list_serializer_class = ProductListSerializer
+
+
+def _datetime_converter(field):
+    """
+    DateTimeField.to_representation と同じ文字列を返す変換関数を作成する
+    タイムゾーン付きの datetime 以外は DateTimeField に任せる
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or field_timezone is None:
+        return field.to_representation
+    iso_8601 = output_format.lower() == ISO_8601
+
+    def convert(value):
+        if isinstance(value, str) or not value or not timezone.is_aware(value):
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone)
+        if not iso_8601:
+            return value.strftime(output_format)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _converter(field):
+    """
+    フィールドの値をJSONの値に変換する関数を返す
+    """
+    if type(field) is serializers.IntegerField:
+        return int
+    if type(field) is serializers.DateTimeField:
+        return _datetime_converter(field)
+    return field.to_representation
+
+
+class FastListSerializer(serializers.ListSerializer):
+    """
+    .values() の辞書を変換する読み取り専用の一覧シリアライザ
+    フィールドごとの変換関数を一覧の変換前に1回だけ作成し、
+    ListSerializer と同じ出力をフィールドの呼び出しなしで作成する
+    """
+
+    def to_representation(self, data):
+        with serializing():
+            return list(self.iter_representation(data))
+
+    def iter_representation(self, data):
+        """
+        行を1件ずつ変換して返す(エクスポートではクエリセットの iterator() を渡す)
+        """
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        fields = list(self.child._readable_fields)
+        if any(len(field.source_attrs) != 1 for field in fields):
+            for item in iterable:
+                yield self.child.to_representation(item)
+            return
+        converters = [(field.field_name, field.source_attrs[0], _converter(field))
+                      for field in fields]
+
+        for item in iterable:
+            if not isinstance(item, dict):
+                yield self.child.to_representation(item)
+                continue
+            row = {}
+            for name, key, convert in converters:
+                value = item[key]
+                row[name] = None if value is None else convert(value)
+            yield row
 
 
 class InventorySerializer(serializers.Serializer):
@@ -28,11 +140,77 @@ class InventorySerializer(serializers.Serializer):
     type = serializers.IntegerField()
     date = serializers.DateTimeField()
 
+    class Meta:
+        list_serializer_class = FastListSerializer
+
+
+class LowStockSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    quantity = serializers.IntegerField()
+    reorder_point = serializers.IntegerField()
+
+    class Meta:
+        list_serializer_class = FastListSerializer
+
+
+class SalesForecastSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    as_of = serializers.DateField()
+    window = serializers.IntegerField()
+    alpha = serializers.FloatField()
+    moving_average = serializers.FloatField()
+    smoothed = serializers.FloatField()
+    horizon = serializers.IntegerField()
+    quantity = serializers.FloatField()
+    created_at = serializers.DateTimeField()
+
+    class Meta:
+        list_serializer_class = FastListSerializer
+
+
+class SaleExportSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+    sale_date = serializers.DateTimeField()
+    import_file = serializers.IntegerField()
+
+    class Meta:
+        list_serializer_class = FastListSerializer
+
 
 class FileSerializer(serializers.Serializer):
     file = serializers.FileField()
 
 
+class SalesFileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SalesFile
+        fields = ['id', 'file_name', 'status', 'digest', 'row_count', 'error_count',
+                  'stock_overruns']
+
+
 class SalesSerializer(serializers.Serializer):
     monthly_date = serializers.DateTimeField(format='%Y-%m')
     monthly_price = serializers.IntegerField()
+
+    class Meta:
+        list_serializer_class = FastListSerializer
+
+
+class DateRangeSerializer(serializers.Serializer):
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+
+
+class StockAtSerializer(serializers.Serializer):
+    at = serializers.DateTimeField(required=False)
+
+
+class AnalyticsSerializer(DateRangeSerializer):
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=1000)
+    by = serializers.ChoiceField(required=False, default='revenue', choices=['revenue', 'quantity'])
+    product = serializers.IntegerField(required=False)
+    window = serializers.IntegerField(required=False, default=7, min_value=1, max_value=365)
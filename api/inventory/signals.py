@@ -0,0 +1,94 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import rollups
+from .archive import archiving
+from .cache import PRODUCTS, inventory_scope, invalidate, product_scope
+from .models import Product, Purchase, Sale
+from .stocks import add_stock, invalidate_snapshots, set_reorder_point
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    """
+    商品の登録・更新時に在庫行の発注点を更新し(在庫行がなければ作成する)、キャッシュを無効にする
+    """
+    set_reorder_point(instance.id, instance.reorder_point, created)
+    transaction.on_commit(partial(invalidate, PRODUCTS, product_scope(instance.id)))
+
+
+def _deleting_product(origin):
+    """
+    商品の削除に伴う削除か(在庫数量・日次集計・スナップショットは商品とともに削除される)
+    """
+    return isinstance(origin, Product) or (
+        isinstance(origin, QuerySet) and origin.model is Product)
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, **kwargs):
+    """
+    商品削除時に、ともに削除される売上を月次集計からまとめて減算する
+    仕入・売上ごとの受信側は商品の削除に伴う場合は何もしない
+    """
+    rollups.remove_product_sales(instance.id)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    """
+    商品削除時に商品・在庫履歴のキャッシュを無効にする
+    """
+    transaction.on_commit(partial(
+        invalidate, PRODUCTS, product_scope(instance.id), inventory_scope(instance.id)))
+
+
+@receiver(post_save, sender=Purchase)
+def purchase_saved(sender, instance, created, **kwargs):
+    """
+    仕入登録時に在庫数量を加算し、在庫履歴のキャッシュを無効にする
+    """
+    if created:
+        add_stock(instance.product_id, instance.quantity)
+        transaction.on_commit(partial(invalidate, inventory_scope(instance.product_id)))
+
+
+@receiver(post_delete, sender=Purchase)
+def purchase_deleted(sender, instance, origin=None, **kwargs):
+    """
+    仕入削除時に在庫数量を減算し、削除した仕入を含む在庫スナップショットを破棄する
+    """
+    if _deleting_product(origin):
+        return
+    add_stock(instance.product_id, -instance.quantity, create=False)
+    invalidate_snapshots(instance.product_id, instance.purchase_date)
+    transaction.on_commit(partial(invalidate, inventory_scope(instance.product_id)))
+
+
+@receiver(post_save, sender=Sale)
+def sale_saved(sender, instance, created, **kwargs):
+    """
+    売上登録時に在庫数量を減算し、売上集計に加算し、在庫履歴のキャッシュを無効にする
+    """
+    if created:
+        add_stock(instance.product_id, -instance.quantity)
+        rollups.add_sale(instance.product_id, instance.sale_date, instance.quantity)
+        transaction.on_commit(partial(invalidate, inventory_scope(instance.product_id)))
+
+
+@receiver(post_delete, sender=Sale)
+def sale_deleted(sender, instance, origin=None, **kwargs):
+    """
+    売上削除時に在庫数量を戻し、売上集計から減算し、削除した売上を含む在庫スナップショットを破棄する
+    アーカイブ済み売上へ移動する場合は何もしない
+    """
+    if _deleting_product(origin) or archiving():
+        return
+    add_stock(instance.product_id, instance.quantity, create=False)
+    invalidate_snapshots(instance.product_id, instance.sale_date)
+    rollups.add_sale(instance.product_id, instance.sale_date, -instance.quantity, count=-1)
+    transaction.on_commit(partial(invalidate, inventory_scope(instance.product_id)))
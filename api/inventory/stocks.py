@@ -0,0 +1,227 @@
+from django.db.models import Case, F, Max, Q, Sum, Value, When
+
+from .archive import archive_cutoff, carried_forward
+from .models import ArchivedSale, Product, Purchase, Sale, Stock, StockSnapshot
+
+# 1回のクエリでまとめて更新する行数
+BATCH_SIZE = 300
+
+
+def add_stock(product_id, quantity, create=True):
+    """
+    在庫数量を加算する(減算する場合は負数を指定する)
+    """
+    updated = Stock.objects.filter(product_id=product_id).update(
+        quantity=F('quantity') + quantity)
+    if updated or not create:
+        return
+
+    Stock.objects.get_or_create(product_id=product_id)
+    Stock.objects.filter(product_id=product_id).update(
+        quantity=F('quantity') + quantity)
+
+
+def set_reorder_point(product_id, reorder_point, created=False):
+    """
+    在庫行に商品の発注点を複製する(在庫行がなければ作成する)
+    """
+    if created:
+        Stock.objects.create(product_id=product_id, reorder_point=reorder_point)
+        return
+    updated = Stock.objects.filter(product_id=product_id).update(reorder_point=reorder_point)
+    if not updated:
+        Stock.objects.get_or_create(product_id=product_id, defaults={'reorder_point': reorder_point})
+
+
+def add_stocks(quantities):
+    """
+    商品IDごとの数量をまとめて在庫数量に加算する
+    """
+    items = [(int(product_id), int(quantity))
+             for product_id, quantity in quantities.items() if quantity]
+    for offset in range(0, len(items), BATCH_SIZE):
+        batch = items[offset:offset + BATCH_SIZE]
+        Stock.objects.bulk_create(
+            [Stock(product_id=product_id) for product_id, _ in batch], ignore_conflicts=True)
+        Stock.objects.filter(product_id__in=[product_id for product_id, _ in batch]).update(
+            quantity=F('quantity') + Case(
+                *[When(product_id=product_id, then=Value(quantity)) for product_id, quantity in batch],
+                default=Value(0)))
+
+
+def lock_stock(product_id):
+    """
+    在庫行をロックして現在の在庫数量を取得する
+    """
+    stock = Stock.objects.select_for_update().filter(product_id=product_id).first()
+    return stock.quantity if stock else 0
+
+
+def lock_stocks(product_ids):
+    """
+    複数の在庫行をまとめてロックして商品IDごとの在庫数量を取得する
+    """
+    quantities = dict.fromkeys(product_ids, 0)
+    quantities.update(Stock.objects.select_for_update().filter(
+        product_id__in=quantities).values_list('product_id', 'quantity'))
+    return quantities
+
+
+def calculate_stocks():
+    """
+    仕入・売上の履歴から商品ごとの在庫数量を集計する
+    アーカイブ済み売上は読まずに商品ごとの繰越を使用する
+    """
+    quantities = dict.fromkeys(Product.objects.values_list('id', flat=True), 0)
+    purchases = Purchase.objects.values('product').annotate(
+        total=Sum('quantity')).values_list('product', 'total')
+    sales = Sale.objects.values('product').annotate(
+        total=Sum('quantity')).values_list('product', 'total')
+
+    for product_id, total in purchases:
+        quantities[product_id] += total
+    for product_id, total in sales:
+        quantities[product_id] -= total
+    for product_id, total in carried_forward().items():
+        quantities[product_id] -= total
+    return quantities
+
+
+def rebuild_stocks(dry_run=False):
+    """
+    在庫数量を履歴から再構築し、差異のあった商品を返す
+    """
+    recorded = dict(Stock.objects.values_list('product_id', 'quantity'))
+    reorder_points = dict(Product.objects.values_list('id', 'reorder_point'))
+    drifts = []
+    created = []
+    updated = []
+    for product_id, quantity in calculate_stocks().items():
+        current = recorded.get(product_id)
+        if current == quantity:
+            continue
+        drifts.append((product_id, current, quantity))
+        stock = Stock(product_id=product_id, quantity=quantity,
+                      reorder_point=reorder_points.get(product_id, 0))
+        (created if current is None else updated).append(stock)
+
+    if not dry_run:
+        Stock.objects.bulk_create(created, batch_size=1000)
+        Stock.objects.bulk_update(updated, ['quantity'], batch_size=1000)
+    return drifts
+
+
+def _latest_snapshots(at, product_ids=None):
+    """
+    商品ごとの at 以前で直近のスナップショットを
+    {商品ID: (基準日時, 在庫数量, 仕入ID, 売上ID)} で返す
+    """
+    snapshots = StockSnapshot.objects.filter(taken_at__lte=at)
+    if product_ids is not None:
+        snapshots = snapshots.filter(product_id__in=product_ids)
+    latest = dict(snapshots.values('product').annotate(
+        last=Max('taken_at')).values_list('product', 'last'))
+    if not latest:
+        return {}
+    # スナップショットは全商品で同じ基準日時に作成するため、基準日時の種類は少ない
+    rows = snapshots.filter(taken_at__in=set(latest.values())).values_list(
+        'product', 'taken_at', 'quantity', 'purchase_watermark', 'sale_watermark')
+    return {row[0]: row[1:] for row in rows if latest[row[0]] == row[1]}
+
+
+def _moved(model, date_field, at, since, watermark, product_ids, until):
+    """
+    基準日時 since より後、または仕入・売上ID watermark より後に登録された、at 以前の数量を
+    商品ごとに合計する(until を指定した場合はそのID以前の行のみ)
+    """
+    rows = model.objects.filter(**{f'{date_field}__lte': at})
+    if since is not None:
+        rows = rows.filter(Q(**{f'{date_field}__gt': since}) | Q(id__gt=watermark))
+    if product_ids is not None:
+        rows = rows.filter(product_id__in=product_ids)
+    if until is not None:
+        rows = rows.filter(id__lte=until)
+    return dict(rows.values('product').annotate(total=Sum('quantity')).values_list('product', 'total'))
+
+
+def stocks_at(at, product_ids=None, until=None):
+    """
+    at 時点の商品ごとの在庫数量を {商品ID: 在庫数量} で返す(存在しない商品は含まない)
+    at 以前で直近のスナップショットに、それ以降の仕入・売上だけを加減算する
+    until に (仕入ID, 売上ID) を指定した場合は、そのID以前の仕入・売上のみを対象にする
+    アーカイブ後はアーカイブ済み売上も同じく加減算する(スナップショットが基準日時以降でも、
+    スナップショット作成後に登録された過去日時の売上がアーカイブされている場合がある)
+    スナップショットがなく at が基準日時以降の場合は繰越を使用する
+    """
+    products = Product.objects.order_by('id')
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    quantities = dict.fromkeys(products.values_list('id', flat=True), 0)
+    snapshots = _latest_snapshots(at, product_ids)
+
+    # 同じスナップショットから計算する商品ごとに、以降の仕入・売上をまとめて集計する
+    groups = {}
+    for product_id in quantities:
+        taken_at, quantity, purchase_watermark, sale_watermark = snapshots.get(
+            product_id, (None, 0, 0, 0))
+        quantities[product_id] = quantity
+        groups.setdefault((taken_at, purchase_watermark, sale_watermark), []).append(product_id)
+
+    purchase_until, sale_until = until or (None, None)
+    cutoff = archive_cutoff()
+    for (taken_at, purchase_watermark, sale_watermark), ids in groups.items():
+        # 商品数が多い場合は商品で絞り込まずに集計し、対象外の商品を読み捨てる
+        scope = ids if len(ids) <= BATCH_SIZE else None
+        purchases = _moved(Purchase, 'purchase_date', at, taken_at, purchase_watermark,
+                           scope, purchase_until)
+        sales = [_moved(Sale, 'sale_date', at, taken_at, sale_watermark, scope, sale_until)]
+        if cutoff is not None:
+            if taken_at is None and sale_until is None and at >= cutoff:
+                sales.append(carried_forward(scope))
+            else:
+                sales.append(_moved(ArchivedSale, 'sale_date', at, taken_at, sale_watermark,
+                                    scope, sale_until))
+        for product_id in ids:
+            quantities[product_id] += purchases.get(product_id, 0) - sum(
+                moved.get(product_id, 0) for moved in sales)
+    return quantities
+
+
+def take_snapshots(at):
+    """
+    全商品の at 時点の在庫スナップショットを作成する(同じ基準日時のスナップショットは上書きする)
+    先に仕入・売上の最大IDを取得してそれ以前の行だけで計算し、
+    作成中に登録された行は以降の計算で加算されるようにする
+    """
+    purchase_last = Purchase.objects.aggregate(last=Max('id'))['last'] or 0
+    # 売上をすべてアーカイブした後はアーカイブ済み売上の最大IDを使用する
+    sale_last = (Sale.objects.aggregate(last=Max('id'))['last']
+                 or ArchivedSale.objects.aggregate(last=Max('id'))['last'] or 0)
+    snapshots = [
+        StockSnapshot(product_id=product_id, taken_at=at, quantity=quantity,
+                      purchase_watermark=purchase_last, sale_watermark=sale_last)
+        for product_id, quantity in stocks_at(at, until=(purchase_last, sale_last)).items()
+    ]
+    StockSnapshot.objects.bulk_create(
+        snapshots, batch_size=1000, update_conflicts=True, unique_fields=['product', 'taken_at'],
+        update_fields=['quantity', 'purchase_watermark', 'sale_watermark'])
+    return len(snapshots)
+
+
+def prune_snapshots(keep):
+    """
+    基準日時の新しい keep 世代より古いスナップショットを削除し、削除した件数を返す
+    """
+    cutoffs = list(StockSnapshot.objects.order_by('-taken_at').values_list(
+        'taken_at', flat=True).distinct()[keep - 1:keep])
+    if not cutoffs:
+        return 0
+    deleted, _ = StockSnapshot.objects.filter(taken_at__lt=cutoffs[0]).delete()
+    return deleted
+
+
+def invalidate_snapshots(product_id, date):
+    """
+    date 以降を基準日時とするスナップショットを削除する(仕入・売上の削除時)
+    """
+    StockSnapshot.objects.filter(product_id=product_id, taken_at__gte=date).delete()
@@ -0,0 +1,51 @@
+import copy
+
+import pytest
+from django.conf import settings
+from django.test import override_settings
+
+from api.inventory.analytics import engine
+from api.inventory.cache import get_cache, get_version_cache
+
+
+@pytest.fixture(scope='session', autouse=True)
+def version_cache_dir(tmp_path_factory):
+    """
+    世代番号を開発環境の cache ディレクトリではなくテスト用ディレクトリに保存する
+    (テストごとに空にするため)
+    """
+    caches = copy.deepcopy(settings.CACHES)
+    caches[settings.INVENTORY_VERSION_CACHE_ALIAS]['LOCATION'] = tmp_path_factory.mktemp('versions')
+    with override_settings(CACHES=caches):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    テストごとにレスポンスキャッシュと世代番号を空にする
+    """
+    get_cache().clear()
+    get_version_cache().clear()
+    yield
+    get_cache().clear()
+    get_version_cache().clear()
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(settings, tmp_path):
+    """
+    アップロードされた売上ファイルをテスト用ディレクトリに保存する
+    """
+    settings.SALES_UPLOAD_DIR = tmp_path / 'uploads'
+    return settings.SALES_UPLOAD_DIR
+
+
+@pytest.fixture(autouse=True)
+def reset_analytics():
+    """
+    テストごとにメモリ上の集計用データを破棄する
+    """
+    engine.reset()
+    yield
+    engine.reset()
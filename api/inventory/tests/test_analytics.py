@@ -0,0 +1,132 @@
+from datetime import datetime, timezone
+
+import pytest
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.inventory.analytics import engine, stock_cover
+from api.inventory.models import Product, Purchase, Sale
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def products(settings):
+    settings.INVENTORY_ANALYTICS_REFRESH_SECONDS = 0
+    apple = Product.objects.create(name="Apple", price=100)
+    pear = Product.objects.create(name="Pear", price=300)
+    Purchase.objects.create(product=apple, quantity=20, purchase_date="2025-04-01T00:00:00Z")
+    Purchase.objects.create(product=pear, quantity=10, purchase_date="2025-04-01T00:00:00Z")
+    Sale.objects.create(product=apple, quantity=5, sale_date="2025-04-01T10:00:00Z")
+    Sale.objects.create(product=apple, quantity=3, sale_date="2025-04-03T10:00:00Z")
+    Sale.objects.create(product=pear, quantity=2, sale_date="2025-04-02T10:00:00Z")
+    return apple, pear
+
+
+@pytest.mark.django_db
+def test_revenue_and_top_products(client, products):
+    """
+    商品ごとの売上金額・上位の商品を返すこと
+    """
+    apple, pear = products
+
+    response = client.get('/api/inventory/analytics/revenue/')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {'product': apple.id, 'name': 'Apple', 'quantity': 8, 'revenue': 800},
+        {'product': pear.id, 'name': 'Pear', 'quantity': 2, 'revenue': 600},
+    ]
+
+    response = client.get('/api/inventory/analytics/revenue/', {'date_from': '2025-04-02T00:00:00Z'})
+    assert [row['revenue'] for row in response.json()] == [600, 300]
+
+    response = client.get('/api/inventory/analytics/top-products/', {'limit': 1, 'by': 'quantity'})
+    assert [row['product'] for row in response.json()] == [apple.id]
+
+    response = client.get('/api/inventory/analytics/top-products/', {'by': 'price'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_rolling(client, products):
+    """
+    日ごとの売上と直近 window 日間の合計を返すこと(売上のない日は0)
+    """
+    apple, _ = products
+
+    response = client.get('/api/inventory/analytics/rolling/', {'product': apple.id, 'window': 2})
+    assert response.json() == [
+        {'date': '2025-04-01', 'quantity': 5, 'revenue': 500,
+         'rolling_quantity': 5, 'rolling_revenue': 500},
+        {'date': '2025-04-02', 'quantity': 0, 'revenue': 0,
+         'rolling_quantity': 5, 'rolling_revenue': 500},
+        {'date': '2025-04-03', 'quantity': 3, 'revenue': 300,
+         'rolling_quantity': 3, 'rolling_revenue': 300},
+    ]
+
+    response = client.get('/api/inventory/analytics/rolling/', {'product': apple.id + 100})
+    assert response.json() == []
+
+
+@pytest.mark.django_db
+def test_stock_cover(client, products):
+    """
+    在庫数量・消化率・在庫日数を返すこと
+    """
+    apple, pear = products
+    Product.objects.create(name="Plum", price=100)
+
+    now = datetime(2025, 4, 5, tzinfo=timezone.utc)
+    rows = {row['name']: row for row in stock_cover(10, now=now)}
+    assert rows['Apple'] == {'product': apple.id, 'name': 'Apple', 'purchased': 20, 'sold': 8,
+                             'stock': 12, 'sell_through': 0.4, 'days_of_cover': 15.0}
+    assert rows['Pear']['sell_through'] == 0.2
+    assert rows['Plum']['sell_through'] is None
+    assert rows['Plum']['days_of_cover'] is None
+
+    response = client.get('/api/inventory/analytics/stock-cover/')
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 3
+
+
+@pytest.mark.django_db
+def test_refresh_loads_new_rows_by_watermark(client, products, settings,
+                                             django_assert_num_queries):
+    """
+    前回以降に登録された売上だけを読み込み、既存の売上が削除された場合は読み直すこと
+    更新間隔内はテーブルを読まないこと
+    """
+    apple, _ = products
+    engine.refresh()
+
+    Sale.objects.create(product=apple, quantity=1, sale_date="2025-04-04T10:00:00Z")
+    # 売上: 件数・最大ID + 追加分、仕入: 件数・最大ID、商品(アーカイブの基準日時はキャッシュ済み)
+    with django_assert_num_queries(4):
+        sales, _, _ = engine.refresh()
+    assert sales['quantity'].sum() == 11
+
+    Sale.objects.filter(quantity=5).delete()
+    sales, _, _ = engine.refresh()
+    assert sales['quantity'].sum() == 6
+    assert len(sales) == 3
+
+    settings.INVENTORY_ANALYTICS_REFRESH_SECONDS = 60
+    Sale.objects.create(product=apple, quantity=1, sale_date="2025-04-04T10:00:00Z")
+    with django_assert_num_queries(0):
+        sales, _, _ = engine.refresh()
+    assert len(sales) == 3
+
+
+@pytest.mark.django_db
+def test_empty(client, settings):
+    """
+    データがない場合は空の一覧を返すこと
+    """
+    settings.INVENTORY_ANALYTICS_REFRESH_SECONDS = 0
+    for report in ('revenue', 'top-products', 'rolling', 'stock-cover'):
+        response = client.get(f'/api/inventory/analytics/{report}/')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
@@ -0,0 +1,151 @@
+from datetime import datetime, timezone
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.inventory.analytics import revenue
+from api.inventory.archive import CUTOFF_KEY, archive_cutoff, archive_sales
+from api.inventory.cache import get_version_cache
+from api.inventory.models import (
+    ArchivedSale,
+    DailySales,
+    MonthlySales,
+    Product,
+    Purchase,
+    Sale,
+    SalesArchive,
+    SalesCarryForward,
+    SalesFile,
+    Status,
+    Stock,
+)
+from api.inventory.rollups import rebuild_rollups
+from api.inventory.stocks import rebuild_stocks, stocks_at, take_snapshots
+
+CUTOFF = datetime(2025, 4, 3, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def history():
+    apple = Product.objects.create(name="Apple", price=100)
+    pear = Product.objects.create(name="Pear", price=300)
+    sales_file = SalesFile.objects.create(file_name='sales.csv', status=Status.SYNC)
+    Purchase.objects.create(product=apple, quantity=20, purchase_date="2025-04-01T00:00:00Z")
+    Purchase.objects.create(product=pear, quantity=10, purchase_date="2025-04-01T00:00:00Z")
+    Sale.objects.create(product=apple, quantity=5, sale_date="2025-04-01T10:00:00Z",
+                        import_file=sales_file)
+    Sale.objects.create(product=apple, quantity=3, sale_date="2025-04-02T10:00:00Z")
+    Sale.objects.create(product=pear, quantity=2, sale_date="2025-04-02T12:00:00Z")
+    Sale.objects.create(product=apple, quantity=1, sale_date="2025-04-04T10:00:00Z",
+                        import_file=sales_file)
+    return apple, pear, sales_file
+
+
+@pytest.mark.django_db
+def test_archive_sales(history):
+    """
+    基準日時より前の売上を同じIDで移動し、在庫数量・売上集計を変えずに繰越に加算すること
+    """
+    apple, pear, _ = history
+    ids = list(Sale.objects.filter(sale_date__lt=CUTOFF).order_by('id').values_list('id', flat=True))
+    stocks = dict(Stock.objects.values_list('product_id', 'quantity'))
+    daily = list(DailySales.objects.order_by('id').values_list('product', 'date', 'quantity'))
+
+    assert archive_sales(CUTOFF, batch_size=2) == 3
+    assert list(ArchivedSale.objects.order_by('id').values_list('id', flat=True)) == ids
+    assert list(Sale.objects.values_list('quantity', flat=True)) == [1]
+    assert dict(Stock.objects.values_list('product_id', 'quantity')) == stocks
+    assert list(DailySales.objects.order_by('id').values_list('product', 'date', 'quantity')) == daily
+    assert set(SalesCarryForward.objects.values_list('product', 'quantity', 'count')) == {
+        (apple.id, 8, 2), (pear.id, 2, 1)}
+    assert SalesArchive.objects.get().rows == 3
+    assert archive_cutoff() == CUTOFF
+
+    # 履歴から再構築しても差異がないこと
+    assert rebuild_stocks(dry_run=True) == []
+    assert rebuild_rollups(dry_run=True) == {'daily': 0, 'monthly': 0}
+    assert MonthlySales.objects.get().quantity == 11
+
+
+@pytest.mark.django_db
+def test_archive_cutoff_cached(history, django_assert_num_queries):
+    """
+    アーカイブの基準日時を共有するキャッシュから読み、アーカイブ時に更新すること
+    """
+    assert archive_cutoff() is None
+    with django_assert_num_queries(0):
+        assert archive_cutoff() is None
+
+    archive_sales(CUTOFF, batch_size=10)
+    assert get_version_cache().get(CUTOFF_KEY) == (CUTOFF,)
+    with django_assert_num_queries(0):
+        assert archive_cutoff() == CUTOFF
+    archive_sales(datetime(2025, 4, 1, tzinfo=timezone.utc), batch_size=10)
+    assert archive_cutoff() == CUTOFF
+
+    get_version_cache().delete(CUTOFF_KEY)
+    assert archive_cutoff() == CUTOFF
+
+
+@pytest.mark.django_db
+def test_reads_union_archive(client, history, django_assert_num_queries):
+    """
+    期間の開始が基準日時より前の読み取りのみアーカイブ済み売上を併せて返すこと
+    """
+    apple, pear, sales_file = history
+
+    def ledger(params=None):
+        response = client.get(f'/api/inventory/inventories/{apple.id}/', params)
+        assert response.status_code == status.HTTP_200_OK
+        return [(row['type'], row['quantity']) for row in response.json()]
+
+    def export(path):
+        response = client.get(path)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    expected = ledger()
+    ranged = ledger({'date_from': '2025-04-02T00:00:00Z'})
+    page = client.get(f'/api/inventory/inventories/{apple.id}/', {'page_size': 2}).json()
+    sales_export = export('/api/inventory/exports/sales/csv/')
+    file_export = export(f'/api/inventory/exports/sales-files/{sales_file.id}/csv/')
+    ledger_export = export(f'/api/inventory/exports/inventories/{apple.id}/csv/')
+    stocks = stocks_at(datetime(2025, 4, 2, 11, tzinfo=timezone.utc))
+
+    archive_sales(CUTOFF, batch_size=10)
+    assert ledger() == expected == [(1, 20), (2, 5), (2, 3), (2, 1)]
+    assert ledger({'date_from': '2025-04-02T00:00:00Z'}) == ranged
+    assert client.get(f'/api/inventory/inventories/{apple.id}/', {'page_size': 2}).json() == page
+    assert export('/api/inventory/exports/sales/csv/') == sales_export
+    assert export(f'/api/inventory/exports/sales-files/{sales_file.id}/csv/') == file_export
+    assert export(f'/api/inventory/exports/inventories/{apple.id}/csv/') == ledger_export
+    # 非同期のビューも同じ行を返すこと
+    for params in [{}, {'date_from': '2025-04-02T00:00:00Z', 'date_to': '2025-04-03T00:00:00Z'}]:
+        path = f'/api/inventory/aio/inventories/{apple.id}/'
+        assert (async_to_sync(AsyncClient().get)(path, params).json()
+                == client.get(f'/api/inventory/inventories/{apple.id}/', params).json())
+    assert stocks_at(datetime(2025, 4, 2, 11, tzinfo=timezone.utc)) == stocks
+    assert stocks_at(datetime(2025, 4, 5, tzinfo=timezone.utc)) == {apple.id: 11, pear.id: 8}
+    assert [row['quantity'] for row in revenue()] == [9, 2]
+
+    # スナップショット作成後に登録・アーカイブされた過去日時の売上も減算する
+    take_snapshots(CUTOFF)
+    assert stocks_at(datetime(2025, 4, 5, tzinfo=timezone.utc)) == {apple.id: 11, pear.id: 8}
+    Sale.objects.create(product=apple, quantity=4, sale_date="2025-04-02T15:00:00Z")
+    archive_sales(CUTOFF, batch_size=10)
+    assert stocks_at(datetime(2025, 4, 5, tzinfo=timezone.utc)) == {apple.id: 7, pear.id: 8}
+    assert stocks_at(datetime(2025, 4, 5, tzinfo=timezone.utc)) == dict(
+        Stock.objects.values_list('product_id', 'quantity'))
+
+    # 期間の開始が基準日時以降の場合は売上のみを読む(基準日時はキャッシュ済み)
+    with django_assert_num_queries(1):
+        response = client.get(f'/api/inventory/inventories/{apple.id}/',
+                              {'date_from': '2025-04-03T00:00:00Z'})
+    assert [row['quantity'] for row in response.json()] == [1]
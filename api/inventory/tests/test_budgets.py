@@ -0,0 +1,232 @@
+import itertools
+import json
+import logging
+import os
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.inventory import urls
+from api.inventory.cache import get_cache
+from api.inventory.forecasts import run_forecasts
+from api.inventory.models import MonthlySales, Product, Purchase, Sale, SalesFile, Status
+from api.inventory.rollups import rebuild_rollups
+from api.inventory.stocks import rebuild_stocks, take_snapshots
+from api.inventory.uploads import error_report_path
+
+logger = logging.getLogger(__name__)
+
+BUDGETS = json.loads((Path(__file__).parent / 'budgets.json').read_text())
+
+# INVENTORY_BENCH_PROFILE=full で 1万商品・100万売上の計測を行う
+# full の予算は実測値(p95 は約3倍、ピークメモリは約2倍)を上限とし、ci の予算を下限とする
+PROFILE = os.environ.get('INVENTORY_BENCH_PROFILE', 'ci')
+VOLUME = BUDGETS['profiles'][PROFILE]
+
+
+UPLOADS = itertools.count()
+
+
+def upload(context):
+    # 同じ内容のアップロードは重複として扱われるため、毎回異なる売上日時にする
+    product = context['products'][0]
+    sale_date = datetime(2025, 4, 21, 12) + timedelta(seconds=next(UPLOADS))
+    return {'file': SimpleUploadedFile(
+        'sales.csv', f'product,date,quantity\n{product},{sale_date},1\n'.encode())}
+
+
+def error_report(context):
+    """
+    エラーレポートのある売上ファイルを用意する
+    """
+    sales_file = context['sales_files'][0]
+    path = error_report_path(SalesFile.objects.get(pk=sales_file))
+    if not path.exists():
+        SalesFile.objects.filter(pk=sales_file).update(error_report=path.name, error_count=100)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('row,product,date,quantity,errors\n' + ''.join(
+            f'{row},0,2025-04-21 12:00:00,1,unknown product\n' for row in range(1, 101)))
+    return sales_file
+
+
+# ルートごとに計測するリクエスト (メソッド, パス, データ)
+REQUESTS = {
+    'GET products/': lambda c: ('get', '/api/inventory/products/', None),
+    'GET products/?page_size': lambda c: ('get', '/api/inventory/products/', {'page_size': 100}),
+    'GET products/<int:id>/': lambda c: ('get', f"/api/inventory/products/{c['products'][0]}/", None),
+    'PUT products/<int:id>/': lambda c: (
+        'put', f"/api/inventory/products/{c['products'][0]}/", {'name': 'Product', 'price': 100}),
+    'GET products/model/': lambda c: ('get', '/api/inventory/products/model/', None),
+    'POST products/model/': lambda c: (
+        'post', '/api/inventory/products/model/', {'name': 'Product', 'price': 100}),
+    'POST purchases/': lambda c: (
+        'post', '/api/inventory/purchases/', {'product': c['products'][0], 'quantity': 1}),
+    'POST purchases/bulk/': lambda c: (
+        'post', '/api/inventory/purchases/bulk/',
+        [{'product': product, 'quantity': 1} for product in c['products'][:50]]),
+    'POST sales/': lambda c: (
+        'post', '/api/inventory/sales/', {'product': c['products'][0], 'quantity': 1}),
+    'POST sales/bulk/': lambda c: (
+        'post', '/api/inventory/sales/bulk/',
+        [{'product': product, 'quantity': 1} for product in c['products'][:50]]),
+    'GET inventories/<int:id>/': lambda c: ('get', f"/api/inventory/inventories/{c['products'][0]}/", None),
+    'GET inventories/<int:id>/?page_size': lambda c: (
+        'get', f"/api/inventory/inventories/{c['products'][0]}/", {'page_size': 100}),
+    'GET inventories/<int:id>/stock/': lambda c: (
+        'get', f"/api/inventory/inventories/{c['products'][0]}/stock/",
+        {'at': (c['start'] + timedelta(days=1)).isoformat()}),
+    'GET inventories/stock/': lambda c: (
+        'get', '/api/inventory/inventories/stock/', {'at': (c['start'] + timedelta(days=1)).isoformat()}),
+    'GET low-stock/': lambda c: ('get', '/api/inventory/low-stock/', None),
+    'GET forecasts/': lambda c: ('get', '/api/inventory/forecasts/', None),
+    'GET forecasts/<int:id>/': lambda c: ('get', f"/api/inventory/forecasts/{c['products'][0]}/", None),
+    'GET exports/inventories/<int:id>/<str:fmt>/': lambda c: (
+        'get', f"/api/inventory/exports/inventories/{c['products'][0]}/ndjson/", None),
+    'GET exports/sales/<str:fmt>/': lambda c: (
+        'get', '/api/inventory/exports/sales/csv/',
+        {'date_from': c['start'].isoformat(), 'date_to': (c['start'] + timedelta(days=1)).isoformat()}),
+    'GET exports/sales-files/<int:id>/<str:fmt>/': lambda c: (
+        'get', f"/api/inventory/exports/sales-files/{c['sales_files'][0]}/ndjson/", None),
+    'GET aio/products/': lambda c: ('get', '/api/inventory/aio/products/', None),
+    'GET aio/products/<int:id>/': lambda c: ('get', f"/api/inventory/aio/products/{c['products'][0]}/", None),
+    'GET aio/inventories/<int:id>/': lambda c: (
+        'get', f"/api/inventory/aio/inventories/{c['products'][0]}/", None),
+    'GET aio/summary/': lambda c: ('get', '/api/inventory/aio/summary/', None),
+    'GET sales-files/<int:id>/errors/': lambda c: (
+        'get', f"/api/inventory/sales-files/{error_report(c)}/errors/", None),
+    'POST sync/': lambda c: ('multipart', '/api/inventory/sync/', upload(c)),
+    'POST async/': lambda c: ('multipart', '/api/inventory/async/', upload(c)),
+    'GET summary/': lambda c: ('get', '/api/inventory/summary/', None),
+    'GET analytics/revenue/': lambda c: ('get', '/api/inventory/analytics/revenue/', None),
+    'GET analytics/top-products/': lambda c: (
+        'get', '/api/inventory/analytics/top-products/', {'limit': 10}),
+    'GET analytics/rolling/': lambda c: (
+        'get', '/api/inventory/analytics/rolling/', {'product': c['products'][0], 'window': 30}),
+    'GET analytics/stock-cover/': lambda c: ('get', '/api/inventory/analytics/stock-cover/', None),
+    'GET metrics/': lambda c: ('get', '/api/inventory/metrics/', None),
+}
+
+
+def seed(products, sales):
+    """
+    計測用の商品・仕入・売上を一括登録する
+    売上は1万件ずつ売上ファイルから取り込んだものとする
+    10商品に1商品は発注点を仕入数量とし、在庫僅少の商品とする
+    """
+    product_ids = [
+        product.id for product in Product.objects.bulk_create(
+            [Product(name=f"Product {i}", price=1000, reorder_point=sales if i % 10 == 0 else 0)
+             for i in range(products)], batch_size=1000)
+    ]
+    start = timezone.now() - timedelta(days=365)
+    Purchase.objects.bulk_create(
+        [Purchase(product_id=product_id, quantity=sales, purchase_date=start)
+         for product_id in product_ids], batch_size=1000)
+    sales_files = []
+    for offset in range(0, sales, 10000):
+        sales_file = SalesFile.objects.create(file_name=f'sales-{offset}.csv', status=Status.SYNC)
+        sales_files.append(sales_file.id)
+        Sale.objects.bulk_create(
+            [Sale(product_id=product_ids[i % products], quantity=1,
+                  sale_date=start + timedelta(minutes=i), import_file=sales_file)
+             for i in range(offset, min(offset + 10000, sales))], batch_size=1000)
+    rebuild_stocks()
+    rebuild_rollups()
+    take_snapshots(start + timedelta(hours=12))
+    run_forecasts(timezone.localdate(start + timedelta(days=1)))
+    return {'products': product_ids, 'sales_files': sales_files, 'start': start}
+
+
+@pytest.fixture(scope='module')
+def context(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        yield seed(VOLUME['products'], VOLUME['sales'])
+        # full の件数でも行ごとにシグナルを発行・読み込みしないよう、仕入・売上はSQLでまとめて削除する
+        with connection.cursor() as cursor:
+            for model in (Sale, Purchase):
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        SalesFile.objects.all().delete()
+        Product.objects.all().delete()
+        MonthlySales.objects.all().delete()
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+def send(client, method, path, data):
+    if method == 'multipart':
+        response = client.post(path, data=data, format='multipart')
+    elif method == 'get':
+        response = client.get(path, data)
+    else:
+        response = getattr(client, method)(path, data=data, format='json')
+    if response.streaming:
+        # ストリーミングのレスポンスは最後まで読み出して計測する
+        for _ in response.streaming_content:
+            pass
+        response.close()
+    return response
+
+
+def measure(client, build, iterations):
+    """
+    リクエストのクエリ数・レイテンシ(p50/p95)・ピークメモリを計測する
+    """
+    timings = []
+    for _ in range(iterations):
+        request = build()
+        started = time.perf_counter()
+        response = send(client, *request)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code < 400, response.content
+
+    # キャッシュに隠れないよう、クエリ数とメモリはキャッシュを空にして計測する
+    get_cache().clear()
+    request = build()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            send(client, *request)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    cuts = statistics.quantiles(timings, n=20, method='inclusive')
+    return {
+        'queries': len(queries.captured_queries),
+        'p50_ms': statistics.median(timings),
+        'p95_ms': cuts[18],
+        'peak_kb': peak / 1024,
+    }
+
+
+def test_every_route_has_a_budget():
+    routes = {str(pattern.pattern) for pattern in urls.urlpatterns}
+    measured = {key.split(' ')[1].split('?')[0] for key in REQUESTS}
+    assert routes <= measured
+    assert set(REQUESTS) == set(BUDGETS['routes'])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('route', sorted(REQUESTS))
+def test_route_within_budget(client, context, route):
+    result = measure(client, lambda: REQUESTS[route](context), VOLUME['iterations'])
+    budget = BUDGETS['routes'][route]
+    # 計測値は --log-cli-level=INFO で出力する
+    logger.info('%s: queries=%d p50=%.1fms p95=%.1fms peak=%.0fKiB', route, result['queries'],
+                result['p50_ms'], result['p95_ms'], result['peak_kb'])
+
+    assert result['queries'] <= budget['queries']
+    assert result['p95_ms'] <= budget['p95_ms'][PROFILE]
+    assert result['peak_kb'] <= budget['peak_kb'][PROFILE]
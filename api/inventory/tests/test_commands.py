@@ -0,0 +1,411 @@
+import itertools
+import threading
+from datetime import timedelta
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from api.inventory import ingestion
+
+from api.inventory.models import (
+    ArchivedSale,
+    DailySales,
+    MonthlySales,
+    Product,
+    Purchase,
+    Sale,
+    SalesFile,
+    SalesForecast,
+    Status,
+    Stock,
+    StockSnapshot,
+)
+from batch.management.commands.import_sales import claim_and_execute, work
+
+
+@pytest.mark.django_db
+def test_rebuild_stocks_reports_and_fixes_drift(capsys):
+    """
+    rebuild_stocks: 履歴との差異を報告して在庫数量を修正すること
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10)
+    Sale.objects.create(product=product, quantity=3)
+    Stock.objects.filter(product=product).update(quantity=100)
+
+    call_command('rebuild_stocks', '--dry-run')
+    assert 'recorded=100 actual=7' in capsys.readouterr().out
+    assert Stock.objects.get(product=product).quantity == 100
+
+    call_command('rebuild_stocks')
+    assert Stock.objects.get(product=product).quantity == 7
+
+    call_command('rebuild_stocks')
+    assert '0 drift(s) found' in capsys.readouterr().out.splitlines()[-1]
+
+
+@pytest.mark.django_db
+def test_rebuild_sales_summary(capsys):
+    """
+    rebuild_sales_summary: 日次・月次の売上集計を履歴から再構築すること
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    Sale.objects.create(product=product, quantity=3,
+                        sale_date="2025-04-21T12:00:00Z")
+    MonthlySales.objects.update(quantity=100)
+    DailySales.objects.all().delete()
+
+    call_command('rebuild_sales_summary')
+    assert 'daily=1 monthly=1' in capsys.readouterr().out
+    assert DailySales.objects.get().quantity == 3
+    assert MonthlySales.objects.get().quantity == 3
+
+    call_command('rebuild_sales_summary')
+    assert 'daily=0 monthly=0' in capsys.readouterr().out
+
+
+@pytest.fixture
+def unprocessed_file(tmp_path):
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10)
+    path = tmp_path / 'sales.csv'
+    path.write_text(
+        f'product,date,quantity\n{product.id},2025-04-21 12:00:00,4\n')
+    return SalesFile.objects.create(
+        file_name=str(path), status=Status.ASYNC_UNPROCESSED)
+
+
+@pytest.mark.django_db
+def test_import_sales(unprocessed_file):
+    """
+    import_sales: 未処理の売上ファイルを取り込むこと
+    """
+    call_command('import_sales')
+    unprocessed_file.refresh_from_db()
+    assert unprocessed_file.status == Status.ASYNC_PROCESSED
+    assert Sale.objects.get(import_file=unprocessed_file).quantity == 4
+    assert Stock.objects.get().quantity == 6
+
+
+class StopWhenIdle(threading.Event):
+    def wait(self, timeout=None):
+        self.set()
+        return True
+
+
+@pytest.mark.django_db
+def test_import_sales_worker_drains_queue(unprocessed_file):
+    """
+    import_sales --worker: 未処理がなくなるまで取り込み、停止要求で終了すること
+    """
+    work(StopWhenIdle(), poll_interval=0.01, max_interval=0.01)
+    unprocessed_file.refresh_from_db()
+    assert unprocessed_file.status == Status.ASYNC_PROCESSED
+    assert claim_and_execute() is False
+
+
+class WorkerCrashed(BaseException):
+    """
+    ワーカーのプロセスの異常終了(例外として捕捉されない)
+    """
+
+
+@pytest.mark.django_db
+def test_import_sales_resumes_from_checkpoint(tmp_path, settings, monkeypatch):
+    """
+    import_sales: チャンクごとにコミットし、中断した取込をチェックポイントから再開すること
+    """
+    settings.SALES_IMPORT_CHUNK_SIZE = 2
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=100)
+    path = tmp_path / 'sales.csv'
+    path.write_text('product,date,quantity\n' + ''.join(
+        f'{product.id},2025-04-0{day} 12:00:00,{day}\n' for day in range(1, 6)))
+    sales_file = SalesFile.objects.create(file_name=str(path), status=Status.ASYNC_UNPROCESSED)
+
+    # 3つ目のチャンクでワーカーを異常終了させる
+    validate_chunk = ingestion.validate_chunk
+    calls = itertools.count(1)
+
+    def crash(*args):
+        if next(calls) == 3:
+            raise WorkerCrashed()
+        return validate_chunk(*args)
+
+    monkeypatch.setattr(ingestion, 'validate_chunk', crash)
+    with pytest.raises(WorkerCrashed):
+        claim_and_execute()
+    sales_file.refresh_from_db()
+    assert sales_file.status == Status.ASYNC_IN_PROGRESS
+    assert sales_file.checkpoint_rows == 4
+    assert Sale.objects.count() == 4
+
+    # ハートビートが途絶えるまでは他のワーカーに確保されない
+    monkeypatch.setattr(ingestion, 'validate_chunk', validate_chunk)
+    assert claim_and_execute() is False
+    SalesFile.objects.update(heartbeat_at=timezone.now() - timedelta(
+        seconds=settings.SALES_IMPORT_LEASE_SECONDS + 1))
+    assert claim_and_execute() is True
+
+    sales_file.refresh_from_db()
+    assert sales_file.status == Status.ASYNC_PROCESSED
+    assert sales_file.row_count == 5
+    assert sorted(Sale.objects.values_list('quantity', flat=True)) == [1, 2, 3, 4, 5]
+    assert Stock.objects.get().quantity == 85
+
+
+@pytest.mark.django_db
+def test_import_sales_worker_stops_between_chunks(tmp_path, settings):
+    """
+    import_sales --worker: 停止要求を受けた場合はコミット済みのチャンクまでで中断し、
+    未処理に戻して次のワーカーがチェックポイントから再開できること
+    """
+    settings.SALES_IMPORT_CHUNK_SIZE = 2
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=100)
+    path = tmp_path / 'sales.csv'
+    path.write_text('product,date,quantity\n' + ''.join(
+        f'{product.id},2025-04-0{day} 12:00:00,{day}\n' for day in range(1, 6)))
+    sales_file = SalesFile.objects.create(file_name=str(path), status=Status.ASYNC_UNPROCESSED)
+
+    stop = threading.Event()
+    stop.set()
+    assert claim_and_execute(stop) is True
+    sales_file.refresh_from_db()
+    assert (sales_file.status, sales_file.checkpoint_rows) == (Status.ASYNC_UNPROCESSED, 2)
+    assert Sale.objects.count() == 2
+
+    assert claim_and_execute() is True
+    sales_file.refresh_from_db()
+    assert (sales_file.status, sales_file.row_count) == (Status.ASYNC_PROCESSED, 5)
+    assert sorted(Sale.objects.values_list('quantity', flat=True)) == [1, 2, 3, 4, 5]
+
+
+def expire_lease(settings):
+    SalesFile.objects.update(heartbeat_at=timezone.now() - timedelta(
+        seconds=settings.SALES_IMPORT_LEASE_SECONDS + 1))
+
+
+@pytest.mark.django_db
+def test_import_sales_gives_up_after_max_attempts(unprocessed_file, settings, monkeypatch):
+    """
+    import_sales: 取込に失敗した売上ファイルはエラーを記録してハートビートが途絶えた後に再開し、
+    チェックポイントが進まないまま上限まで失敗した場合は失敗にして確保しないこと
+    """
+    settings.SALES_IMPORT_MAX_ATTEMPTS = 2
+
+    def fail(*args):
+        raise RuntimeError('broken file')
+
+    monkeypatch.setattr(ingestion, 'validate_chunk', fail)
+    assert claim_and_execute() is True
+    unprocessed_file.refresh_from_db()
+    assert unprocessed_file.status == Status.ASYNC_IN_PROGRESS
+    assert unprocessed_file.attempts == 1
+    assert unprocessed_file.last_error == 'RuntimeError: broken file'
+    assert claim_and_execute() is False
+
+    expire_lease(settings)
+    assert claim_and_execute() is True
+    unprocessed_file.refresh_from_db()
+    assert (unprocessed_file.status, unprocessed_file.attempts) == (Status.ASYNC_FAILED, 2)
+    expire_lease(settings)
+    assert claim_and_execute() is False
+    assert Sale.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_import_sales_fails_unparsable_file(unprocessed_file):
+    """
+    import_sales: 解析できない売上ファイルは再試行せずに失敗にすること
+    """
+    with open(unprocessed_file.file_name, 'a') as f:
+        f.write('1,"2025-04-21 12:00:00,1\n')
+    assert claim_and_execute() is True
+    unprocessed_file.refresh_from_db()
+    assert (unprocessed_file.status, unprocessed_file.attempts) == (Status.ASYNC_FAILED, 1)
+    assert unprocessed_file.last_error.startswith('InvalidSalesFile: ')
+    assert Sale.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_import_sales_fails_file_that_crashes_workers(unprocessed_file, settings, monkeypatch):
+    """
+    import_sales: 取込中にワーカーが上限回数まで異常終了した売上ファイルは失敗にすること
+    """
+    settings.SALES_IMPORT_MAX_ATTEMPTS = 2
+
+    def crash(*args):
+        raise WorkerCrashed()
+
+    monkeypatch.setattr(ingestion, 'validate_chunk', crash)
+    for _ in range(2):
+        with pytest.raises(WorkerCrashed):
+            claim_and_execute()
+        expire_lease(settings)
+    assert claim_and_execute() is False
+    unprocessed_file.refresh_from_db()
+    assert unprocessed_file.status == Status.ASYNC_FAILED
+    assert unprocessed_file.last_error == 'worker stopped 2 times'
+
+
+@pytest.mark.django_db
+def test_import_sales_resumes_error_report_from_checkpoint(tmp_path, settings, upload_dir,
+                                                          monkeypatch):
+    """
+    import_sales: ロールバックされたチャンクのエラーの行を再開時にエラーレポートから除き、
+    エラーの行を重複して書き出さないこと
+    """
+    settings.SALES_IMPORT_CHUNK_SIZE = 2
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=100)
+    path = tmp_path / 'sales.csv'
+    path.write_text(
+        'product,date,quantity\n'
+        f'{product.id},2025-04-01 12:00:00,1\n'
+        f'{product.id},2025-04-01 12:00:00,-1\n'
+        f'{product.id},2025-04-02 12:00:00,2\n'
+        f'{product.id},2025-04-02 12:00:00,-2\n'
+    )
+    sales_file = SalesFile.objects.create(file_name=str(path), status=Status.ASYNC_UNPROCESSED)
+
+    # 2つ目のチャンクのエラーレポートを書き出した後、コミット前にワーカーを異常終了させる
+    advance = ingestion.advance
+
+    def crash(sales_file, offset, **fields):
+        if fields.get('checkpoint_rows') == 4:
+            raise WorkerCrashed()
+        return advance(sales_file, offset, **fields)
+
+    monkeypatch.setattr(ingestion, 'advance', crash)
+    with pytest.raises(WorkerCrashed):
+        claim_and_execute()
+    monkeypatch.setattr(ingestion, 'advance', advance)
+    expire_lease(settings)
+    assert claim_and_execute() is True
+
+    sales_file.refresh_from_db()
+    assert (sales_file.status, sales_file.error_count) == (Status.ASYNC_PROCESSED, 2)
+    message = 'quantity must be an integer between 0 and 2147483647'
+    assert (upload_dir / sales_file.error_report).read_text().splitlines() == [
+        'row,product,date,quantity,errors',
+        f'2,{product.id},2025-04-01 12:00:00,-1,{message}',
+        f'4,{product.id},2025-04-02 12:00:00,-2,{message}',
+    ]
+
+
+@pytest.mark.django_db
+def test_resume_sales_stops_when_taken_over(unprocessed_file):
+    """
+    resume_sales: 他のワーカーがチェックポイントを進めていた場合はチャンクを取り消すこと
+    """
+    entry = SalesFile.objects.get(pk=unprocessed_file.pk)
+    SalesFile.objects.filter(pk=entry.pk).update(checkpoint_rows=1)
+    with pytest.raises(ingestion.CheckpointLost):
+        ingestion.resume_sales(entry.file_name, entry)
+    assert Sale.objects.count() == 0
+    assert Stock.objects.get().quantity == 10
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_reads_compares_wsgi_and_asgi(capsys):
+    """
+    bench_reads: 同期・非同期のエンドポイントのスループットを出力すること
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10)
+
+    call_command('bench_reads', '--requests', '8', '--workers', '2', '--concurrency', '4',
+                 '--no-cache')
+    out = capsys.readouterr().out
+    assert 'wsgi: concurrency=2 requests=8 rps=' in out
+    assert 'asgi: concurrency=4 requests=8 rps=' in out
+
+
+@pytest.mark.django_db
+def test_bench_loaders_rolls_back(capsys):
+    """
+    bench_loaders: 登録方式ごとの登録件数/秒を出力し、登録した売上は残さないこと
+    """
+    Product.objects.create(name="Test Product", price=1000)
+
+    call_command('bench_loaders', '--rows', '50', '--batch-size', '10')
+    out = capsys.readouterr().out
+    assert 'executemany: rows=50 ' in out
+    assert 'bulk_create: rows=50 ' in out
+    assert 'loaded=50' in out
+    assert not Sale.objects.exists()
+
+
+@pytest.mark.django_db
+def test_bench_sqlite_compares_profiles(capsys):
+    """
+    bench_sqlite: プロファイルごとに同時の読み書きの結果を出力し、tuned ではロックで失敗しないこと
+    """
+    call_command('bench_sqlite', '--writers', '2', '--readers', '2', '--operations', '20')
+    out = capsys.readouterr().out
+    assert 'default write: ok=' in out
+    assert 'default read: ok=' in out
+    assert 'tuned write: ok=40 locked=0 ' in out
+    assert 'tuned read: ok=40 locked=0 ' in out
+
+
+@pytest.mark.django_db
+def test_snapshot_stocks(capsys):
+    """
+    snapshot_stocks: 全商品のスナップショットを作成し、keep 世代より古いものを削除すること
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10, purchase_date="2025-04-01T12:00:00Z")
+
+    for day in range(2, 5):
+        call_command('snapshot_stocks', '--at', f'2025-04-0{day}T00:00:00', '--keep', '2')
+    out = capsys.readouterr().out
+    assert '1 snapshot(s) taken at 2025-04-04T00:00:00+00:00, 1 pruned' in out
+    assert list(StockSnapshot.objects.order_by('taken_at').values_list('taken_at__day', 'quantity')) == [
+        (3, 10), (4, 10)]
+
+    for value in ['yesterday', '2025-13-01T00:00:00']:
+        with pytest.raises(CommandError):
+            call_command('snapshot_stocks', '--at', value)
+
+
+@pytest.mark.django_db
+def test_forecast_sales(capsys):
+    """
+    forecast_sales: 指定した基準日までの売上から全商品の売上予測を保存すること
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    Product.objects.create(name="Other Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10, purchase_date="2025-04-01T12:00:00Z")
+    Sale.objects.create(product=product, quantity=7, sale_date="2025-04-02T12:00:00Z")
+
+    call_command('forecast_sales', '--as-of', '2025-04-02', '--window', '7', '--processes', '1')
+    assert '2 forecast(s) saved' in capsys.readouterr().out
+    forecast = SalesForecast.objects.get(product=product)
+    assert (forecast.as_of.isoformat(), forecast.moving_average) == ('2025-04-02', 1.0)
+
+    for args in [('--as-of', '2025-13-01'), ('--alpha', '0'), ('--window', '0')]:
+        with pytest.raises(CommandError):
+            call_command('forecast_sales', *args)
+
+
+@pytest.mark.django_db
+def test_archive_sales(capsys):
+    """
+    archive_sales: 基準日時より前の売上をアーカイブ済み売上に移動すること
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10, purchase_date="2025-04-01T12:00:00Z")
+    Sale.objects.create(product=product, quantity=3, sale_date="2025-04-02T12:00:00Z")
+    Sale.objects.create(product=product, quantity=2, sale_date="2025-04-04T12:00:00Z")
+
+    call_command('archive_sales', '--before', '2025-04-03T00:00:00', '--batch-size', '1')
+    assert '1 sale(s) archived before 2025-04-03T00:00:00+00:00' in capsys.readouterr().out
+    assert list(ArchivedSale.objects.values_list('quantity', flat=True)) == [3]
+    assert list(Sale.objects.values_list('quantity', flat=True)) == [2]
+    assert Stock.objects.get(product=product).quantity == 5
+
+    with pytest.raises(CommandError):
+        call_command('archive_sales', '--before', 'yesterday')
@@ -0,0 +1,86 @@
+from datetime import date
+
+import numpy as np
+import pytest
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.inventory.forecasts import compute, exponential_smoothing, run_forecasts, sales_matrix
+from api.inventory.models import Product, Purchase, Sale, SalesForecast
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def products():
+    apple = Product.objects.create(name="Apple", price=100)
+    pear = Product.objects.create(name="Pear", price=300)
+    Purchase.objects.create(product=apple, quantity=100, purchase_date="2025-04-01T00:00:00Z")
+    Purchase.objects.create(product=pear, quantity=100, purchase_date="2025-04-01T00:00:00Z")
+    for day, quantity in [(1, 4), (2, 2), (4, 6)]:
+        Sale.objects.create(product=apple, quantity=quantity, sale_date=f"2025-04-0{day}T10:00:00Z")
+    Sale.objects.create(product=pear, quantity=3, sale_date="2025-04-03T10:00:00Z")
+    return apple, pear
+
+
+@pytest.mark.django_db
+def test_sales_matrix(products):
+    """
+    商品 × 日の売上数量の行列を作成すること(売上のない日は0)
+    """
+    apple, pear = products
+    ids, matrix = sales_matrix(date(2025, 4, 2), date(2025, 4, 4))
+    assert ids.tolist() == [apple.id, pear.id]
+    assert matrix.tolist() == [[2, 0, 6], [0, 3, 0]]
+
+
+def test_exponential_smoothing_matches_recurrence():
+    """
+    重みとの積による指数平滑が、漸化式を1日ずつ計算した結果と一致すること
+    """
+    matrix = np.random.default_rng(0).integers(0, 10, size=(5, 30)).astype(float)
+    expected = matrix[:, 0].copy()
+    for day in range(1, matrix.shape[1]):
+        expected = 0.3 * matrix[:, day] + 0.7 * expected
+    assert np.allclose(exponential_smoothing(matrix, 0.3), expected)
+
+
+def test_compute_in_process_pool(settings):
+    """
+    プロセスプールで分割して計算した結果が、1プロセスで計算した結果と一致すること
+    """
+    settings.INVENTORY_FORECAST_CHUNK_SIZE = 3
+    matrix = np.random.default_rng(0).integers(0, 10, size=(10, 30)).astype(float)
+    expected = compute(matrix, 7, 0.3, processes=1)
+    assert expected.shape == (10, 2)
+    assert np.allclose(expected[:, 0], matrix[:, -7:].mean(axis=1))
+    assert np.array_equal(compute(matrix, 7, 0.3, processes=2), expected)
+
+
+@pytest.mark.django_db
+def test_forecasts(client, products, settings):
+    """
+    全商品の売上予測を保存し、再計算した場合は上書きすること
+    """
+    settings.INVENTORY_FORECAST_HISTORY_DAYS = 4
+    apple, pear = products
+
+    assert run_forecasts(date(2025, 4, 4), window=2, alpha=0.5, horizon=10) == 2
+    response = client.get(f'/api/inventory/forecasts/{apple.id}/')
+    assert response.status_code == status.HTTP_200_OK
+    forecast = response.json()
+    # 4, 2, 0, 6 → 4 → 3 → 1.5 → 3.75
+    assert {key: forecast[key] for key in ('as_of', 'moving_average', 'smoothed', 'quantity')} == {
+        'as_of': '2025-04-04', 'moving_average': 3.0, 'smoothed': 3.75, 'quantity': 37.5}
+
+    run_forecasts(date(2025, 4, 5), window=2, alpha=0.5, horizon=10)
+    assert SalesForecast.objects.count() == 2
+    response = client.get('/api/inventory/forecasts/')
+    assert [(row['name'], row['as_of'], row['moving_average']) for row in response.json()] == [
+        ('Apple', '2025-04-05', 3.0), ('Pear', '2025-04-05', 0.0)]
+
+    response = client.get(f'/api/inventory/forecasts/{pear.id + 1}/')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,289 @@
+import hashlib
+import tracemalloc
+from datetime import date
+
+import pandas as pd
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from api.inventory.exceptions import PayloadTooLarge
+from api.inventory.ingestion import COLUMNS, InvalidSalesFile, ingest_sales, read_chunks
+from api.inventory.loaders import load_sales
+from api.inventory.models import (
+    DailySales,
+    MonthlySales,
+    Product,
+    Purchase,
+    Sale,
+    SalesFile,
+    Status,
+    Stock,
+)
+from api.inventory.uploads import store_upload
+
+
+@pytest.fixture
+def sales_csv(tmp_path):
+    path = tmp_path / 'sales.csv'
+    path.write_text(
+        'product,date,quantity\n'
+        '1,2025-04-01 10:00:00,2\n'
+        '2,2025-04-01T11:00:00Z,3\n'
+        '1,2025-04-02 09:30:00,4\n'
+    )
+    return path
+
+
+@pytest.mark.django_db
+def test_ingest_sales_in_chunks(sales_csv):
+    """
+    チャンク単位で取り込み、在庫数量に反映すること
+    """
+    for pk in (1, 2):
+        Product.objects.create(pk=pk, name=f"Product {pk}", price=1000)
+        Purchase.objects.create(product_id=pk, quantity=10)
+    sales_file = SalesFile.objects.create(
+        file_name='sales.csv', status=Status.SYNC)
+
+    result = ingest_sales(sales_csv, sales_file, chunk_size=2, batch_size=1)
+
+    assert result.rows == 3
+    assert Sale.objects.filter(import_file=sales_file).count() == 3
+    assert Stock.objects.get(product_id=1).quantity == 4
+    assert Stock.objects.get(product_id=2).quantity == 7
+    sale = Sale.objects.get(product_id=2)
+    assert sale.sale_date.isoformat() == '2025-04-01T11:00:00+00:00'
+    assert list(DailySales.objects.order_by('date', 'product').values_list(
+        'product', 'date', 'quantity')) == [
+        (1, date(2025, 4, 1), 2), (2, date(2025, 4, 1), 3), (1, date(2025, 4, 2), 4)]
+    assert MonthlySales.objects.get().quantity == 9
+
+
+@pytest.mark.django_db
+def test_ingest_sales_reports_invalid_rows(tmp_path, upload_dir):
+    """
+    不正な行をエラーレポートに書き出し、正しい行のみを取り込むこと
+    """
+    Product.objects.create(pk=1, name="Product 1", price=1000)
+    Purchase.objects.create(product_id=1, quantity=10)
+    path = tmp_path / 'sales.csv'
+    path.write_text(
+        'product,date,quantity\n'
+        '1,2025-04-01 10:00:00,2\n'
+        '9,2025-04-01 10:00:00,1\n'
+        '1,2025-04-01 10:00:00,-1\n'
+        '1,not a date,1.5\n'
+        'x,2025-04-02 10:00:00,abc\n'
+        '1,2025-04-02T10:00:00Z,3\n'
+    )
+    sales_file = SalesFile.objects.create(file_name='sales.csv', status=Status.SYNC)
+
+    result = ingest_sales(path, sales_file, chunk_size=4)
+
+    assert (result.rows, result.errors) == (6, 4)
+    assert sorted(Sale.objects.values_list('quantity', flat=True)) == [2, 3]
+    assert Stock.objects.get(product_id=1).quantity == 5
+    sales_file.refresh_from_db()
+    assert (sales_file.row_count, sales_file.error_count) == (6, 4)
+    assert (upload_dir / sales_file.error_report).read_text().splitlines() == [
+        'row,product,date,quantity,errors',
+        '2,9,2025-04-01 10:00:00,1,unknown product',
+        '3,1,2025-04-01 10:00:00,-1,quantity must be an integer between 0 and 2147483647',
+        '4,1,not a date,1.5,quantity must be an integer between 0 and 2147483647; invalid date',
+        '5,x,2025-04-02 10:00:00,abc,unknown product; quantity must be an integer between 0 and 2147483647',
+    ]
+
+
+@pytest.mark.django_db
+def test_ingest_sales_rejects_extra_fields(tmp_path, upload_dir):
+    """
+    ヘッダーより列の多い行はエラーレポートに書き出し、取り込まないこと
+    """
+    Product.objects.create(pk=1, name="Product 1", price=1000)
+    Purchase.objects.create(product_id=1, quantity=10)
+    path = tmp_path / 'sales.csv'
+    path.write_text(
+        'product,date,quantity\n'
+        '1,2025-04-01 10:00:00,2\n'
+        '1,2025-04-01 10:00:00,1,9\n'
+        '1,2025-04-01 10:00:00,4,a,b\n'
+        '1,2025-04-02 10:00:00,3,\n'
+    )
+    sales_file = SalesFile.objects.create(file_name='sales.csv', status=Status.SYNC)
+
+    result = ingest_sales(path, sales_file, chunk_size=2)
+
+    assert (result.rows, result.errors) == (4, 2)
+    assert sorted(Sale.objects.values_list('quantity', flat=True)) == [2, 3]
+    assert (upload_dir / sales_file.error_report).read_text().splitlines() == [
+        'row,product,date,quantity,errors',
+        '2,1,2025-04-01 10:00:00,1,too many fields',
+        '3,1,2025-04-01 10:00:00,4,too many fields',
+    ]
+
+
+@pytest.mark.parametrize('content', [
+    b'product,date,quantity\n1,"2025-04-01 10:00:00,1\n',
+    b'product,date,quantity\n' + b'1,2025-04-01 10:00:00,1\n' * 1000 + b'1,\xff\xfe,1\n',
+    b'product,date,quantity,product\n1,2025-04-01 10:00:00,1,1\n',
+])
+def test_read_chunks_invalid_file(tmp_path, content):
+    """
+    read_chunks: 解析できないファイルは InvalidSalesFile を送出すること
+    """
+    path = tmp_path / 'sales.csv'
+    path.write_bytes(content)
+    with pytest.raises(InvalidSalesFile):
+        list(read_chunks(path, 10))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('policy, imported, stock', [('reject', [2], 5), ('flag', [2, 4, 5], -4)])
+def test_ingest_sales_checks_stock(tmp_path, upload_dir, settings, django_assert_max_num_queries,
+                                   policy, imported, stock):
+    """
+    商品ごとの売上数量の合計が在庫数量を超える商品の行を除外(reject)・記録(flag)すること
+    """
+    settings.SALES_IMPORT_STOCK_POLICY = policy
+    for pk, quantity in [(1, 10), (2, 5)]:
+        Product.objects.create(pk=pk, name=f"Product {pk}", price=1000)
+        Purchase.objects.create(product_id=pk, quantity=quantity)
+    path = tmp_path / 'sales.csv'
+    path.write_text(
+        'product,date,quantity\n'
+        '1,2025-04-01 10:00:00,2\n'
+        '2,2025-04-01 10:00:00,4\n'
+        '2,2025-04-01 11:00:00,5\n'
+    )
+    sales_file = SalesFile.objects.create(file_name='sales.csv', status=Status.SYNC)
+
+    # 行数によらず商品ごとにまとめて在庫数量を確認する
+    with django_assert_max_num_queries(12):
+        ingest_sales(path, sales_file)
+
+    assert sorted(Sale.objects.values_list('quantity', flat=True)) == imported
+    assert Stock.objects.get(product_id=2).quantity == stock
+    sales_file.refresh_from_db()
+    assert sales_file.stock_overruns == 2
+    assert sales_file.error_count == (2 if policy == 'reject' else 0)
+    message = 'exceeds stock' if policy == 'reject' else 'exceeds stock (imported)'
+    assert (upload_dir / sales_file.error_report).read_text().splitlines()[1:] == [
+        f'2,2,2025-04-01 10:00:00,4,{message}',
+        f'3,2,2025-04-01 11:00:00,5,{message}',
+    ]
+
+
+@pytest.mark.django_db
+def test_ingest_sales_rejects_out_of_range_values(tmp_path, upload_dir):
+    """
+    int64 に変換できない・IntegerField を超える商品ID・数量の行をエラーにすること
+    """
+    Product.objects.create(pk=1, name="Product 1", price=1000)
+    Purchase.objects.create(product_id=1, quantity=10)
+    path = tmp_path / 'sales.csv'
+    path.write_text(
+        'product,date,quantity\n'
+        '1,2025-04-01 10:00:00,99999999999999999999\n'
+        '1,2025-04-01 10:00:00,1e30\n'
+        '1,2025-04-01 10:00:00,2147483648\n'
+        '99999999999999999999,2025-04-01 10:00:00,1\n'
+        '1,2025-04-01 10:00:00,2\n'
+    )
+    sales_file = SalesFile.objects.create(file_name='sales.csv', status=Status.SYNC)
+
+    result = ingest_sales(path, sales_file)
+
+    assert (result.rows, result.errors) == (5, 4)
+    assert list(Sale.objects.values_list('quantity', flat=True)) == [2]
+    assert Stock.objects.get(product_id=1).quantity == 8
+    message = 'quantity must be an integer between 0 and 2147483647'
+    assert (upload_dir / sales_file.error_report).read_text().splitlines() == [
+        'row,product,date,quantity,errors',
+        f'1,1,2025-04-01 10:00:00,99999999999999999999,{message}',
+        f'2,1,2025-04-01 10:00:00,1e30,{message}',
+        f'3,1,2025-04-01 10:00:00,2147483648,{message}',
+        '4,99999999999999999999,2025-04-01 10:00:00,1,unknown product',
+    ]
+
+
+def test_store_upload_streams_chunks(settings, upload_dir):
+    """
+    store_upload: チャンクごとに書き込み、SHA-256とサイズを計算すること
+    サイズが不明なファイルも書き込み中に上限を超えた時点で中断すること
+    """
+    content = b'product,date,quantity\n' + b'1,2025-04-01 10:00:00,2\n' * 100
+    upload = SimpleUploadedFile('sales.csv', content)
+    upload.DEFAULT_CHUNK_SIZE = 64
+    stored = store_upload(upload)
+    assert stored.size == len(content)
+    assert stored.digest == hashlib.sha256(content).hexdigest()
+    assert (upload_dir / stored.stored_name).read_bytes() == content
+
+    settings.SALES_UPLOAD_MAX_SIZE = 100
+    upload = SimpleUploadedFile('sales.csv', content)
+    upload.DEFAULT_CHUNK_SIZE = 64
+    upload.size = None
+    with pytest.raises(PayloadTooLarge):
+        store_upload(upload)
+    assert [path.name for path in upload_dir.iterdir()] == [stored.stored_name]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('loader', ['executemany', 'bulk_create'])
+def test_load_sales_matches_orm(loader):
+    """
+    どの登録方式でも、ORMで保存した場合と同じ日時で検索・取得できること
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    sales_file = SalesFile.objects.create(file_name='sales.csv', status=Status.SYNC)
+    frame = pd.DataFrame({
+        'product': [product.id, product.id],
+        'quantity': [2, 3],
+        'date': pd.to_datetime(['2025-04-01 10:00:00', '2025-04-01 10:00:00.250000'],
+                               format='ISO8601', utc=True),
+    })
+
+    load_sales(frame, sales_file.id, batch_size=1, loader=loader)
+
+    sales = Sale.objects.filter(import_file=sales_file).order_by('sale_date')
+    assert [(sale.quantity, sale.sale_date.isoformat()) for sale in sales] == [
+        (2, '2025-04-01T10:00:00+00:00'), (3, '2025-04-01T10:00:00.250000+00:00')]
+    assert Sale.objects.filter(sale_date=frame['date'][0].to_pydatetime()).count() == 1
+    assert Sale.objects.filter(sale_date__gt=frame['date'][0].to_pydatetime()).count() == 1
+
+
+@pytest.mark.parametrize('skip_rows', [1, 2, 3, 4, 5])
+def test_read_chunks_skips_rows(tmp_path, skip_rows):
+    """
+    read_chunks: 空行・複数行の値を含むファイルでも、先頭から読んだ場合と同じ行から再開すること
+    """
+    path = tmp_path / 'sales.csv'
+    path.write_text(
+        '﻿product,date,quantity,note\n'
+        '1,2025-04-01 10:00:00,1,a\n'
+        '\n'
+        '2,2025-04-01 10:00:00,2,"multi\nline"\n'
+        '3,2025-04-01 10:00:00,3,b\n'
+        '4,2025-04-01 10:00:00,4,c\n'
+    )
+    rows = pd.concat(read_chunks(path, 2))
+    resumed = list(read_chunks(path, 2, skip_rows=skip_rows))
+    assert all(len(chunk) for chunk in resumed)
+    assert [row for chunk in resumed for row in chunk[COLUMNS].to_dict('records')] == (
+        rows.iloc[skip_rows:][COLUMNS].to_dict('records'))
+
+
+def test_read_chunks_skip_memory(tmp_path):
+    """
+    read_chunks: 読み飛ばす行数によらず一定のメモリで再開すること
+    """
+    path = tmp_path / 'sales.csv'
+    path.write_text('product,date,quantity\n' + '1,2025-04-01 10:00:00,1\n' * 200000)
+    tracemalloc.start()
+    try:
+        chunks = list(read_chunks(path, 10, skip_rows=199990))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert sum(len(chunk) for chunk in chunks) == 10
+    assert peak < 1024 * 1024
@@ -0,0 +1,176 @@
+import re
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+import pytest
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.inventory.archive import archive_sales
+from api.inventory.models import Product, Purchase, Sale, SalesFile, Status
+
+# 部分インデックスは条件に一致する行だけを含むため、全体を走査しても全件走査とみなさない
+PARTIAL_INDEXES = '|'.join(
+    index.name for model in apps.get_app_config('inventory').get_models()
+    for index in model._meta.indexes if index.condition is not None)
+
+# 検索条件(col=? など)を伴わない走査は、インデックスを使う場合も全件走査とみなす
+FULL_SCAN = {
+    'sqlite': re.compile(
+        rf'^SCAN (?!CONSTANT ROW)(?!\w+ USING (?:COVERING )?INDEX (?:{PARTIAL_INDEXES})$)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+SORT = {
+    'sqlite': re.compile(r'^USE TEMP B-TREE FOR (?:\w+ )*ORDER BY$'),
+    'postgresql': re.compile(r'^(?:->\s*)?Sort\b'),
+}
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def history():
+    products = [Product.objects.create(name=f"Product {i}", price=1000) for i in range(3)]
+    for product in products:
+        for day in range(1, 4):
+            Purchase.objects.create(product=product, quantity=10,
+                                    purchase_date=f"2025-04-0{day}T12:00:00Z")
+            Sale.objects.create(product=product, quantity=1,
+                                sale_date=f"2025-04-0{day}T13:00:00Z")
+    return products
+
+
+def explain(sql, params=None):
+    """
+    SQLの実行計画を1行ずつ返す
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            # 件数の少ないテストデータでもインデックスが使えるかを確認する
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+    pytest.skip(f'EXPLAIN is not supported for {connection.vendor}')
+
+
+def full_scans(sql, allow_sort=False, params=None):
+    """
+    実行計画のうちテーブル全体を走査している行(allow_sort=False の場合はソートも)を返す
+    """
+    patterns = [FULL_SCAN[connection.vendor]]
+    if not allow_sort:
+        patterns.append(SORT[connection.vendor])
+    return [line for line in explain(sql, params)
+            if any(pattern.search(line.strip()) for pattern in patterns)]
+
+
+def assert_no_full_scan(request, allow_sort=False):
+    """
+    リクエストで発行されたSELECT文がいずれも全件走査にならず、
+    (allow_sort=False の場合は)インデックスの順に読み出すことを確認する
+    """
+    with CaptureQueriesContext(connection) as context:
+        response = request()
+    assert response.status_code < 400
+    selects = [query['sql'] for query in context.captured_queries
+               if query['sql'].lstrip().upper().startswith('SELECT')]
+    assert selects
+    for sql in selects:
+        assert full_scans(sql, allow_sort) == [], sql
+    return response
+
+
+@pytest.mark.django_db
+def test_product_detail_plan(client, history):
+    assert_no_full_scan(lambda: client.get(f'/api/inventory/products/{history[1].id}/'))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('path', ['/api/inventory/products/', '/api/inventory/products/model/'])
+def test_product_page_plan(client, history, path):
+    first = client.get(path, {'page_size': 1})
+    assert_no_full_scan(lambda: client.get(first.data['next']))
+
+
+@pytest.mark.django_db
+def test_inventory_plan(client, history):
+    path = f'/api/inventory/inventories/{history[1].id}/'
+    assert_no_full_scan(lambda: client.get(path))
+    assert_no_full_scan(lambda: client.get(path, {'date_from': '2025-04-02T00:00:00Z'}))
+    first = client.get(path, {'page_size': 2})
+    assert_no_full_scan(lambda: client.get(first.data['next']))
+
+
+@pytest.mark.django_db
+def test_sale_stock_check_plan(client, history):
+    assert_no_full_scan(lambda: client.post(
+        '/api/inventory/sales/', data={'product': history[1].id, 'quantity': 1}, format='json'))
+
+
+@pytest.mark.django_db
+def test_summary_plan(client, history):
+    Sale.objects.create(product=history[0], quantity=1, sale_date="2025-05-01T13:00:00Z")
+    # ページ分割しない場合はすべての月を読むため、ページ分割した場合のみ確認する
+    first = client.get('/api/inventory/summary/', {'page_size': 1})
+    assert_no_full_scan(lambda: client.get(first.data['next']))
+
+
+@pytest.mark.django_db
+def test_unprocessed_sales_file_plan(history):
+    SalesFile.objects.create(file_name='sales.csv', status=Status.ASYNC_PROCESSED)
+    queryset = SalesFile.objects.filter(status=Status.ASYNC_UNPROCESSED).order_by('id')
+    assert full_scans(str(queryset.query)) == []
+
+
+@pytest.mark.django_db
+def test_interrupted_sales_file_plan(history):
+    SalesFile.objects.create(file_name='sales.csv', status=Status.ASYNC_PROCESSED)
+    queryset = SalesFile.objects.filter(
+        status=Status.ASYNC_IN_PROGRESS, heartbeat_at__lt=timezone.now()).order_by('heartbeat_at')
+    sql, params = queryset.query.sql_with_params()
+    assert full_scans(sql, params=params) == []
+
+
+@pytest.mark.django_db
+def test_stock_at_plan(client, history):
+    """
+    指定日時の在庫数量: 商品のスナップショット・仕入・売上をインデックスで読むこと
+    """
+    assert_no_full_scan(lambda: client.get(
+        f'/api/inventory/inventories/{history[0].id}/stock/', {'at': '2025-04-02T12:30:00Z'}))
+
+
+@pytest.mark.django_db
+def test_low_stock_plan(client, history):
+    """
+    在庫僅少の一覧: 在庫数量が発注点以下の商品を部分インデックスだけで読むこと
+    """
+    for product in history[:2]:
+        product.reorder_point = 100
+        product.save()
+    assert_no_full_scan(lambda: client.get('/api/inventory/low-stock/'))
+    first = client.get('/api/inventory/low-stock/', {'page_size': 1})
+    assert_no_full_scan(lambda: client.get(first.data['next']))
+
+
+@pytest.mark.django_db
+def test_archived_inventory_plan(client, history):
+    """
+    アーカイブ後の仕入・売上: アーカイブ済み売上もインデックスで読むこと
+    """
+    archive_sales(datetime(2025, 4, 2, tzinfo=dt_timezone.utc), batch_size=100)
+    path = f'/api/inventory/inventories/{history[1].id}/'
+    assert_no_full_scan(lambda: client.get(path))
+    assert_no_full_scan(lambda: client.get(path, {'date_from': '2025-04-01T00:00:00Z'}))
+    first = client.get(path, {'page_size': 2})
+    assert_no_full_scan(lambda: client.get(first.data['next']))
@@ -1,13 +1,21 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
 
 import pytest
+from django.db.models import F, Value
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
 
-from api.inventory.models import Product
+from api.inventory import renderers
+from api.inventory.models import MonthlySales, Product, Purchase, Sale
+from api.inventory.renderers import FastJSONRenderer
 from api.inventory.serializers import (
     InventorySerializer,
     ProductSerializer,
     PurchaseSerializer,
     SaleSerializer,
+    SalesSerializer,
 )
 
 
@@ -107,3 +115,114 @@ def test_inventory_serializer(inventory_data, is_valid):
         assert validated_data["unit"] == inventory_data["unit"]
         assert validated_data["quantity"] == inventory_data["quantity"]
         assert validated_data["type"] == inventory_data["type"]
+
+
+def slow(serializer_class, rows):
+    """
+    DRF の ListSerializer で変換した結果
+    """
+    return serializers.ListSerializer(rows, child=serializer_class()).data
+
+
+def render(renderer, data, accepted_media_type=None):
+    return renderer.render(data, accepted_media_type, {})
+
+
+ROWS = [
+    {'id': 1, 'unit': 100, 'quantity': 3, 'type': '1',
+     'date': datetime(2025, 4, 1, 12, 0, tzinfo=dt_timezone.utc)},
+    {'id': 2, 'unit': 100, 'quantity': 1, 'type': '2',
+     'date': datetime(2025, 4, 1, 12, 0, 0, 123456, tzinfo=dt_timezone(timedelta(hours=9)))},
+    {'id': 3, 'unit': None, 'quantity': 1, 'type': 2, 'date': None},
+    {'id': 4, 'unit': 100, 'quantity': 1, 'type': '2', 'date': datetime(2025, 4, 2, 9, 30)},
+]
+
+
+@pytest.mark.parametrize('tz', ['UTC', 'Asia/Tokyo'])
+def test_inventory_serializer_matches_drf(settings, tz):
+    """
+    InventorySerializer: ListSerializer と同じ出力になること
+    """
+    settings.TIME_ZONE = tz
+    with timezone.override(tz):
+        fast = InventorySerializer(ROWS, many=True).data
+        assert fast == slow(InventorySerializer, ROWS)
+        assert render(JSONRenderer(), fast) == render(JSONRenderer(), slow(InventorySerializer, ROWS))
+
+
+@pytest.mark.django_db
+def test_sales_serializer_matches_drf():
+    """
+    SalesSerializer: .values() の行を ListSerializer と同じ出力に変換すること
+    """
+    MonthlySales.objects.create(month=datetime(2025, 3, 1, tzinfo=dt_timezone.utc), quantity=5, count=1)
+    MonthlySales.objects.create(month=datetime(2025, 4, 1, tzinfo=dt_timezone.utc), quantity=7, count=2)
+    rows = list(MonthlySales.objects.values(
+        monthly_date=F('month'), monthly_price=F('quantity')).order_by('monthly_date'))
+
+    assert SalesSerializer(rows, many=True).data == slow(SalesSerializer, rows)
+    assert SalesSerializer(rows, many=True).data == [
+        {'monthly_date': '2025-03', 'monthly_price': 5},
+        {'monthly_date': '2025-04', 'monthly_price': 7},
+    ]
+
+
+@pytest.mark.django_db
+def test_inventory_queryset_matches_drf():
+    """
+    InventorySerializer: 仕入・売上の union クエリを ListSerializer と同じ出力に変換すること
+    """
+    product = Product.objects.create(name='Product', price=1000)
+    Purchase.objects.create(product=product, quantity=10, purchase_date='2025-04-01T12:00:00.5Z')
+    Sale.objects.create(product=product, quantity=1, sale_date='2025-04-02T12:00:00Z')
+    purchases = Purchase.objects.values(
+        'id', 'quantity', type=Value('1'), date=F('purchase_date'), unit=F('product__price'))
+    sales = Sale.objects.values(
+        'id', 'quantity', type=Value('2'), date=F('sale_date'), unit=F('product__price'))
+    queryset = purchases.union(sales).order_by(F('date'), 'type', 'id')
+
+    assert InventorySerializer(queryset, many=True).data == slow(InventorySerializer, queryset)
+
+
+@pytest.mark.parametrize('data', [
+    [{'name': 'ホワイトボード', 'price': 1, 'note': 'a b c'}],
+    {'results': [1.5, -2, None, True], 'next': 'http://testserver/?cursor=a%2Bb'},
+    {'large': 2 ** 70, 'nested': {'list': [[], {}]}},
+    {'exponent': [1e16, 1e-7, 0.7 ** 30, -2.5e-300], 'decimal': Decimal('0.1')},
+    {'dates': [datetime(2025, 4, 1, tzinfo=dt_timezone.utc)], 'delta': timedelta(seconds=1.5)},
+    None,
+])
+def test_fast_renderer_matches_drf(data):
+    """
+    FastJSONRenderer: JSONRenderer と同じバイト列を出力すること
+    """
+    assert render(FastJSONRenderer(), data) == render(JSONRenderer(), data)
+    assert (render(FastJSONRenderer(), data, 'application/json; indent=4')
+            == render(JSONRenderer(), data, 'application/json; indent=4'))
+
+
+@pytest.mark.parametrize('data', [{'value': float('nan')}, [float('inf')]])
+def test_fast_renderer_rejects_nan(data):
+    """
+    FastJSONRenderer: JSONRenderer と同じく NaN・無限大を変換しないこと
+    """
+    with pytest.raises(ValueError):
+        render(JSONRenderer(), data)
+    with pytest.raises(ValueError):
+        render(FastJSONRenderer(), data)
+
+
+def test_fast_renderer_uses_orjson(monkeypatch):
+    """
+    FastJSONRenderer: コンパクトな出力は orjson で変換すること
+    """
+    calls = []
+    dumps = renderers.orjson.dumps
+
+    def spy(*args, **kwargs):
+        calls.append(args[0])
+        return dumps(*args, **kwargs)
+
+    monkeypatch.setattr(renderers.orjson, 'dumps', spy)
+    assert render(FastJSONRenderer(), {'price': 1}) == b'{"price":1}'
+    assert calls == [{'price': 1}]
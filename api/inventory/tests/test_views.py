@@ -1,8 +1,30 @@
+import csv
+import hashlib
+import io
+import json
+from datetime import datetime, timezone
+
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from api.inventory.models import Product, Purchase, Sale
+from api.inventory import metrics
+from api.inventory.cache import PRODUCTS, _version_key
+from api.inventory.models import (
+    MonthlySales,
+    Product,
+    Purchase,
+    Sale,
+    SalesFile,
+    Status,
+    Stock,
+    StockSnapshot,
+)
+from api.inventory.stocks import take_snapshots
 
 
 @pytest.fixture
@@ -155,6 +177,29 @@ def test_delete_product(client):
     assert Product.objects.count() == 0
 
 
+@pytest.mark.django_db
+def test_delete_product_with_history(client, django_assert_max_num_queries):
+    """
+    ProductView: 履歴のある商品を仕入・売上の件数によらない少数のクエリで削除し、
+    月次集計から削除した商品の売上を減算すること
+    """
+    product, other = [Product.objects.create(name=f"Product {i}", price=1000) for i in range(2)]
+    Purchase.objects.create(product=other, quantity=10)
+    Sale.objects.create(product=other, quantity=3, sale_date="2025-04-01T10:00:00Z")
+    for day in range(1, 29):
+        Purchase.objects.create(product=product, quantity=2)
+        Sale.objects.create(product=product, quantity=1, sale_date=f"2025-04-{day:02}T10:00:00Z")
+        Sale.objects.create(product=product, quantity=1, sale_date=f"2025-05-{day:02}T10:00:00Z")
+    take_snapshots(datetime(2025, 6, 1, tzinfo=timezone.utc))
+
+    with django_assert_max_num_queries(25):
+        response = client.delete(f'/api/inventory/products/{product.id}/')
+    assert response.status_code == status.HTTP_200_OK
+    assert list(Stock.objects.values_list('product_id', 'quantity')) == [(other.id, 7)]
+    assert list(StockSnapshot.objects.values_list('product_id', flat=True)) == [other.id]
+    assert sorted(MonthlySales.objects.values_list('quantity', 'count')) == [(0, 0), (3, 1)]
+
+
 @pytest.mark.django_db
 def test_delete_product_with_invalid_id(client):
     """
@@ -234,6 +279,21 @@ def test_create_sale_with_insufficient_stock(client):
     }
     response = client.post('/api/inventory/sales/', data=data, format='json')
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert Stock.objects.get(product=product).quantity == 5
+
+
+@pytest.mark.django_db
+def test_create_purchase_and_sale_update_stock(client):
+    """
+    PurchaseView/SaleView: 登録時に在庫数量が更新されること
+    """
+    product = Product.objects.create(
+        name="Test Product", price=1000, description="Description")
+    client.post('/api/inventory/purchases/',
+                data={"product": product.id, "quantity": 20}, format='json')
+    client.post('/api/inventory/sales/',
+                data={"product": product.id, "quantity": 8}, format='json')
+    assert Stock.objects.get(product=product).quantity == 12
 
 
 @pytest.mark.django_db
@@ -260,3 +320,688 @@ def test_get_inventory_with_invalid_id(client):
     response = client.get('/api/inventory/inventories/999/')
     assert response.status_code == status.HTTP_200_OK
     assert len(response.data) == 0
+
+
+@pytest.mark.django_db
+def test_sync_sales_file(client):
+    """
+    SalesSyncView: アップロードしたCSVが即時に取り込まれること
+    """
+    product = Product.objects.create(
+        name="Test Product", price=1000, description="Description")
+    Purchase.objects.create(product=product, quantity=10)
+    upload = SimpleUploadedFile(
+        'sales.csv', f'product,date,quantity\n{product.id},2025-04-21 12:00:00,3\n'.encode())
+    response = client.post('/api/inventory/sync/', data={'file': upload})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert SalesFile.objects.get().status == Status.SYNC
+    assert Sale.objects.get().quantity == 3
+
+
+@pytest.mark.django_db
+def test_async_sales_file(client, upload_dir):
+    """
+    SalesAsyncView: アップロードしたCSVが未処理として登録されること
+    同名のファイルを続けてアップロードしても別のファイルとして保存されること
+    """
+    for day in range(1, 3):
+        upload = SimpleUploadedFile(
+            '../sales.csv', f'product,date,quantity\n1,2025-04-0{day} 12:00:00,1\n'.encode())
+        response = client.post('/api/inventory/async/', data={'file': upload})
+        assert response.status_code == status.HTTP_201_CREATED
+    sales_files = list(SalesFile.objects.order_by('id'))
+    assert [sales_file.status for sales_file in sales_files] == [Status.ASYNC_UNPROCESSED] * 2
+    assert [sales_file.file_name for sales_file in sales_files] == ['sales.csv'] * 2
+    assert sales_files[0].stored_name != sales_files[1].stored_name
+    assert sorted(path.name for path in upload_dir.iterdir()) == sorted(
+        sales_file.stored_name for sales_file in sales_files)
+    assert (upload_dir / sales_files[0].stored_name).read_bytes().startswith(b'product,')
+    assert Sale.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_duplicate_upload_returns_original(client, upload_dir):
+    """
+    SalesSyncView / SalesAsyncView: 同じ内容・同じ冪等キーの再アップロードは
+    取り込まずに登録済みの売上ファイルを返すこと
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10)
+    content = f'product,date,quantity\n{product.id},2025-04-21 12:00:00,3\n'.encode()
+
+    response = client.post('/api/inventory/sync/',
+                           data={'file': SimpleUploadedFile('sales.csv', content)})
+    assert response.status_code == status.HTTP_201_CREATED
+    original = response.data
+    assert original['row_count'] == 1
+    assert original['digest'] == hashlib.sha256(content).hexdigest()
+
+    for path in ['/api/inventory/sync/', '/api/inventory/async/']:
+        response = client.post(path, data={'file': SimpleUploadedFile('retry.csv', content)})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == original
+    assert Sale.objects.count() == 1
+    assert Stock.objects.get(product=product).quantity == 7
+    assert len(list(upload_dir.iterdir())) == 1
+
+    response = client.post('/api/inventory/async/', HTTP_IDEMPOTENCY_KEY='pos-1-0001', data={
+        'file': SimpleUploadedFile('sales.csv', b'product,date,quantity\n')})
+    assert response.status_code == status.HTTP_201_CREATED
+    retried = client.post('/api/inventory/async/', HTTP_IDEMPOTENCY_KEY='pos-1-0001', data={
+        'file': SimpleUploadedFile('sales.csv', b'product,date,quantity\n\n')})
+    assert retried.status_code == status.HTTP_200_OK
+    assert retried.data['id'] == response.data['id']
+    assert SalesFile.objects.count() == 2
+
+    response = client.post('/api/inventory/async/', HTTP_IDEMPOTENCY_KEY='k' * 256, data={
+        'file': SimpleUploadedFile('sales.csv', b'product,date,quantity\n\n')})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_duplicate_upload_requeues_failed_file(client, upload_dir, django_capture_on_commit_callbacks):
+    """
+    SalesAsyncView: 取込に失敗した売上ファイルと同じ内容の再アップロードは、
+    アップロードし直したファイルでチェックポイントから再開させること
+    """
+    content = b'product,date,quantity\n1,2025-04-21 12:00:00,3\n'
+    response = client.post('/api/inventory/async/', HTTP_IDEMPOTENCY_KEY='pos-1-0001',
+                           data={'file': SimpleUploadedFile('sales.csv', content)})
+    assert response.status_code == status.HTTP_201_CREATED
+    SalesFile.objects.filter(pk=response.data['id']).update(
+        status=Status.ASYNC_FAILED, checkpoint_rows=1, attempts=3, last_error='broken')
+    previous = upload_dir / SalesFile.objects.get().stored_name
+
+    for key in ['pos-1-0001', 'pos-1-0002']:
+        with django_capture_on_commit_callbacks(execute=True):
+            retried = client.post('/api/inventory/async/', HTTP_IDEMPOTENCY_KEY=key,
+                                  data={'file': SimpleUploadedFile('retry.csv', content)})
+        assert retried.status_code == status.HTTP_200_OK
+        assert retried.data['id'] == response.data['id']
+        sales_file = SalesFile.objects.get()
+        assert (sales_file.status, sales_file.checkpoint_rows, sales_file.attempts,
+                sales_file.last_error) == (Status.ASYNC_UNPROCESSED, 1, 0, '')
+        assert [path.name for path in upload_dir.iterdir()] == [sales_file.stored_name]
+        assert not previous.exists()
+        SalesFile.objects.update(status=Status.ASYNC_FAILED)
+        previous = upload_dir / sales_file.stored_name
+
+    # 冪等キーが一致しても内容が異なる場合は再開させない
+    retried = client.post('/api/inventory/async/', HTTP_IDEMPOTENCY_KEY='pos-1-0001', data={
+        'file': SimpleUploadedFile('other.csv', content + b'1,2025-04-22 12:00:00,1\n')})
+    assert retried.status_code == status.HTTP_200_OK
+    assert SalesFile.objects.get().status == Status.ASYNC_FAILED
+    assert [path.name for path in upload_dir.iterdir()] == [previous.name]
+
+
+@pytest.mark.django_db
+def test_sync_sales_file_with_invalid_rows(client):
+    """
+    SalesSyncView / SalesFileErrorsView: 不正な行を除いて取り込み、エラーレポートを返すこと
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10)
+    upload = SimpleUploadedFile('sales.csv', (
+        'product,date,quantity\n'
+        f'{product.id},2025-04-21 12:00:00,3\n'
+        f'{product.id + 1},2025-04-21 12:00:00,3\n').encode())
+    response = client.post('/api/inventory/sync/', data={'file': upload})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert (response.data['row_count'], response.data['error_count']) == (2, 1)
+    assert Sale.objects.get().quantity == 3
+
+    response = client.get(f"/api/inventory/sales-files/{response.data['id']}/errors/")
+    assert response.status_code == status.HTTP_200_OK
+    assert b''.join(response.streaming_content).decode().splitlines()[1:] == [
+        f'2,{product.id + 1},2025-04-21 12:00:00,3,unknown product',
+    ]
+
+    sales_file = SalesFile.objects.create(file_name='sales.csv', status=Status.SYNC)
+    response = client.get(f'/api/inventory/sales-files/{sales_file.id}/errors/')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_upload_too_large(client, settings, upload_dir):
+    """
+    SalesSyncView / SalesAsyncView: 上限を超えるファイルは413を返し、何も保存しないこと
+    """
+    settings.SALES_UPLOAD_MAX_SIZE = 10
+    for path in ['/api/inventory/sync/', '/api/inventory/async/']:
+        upload = SimpleUploadedFile('sales.csv', b'product,date,quantity\n')
+        response = client.post(path, data={'file': upload})
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert SalesFile.objects.count() == 0
+    assert not upload_dir.exists() or not any(upload_dir.iterdir())
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('content, missing', [
+    (b'product,sale_date,quantity\n1,2025-04-01 10:00:00,1\n', 'date'),
+    (b'1,2025-04-01 10:00:00,1\n', 'product, date, quantity'),
+    (b'product;date;quantity\n', 'product, date, quantity'),
+    (b'\n', 'product, date, quantity'),
+])
+def test_upload_missing_columns(client, upload_dir, content, missing):
+    """
+    SalesSyncView / SalesAsyncView: ヘッダーに必要な列がないファイルは400で不足する列を返し、
+    何も保存しないこと
+    """
+    for path in ['/api/inventory/sync/', '/api/inventory/async/']:
+        upload = SimpleUploadedFile('sales.csv', content)
+        response = client.post(path, data={'file': upload})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json() == {'file': [f'Missing columns: {missing}.']}
+    assert SalesFile.objects.count() == 0
+    assert not upload_dir.exists() or not any(upload_dir.iterdir())
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('content', [
+    b'product,date,quantity\n1,"2025-04-21 12:00:00,1\n',
+    b'product,date,quantity\n' + b'1,2025-04-21 12:00:00,1\n' * 1000 + b'1,\xff\xfe,1\n',
+])
+def test_upload_unparsable_sync(client, upload_dir, content):
+    """
+    SalesSyncView: 解析できないファイルは400を返し、何も保存しないこと
+    """
+    Product.objects.create(pk=1, name="Test Product", price=1000)
+    upload = SimpleUploadedFile('sales.csv', content)
+    response = client.post('/api/inventory/sync/', data={'file': upload})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()['file'][0].startswith('Invalid CSV: ')
+    assert SalesFile.objects.count() == 0
+    assert Sale.objects.count() == 0
+    assert not any(upload_dir.iterdir())
+
+
+@pytest.mark.django_db
+def test_get_sales_summary(client):
+    """
+    SalesList: 月次の売上数量が集計表から返されること
+    """
+    product = Product.objects.create(
+        name="Test Product", price=1000, description="Description")
+    Purchase.objects.create(product=product, quantity=100)
+    Sale.objects.create(product=product, quantity=5,
+                        sale_date="2025-04-21T12:00:00Z")
+    Sale.objects.create(product=product, quantity=3,
+                        sale_date="2025-04-30T23:59:59Z")
+    sale = Sale.objects.create(product=product, quantity=7,
+                               sale_date="2025-05-01T00:00:00Z")
+    sale.delete()
+    Sale.objects.create(product=product, quantity=2,
+                        sale_date="2025-06-01T00:00:00Z")
+    response = client.get('/api/inventory/summary/')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"monthly_date": "2025-04", "monthly_price": 8},
+        {"monthly_date": "2025-06", "monthly_price": 2},
+    ]
+
+
+@pytest.mark.django_db
+def test_get_products_with_cursor(client):
+    """
+    ProductView: page_size指定時にカーソルでページ分割されること
+    """
+    for i in range(5):
+        Product.objects.create(name=f"Product {i}", price=1000)
+    response = client.get('/api/inventory/products/', {'page_size': 2})
+    assert [p['name'] for p in response.data['results']] == ["Product 0", "Product 1"]
+    response = client.get(response.data['next'])
+    assert [p['name'] for p in response.data['results']] == ["Product 2", "Product 3"]
+    response = client.get(response.data['previous'])
+    assert [p['name'] for p in response.data['results']] == ["Product 0", "Product 1"]
+    response = client.get('/api/inventory/products/model/', {'page_size': 4})
+    assert len(response.data['results']) == 4
+    assert client.get(response.data['next']).data['next'] is None
+
+
+@pytest.mark.django_db
+def test_get_inventory_with_cursor(client):
+    """
+    InventoryView: 日時・種別・IDの順にカーソルでページ分割されること
+    """
+    product = Product.objects.create(
+        name="Test Product", price=1000, description="Description")
+    Purchase.objects.create(product=product, quantity=10,
+                            purchase_date="2025-04-20T12:00:00Z")
+    Purchase.objects.create(product=product, quantity=10,
+                            purchase_date="2025-04-21T12:00:00Z")
+    for day in (21, 21, 22):
+        Sale.objects.create(product=product, quantity=1,
+                            sale_date=f"2025-04-{day}T12:00:00Z")
+    expected = [
+        (item['type'], item['date'])
+        for item in client.get(f'/api/inventory/inventories/{product.id}/').data
+    ]
+
+    pages = []
+    response = client.get(
+        f'/api/inventory/inventories/{product.id}/', {'page_size': 2})
+    while True:
+        pages.append(response.data['results'])
+        if response.data['next'] is None:
+            break
+        response = client.get(response.data['next'])
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [(item['type'], item['date']) for page in pages for item in page] == expected
+
+    response = client.get(response.data['previous'])
+    assert response.data['results'] == pages[1]
+
+
+@pytest.mark.django_db
+def test_get_inventory_with_date_range(client):
+    """
+    InventoryView: 日時の範囲で絞り込めること
+    """
+    product = Product.objects.create(
+        name="Test Product", price=1000, description="Description")
+    Purchase.objects.create(product=product, quantity=10,
+                            purchase_date="2025-04-20T12:00:00Z")
+    Sale.objects.create(product=product, quantity=5,
+                        sale_date="2025-04-21T12:00:00Z")
+    response = client.get(f'/api/inventory/inventories/{product.id}/',
+                          {'date_from': '2025-04-21T00:00:00Z'})
+    assert len(response.data) == 1
+    assert response.data[0]['type'] == 2
+    response = client.get(f'/api/inventory/inventories/{product.id}/',
+                          {'date_to': 'invalid'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_get_sales_summary_with_cursor(client):
+    """
+    SalesList: 月の範囲で絞り込み、カーソルでページ分割されること
+    """
+    product = Product.objects.create(
+        name="Test Product", price=1000, description="Description")
+    Purchase.objects.create(product=product, quantity=100)
+    for month in (1, 2, 3, 4):
+        Sale.objects.create(product=product, quantity=month,
+                            sale_date=f"2025-0{month}-15T00:00:00Z")
+    response = client.get('/api/inventory/summary/',
+                          {'date_from': '2025-02-20T00:00:00Z', 'page_size': 2})
+    assert response.json()['results'] == [
+        {"monthly_date": "2025-02", "monthly_price": 2},
+        {"monthly_date": "2025-03", "monthly_price": 3},
+    ]
+    response = client.get(response.json()['next'])
+    assert response.json()['results'] == [
+        {"monthly_date": "2025-04", "monthly_price": 4}]
+
+
+@pytest.mark.django_db
+def test_get_products_cached_with_etag(client, django_assert_num_queries,
+                                       django_capture_on_commit_callbacks):
+    """
+    ProductView: 一覧をキャッシュし、ETag一致時は304を返し、更新時に無効化すること
+    """
+    product = Product.objects.create(name="Product 1", price=1000)
+    response = client.get('/api/inventory/products/')
+    etag = response['ETag']
+
+    with django_assert_num_queries(0):
+        assert client.get('/api/inventory/products/').data == response.data
+        response = client.get('/api/inventory/products/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client.put(f'/api/inventory/products/{product.id}/',
+                   data={"name": "Updated Product", "price": 2000}, format='json')
+    response = client.get('/api/inventory/products/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+    assert response.data[0]['name'] == "Updated Product"
+    assert client.get(f'/api/inventory/products/{product.id}/').data['price'] == 2000
+
+
+@pytest.mark.django_db
+def test_get_inventory_invalidated_by_sale(client, django_capture_on_commit_callbacks):
+    """
+    InventoryView: 売上登録時にキャッシュが無効化されること
+    """
+    product = Product.objects.create(
+        name="Test Product", price=1000, description="Description")
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post('/api/inventory/purchases/',
+                    data={"product": product.id, "quantity": 20}, format='json')
+    assert len(client.get(f'/api/inventory/inventories/{product.id}/').data) == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post('/api/inventory/sales/',
+                    data={"product": product.id, "quantity": 8}, format='json')
+    assert len(client.get(f'/api/inventory/inventories/{product.id}/').data) == 2
+
+
+@pytest.mark.django_db
+def test_cache_versions_shared_between_processes(client, settings):
+    """
+    ProductView: 他のプロセスが進めた世代番号でもキャッシュが無効になり、古いETagに304を返さないこと
+    """
+    Product.objects.create(name="Product 1", price=1000)
+    response = client.get('/api/inventory/products/')
+    etag = response['ETag']
+
+    # 他のプロセスでの更新(シグナルを発行しない一括更新)と同じ保存先の世代番号を進める
+    Product.objects.update(name="Updated Product")
+    other = FileBasedCache(settings.CACHES['versions']['LOCATION'], {})
+    other.incr(_version_key(PRODUCTS))
+
+    response = client.get('/api/inventory/products/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+    assert response.data[0]['name'] == "Updated Product"
+
+
+@pytest.mark.django_db
+def test_create_purchases_and_sales_in_bulk(client):
+    """
+    PurchaseBulkView/SaleBulkView: まとめて登録し、在庫数量・売上集計に反映すること
+    """
+    products = [Product.objects.create(name=f"Product {i}", price=1000) for i in range(2)]
+    response = client.post('/api/inventory/purchases/bulk/', data=[
+        {"product": products[0].id, "quantity": 10},
+        {"product": products[1].id, "quantity": 5},
+        {"product": products[0].id, "quantity": 5},
+    ], format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [item['quantity'] for item in response.data] == [10, 5, 5]
+
+    response = client.post('/api/inventory/sales/bulk/', data=[
+        {"product": products[0].id, "quantity": 7, "sale_date": "2025-04-21T12:00:00Z"},
+        {"product": products[0].id, "quantity": 8, "sale_date": "2025-04-22T12:00:00Z"},
+        {"product": products[1].id, "quantity": 5},
+    ], format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Sale.objects.count() == 3
+    assert Stock.objects.get(product=products[0]).quantity == 0
+    assert Stock.objects.get(product=products[1]).quantity == 0
+    response = client.get('/api/inventory/summary/')
+    assert response.json()[0] == {"monthly_date": "2025-04", "monthly_price": 15}
+
+
+@pytest.mark.django_db
+def test_create_sales_in_bulk_with_errors(client):
+    """
+    SaleBulkView: 項目ごとのエラーを返し、何も登録しないこと
+    """
+    products = [Product.objects.create(name=f"Product {i}", price=1000) for i in range(2)]
+    Purchase.objects.create(product=products[0], quantity=10)
+    Purchase.objects.create(product=products[1], quantity=10)
+
+    response = client.post('/api/inventory/sales/bulk/', data=[
+        {"product": products[0].id, "quantity": -1},
+        {"product": products[1].id, "quantity": 1},
+    ], format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'quantity' in response.data[0]
+    assert response.data[1] == {}
+
+    response = client.post('/api/inventory/sales/bulk/', data=[
+        {"product": products[0].id, "quantity": 1},
+        {"product": 0, "quantity": 1},
+    ], format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data[0] == {}
+    assert 'product' in response.data[1]
+
+    response = client.post('/api/inventory/sales/bulk/', data=[
+        {"product": products[0].id, "quantity": 6},
+        {"product": products[1].id, "quantity": 1},
+        {"product": products[0].id, "quantity": 6},
+    ], format='json')
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.data[0] and response.data[2]
+    assert response.data[1] == {}
+    assert Sale.objects.count() == 0
+    assert Stock.objects.get(product=products[0]).quantity == 10
+
+
+@pytest.mark.django_db
+def test_export_inventory(client, settings):
+    """
+    InventoryExportView: 一覧と同じ順序・内容の NDJSON/CSV を返すこと
+    """
+    settings.INVENTORY_EXPORT_CHUNK_SIZE = 2
+    product = Product.objects.create(name="Test Product", price=1000)
+    for day in range(1, 4):
+        Purchase.objects.create(product=product, quantity=10,
+                                purchase_date=f"2025-04-0{day}T12:00:00Z")
+        Sale.objects.create(product=product, quantity=day,
+                            sale_date=f"2025-04-0{day}T12:00:00Z")
+    expected = client.get(f'/api/inventory/inventories/{product.id}/').json()
+
+    response = client.get(f'/api/inventory/exports/inventories/{product.id}/ndjson/')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.streaming
+    assert response['Content-Type'] == 'application/x-ndjson'
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert [json.loads(line) for line in lines] == expected
+
+    response = client.get(f'/api/inventory/exports/inventories/{product.id}/csv/',
+                          {'date_from': '2025-04-03T00:00:00Z'})
+    rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+    assert rows == [
+        ['id', 'unit', 'quantity', 'type', 'date'],
+        [str(expected[4]['id']), '1000', '10', '1', '2025-04-03T12:00:00Z'],
+        [str(expected[5]['id']), '1000', '3', '2', '2025-04-03T12:00:00Z'],
+    ]
+
+    response = client.get(f'/api/inventory/exports/inventories/{product.id}/xml/')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_export_sales(client):
+    """
+    SaleExportView / SalesFileExportView: 期間内・ファイルごとの売上を返すこと
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    sales_file = SalesFile.objects.create(file_name='sales.csv', status=Status.SYNC)
+    Sale.objects.create(product=product, quantity=1, sale_date="2025-03-31T12:00:00Z")
+    imported = Sale.objects.create(product=product, quantity=2, sale_date="2025-04-01T12:00:00Z",
+                                   import_file=sales_file)
+
+    response = client.get('/api/inventory/exports/sales/ndjson/',
+                          {'date_from': '2025-04-01T00:00:00Z'})
+    assert [json.loads(line) for line in b''.join(response.streaming_content).splitlines()] == [
+        {"id": imported.id, "product": product.id, "quantity": 2,
+         "sale_date": "2025-04-01T12:00:00Z", "import_file": sales_file.id},
+    ]
+
+    response = client.get(f'/api/inventory/exports/sales-files/{sales_file.id}/csv/')
+    assert b''.join(response.streaming_content).decode().splitlines() == [
+        'id,product,quantity,sale_date,import_file',
+        f'{imported.id},{product.id},2,2025-04-01T12:00:00Z,{sales_file.id}',
+    ]
+
+    response = client.get(f'/api/inventory/exports/sales-files/{sales_file.id + 1}/csv/')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_async_read_endpoints_match_sync(client):
+    """
+    aio/ の非同期ビュー: 同期のビューと同じレスポンスを返すこと
+    """
+    product = Product.objects.create(name="Test Product", price=1000, description="説明")
+    Purchase.objects.create(product=product, quantity=10, purchase_date="2025-04-01T12:00:00Z")
+    Sale.objects.create(product=product, quantity=3, sale_date="2025-04-02T12:00:00Z")
+
+    for path, params in [
+        ('products/', {}),
+        (f'products/{product.id}/', {}),
+        (f'inventories/{product.id}/', {}),
+        (f'inventories/{product.id}/', {'date_from': '2025-04-02T00:00:00Z'}),
+        (f'inventories/{product.id}/', {'page_size': 1}),
+        ('summary/', {}),
+        ('summary/', {'date_to': '2025-03-31T00:00:00Z'}),
+    ]:
+        expected = client.get(f'/api/inventory/{path}', params)
+        response = client.get(f'/api/inventory/aio/{path}', params)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/json'
+        assert response.content.replace(b'/aio/', b'/') == expected.content, path
+
+    response = client.get(f'/api/inventory/aio/products/{product.id + 1}/')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = client.get('/api/inventory/aio/summary/', {'date_from': 'invalid'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'date_from' in response.json()
+
+
+@pytest.mark.django_db
+def test_async_read_endpoints_cached_with_etag(client, django_assert_num_queries):
+    """
+    aio/ の非同期ビュー: キャッシュとETagを同期のビューと同様に扱うこと
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    response = client.get(f'/api/inventory/aio/products/{product.id}/')
+    with django_assert_num_queries(0):
+        cached = client.get(f'/api/inventory/aio/products/{product.id}/')
+    assert cached.content == response.content
+
+    response = client.get(f'/api/inventory/aio/products/{product.id}/',
+                          HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db(transaction=True)
+def test_query_metrics(client, settings):
+    """
+    サンプリングされたリクエストは Server-Timing ヘッダを返し、エンドポイントごとに累計されること
+    同期・非同期のどちらのビューでもクエリを数えること
+    """
+    settings.INVENTORY_METRICS_SAMPLE_RATE = 1.0
+    metrics.reset()
+    product = Product.objects.create(name="Test Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10)
+    response = client.get(f'/api/inventory/inventories/{product.id}/')
+    assert response.status_code == status.HTTP_200_OK
+    timing = response['Server-Timing']
+    # アーカイブの基準日時 + 在庫履歴
+    assert 'db;dur=' in timing and 'desc="2 queries"' in timing
+    assert 'serialize;dur=' in timing and 'total;dur=' in timing
+
+    # アーカイブの基準日時は同期のビューで共有するキャッシュに保持済み
+    response = async_to_sync(AsyncClient().get)(f'/api/inventory/aio/inventories/{product.id}/')
+    assert response.status_code == status.HTTP_200_OK
+    assert 'desc="1 queries"' in response['Server-Timing']
+
+    response = client.get('/api/inventory/metrics/')
+    routes = response.json()['routes']
+    assert routes['GET api/inventory/inventories/<int:id>/']['requests'] == 1
+    assert routes['GET api/inventory/inventories/<int:id>/']['queries'] == 2
+    assert 'FROM' in routes['GET api/inventory/inventories/<int:id>/']['slowest_sql']
+    assert routes['GET api/inventory/aio/inventories/<int:id>/']['queries'] == 1
+
+    settings.INVENTORY_METRICS_SAMPLE_RATE = 0.0
+    response = client.get(f'/api/inventory/inventories/{product.id}/')
+    assert 'Server-Timing' not in response
+
+
+@pytest.mark.django_db
+def test_query_metrics_unmatched(client, settings):
+    """
+    URLパターンに一致しないリクエストはパスによらず1件に累計されること
+    """
+    settings.INVENTORY_METRICS_SAMPLE_RATE = 1.0
+    metrics.reset()
+    for i in range(3):
+        assert client.get(f'/no-such-path/{i}/').status_code == status.HTTP_404_NOT_FOUND
+    client.post('/no-such-path/')
+
+    assert {route: counters['requests'] for route, counters in metrics.snapshot().items()} == {
+        'GET <unmatched>': 3,
+        'POST <unmatched>': 1,
+    }
+
+
+@pytest.mark.django_db
+def test_stock_at(client):
+    """
+    InventoryStockView: 指定日時時点の在庫数量を、スナップショットの有無によらず同じく返すこと
+    スナップショット作成後に登録・削除された過去日時の仕入・売上も反映すること
+    """
+    product = Product.objects.create(name="Test Product", price=1000)
+    other = Product.objects.create(name="Other Product", price=1000)
+    Purchase.objects.create(product=product, quantity=10, purchase_date="2025-04-01T12:00:00Z")
+    Sale.objects.create(product=product, quantity=3, sale_date="2025-04-02T12:00:00Z")
+    Purchase.objects.create(product=product, quantity=5, purchase_date="2025-04-04T12:00:00Z")
+
+    def stock(at):
+        response = client.get(f'/api/inventory/inventories/{product.id}/stock/', {'at': at})
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()['quantity']
+
+    expected = {'2025-04-01T00:00:00Z': 0, '2025-04-01T12:00:00Z': 10,
+                '2025-04-03T00:00:00Z': 7, '2025-04-05T00:00:00Z': 12}
+    assert {at: stock(at) for at in expected} == expected
+
+    take_snapshots(datetime(2025, 4, 3, tzinfo=timezone.utc))
+    assert {at: stock(at) for at in expected} == expected
+
+    # スナップショットより前の日時の売上を後から登録・削除する
+    sale = Sale.objects.create(product=product, quantity=2, sale_date="2025-04-02T18:00:00Z")
+    assert stock('2025-04-03T00:00:00Z') == 5
+    assert stock('2025-04-05T00:00:00Z') == 10
+    sale.delete()
+    assert not StockSnapshot.objects.filter(product=product).exists()
+    assert {at: stock(at) for at in expected} == expected
+
+    response = client.get('/api/inventory/inventories/stock/', {'at': '2025-04-03T00:00:00Z'})
+    assert response.json() == [{'product': product.id, 'quantity': 7},
+                               {'product': other.id, 'quantity': 0}]
+
+    response = client.get(f'/api/inventory/inventories/{other.id + 1}/stock/')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = client.get(f'/api/inventory/inventories/{product.id}/stock/', {'at': 'invalid'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_low_stock(client):
+    """
+    LowStockView: 在庫数量が発注点以下の商品を返し、発注点の変更・仕入・売上・CSVの取込で
+    一覧に出入りすること
+    """
+    response = client.post('/api/inventory/products/',
+                           data={'name': 'Apple', 'price': 100, 'reorder_point': 5}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    apple = response.data['id']
+    pear = Product.objects.create(name="Pear", price=300)
+
+    def low_stock():
+        response = client.get('/api/inventory/low-stock/')
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()
+
+    # 仕入のない商品も在庫数量0として扱う
+    assert low_stock() == [{'product': apple, 'name': 'Apple', 'quantity': 0, 'reorder_point': 5},
+                           {'product': pear.id, 'name': 'Pear', 'quantity': 0, 'reorder_point': 0}]
+
+    client.post('/api/inventory/purchases/', data={'product': apple, 'quantity': 8}, format='json')
+    client.post('/api/inventory/purchases/', data={'product': pear.id, 'quantity': 1}, format='json')
+    assert low_stock() == []
+
+    client.post('/api/inventory/sales/', data={'product': apple, 'quantity': 3}, format='json')
+    assert [row['product'] for row in low_stock()] == [apple]
+
+    response = client.put(f'/api/inventory/products/{apple}/',
+                          data={'name': 'Apple', 'price': 100, 'reorder_point': 2}, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    assert low_stock() == []
+
+    upload = SimpleUploadedFile(
+        'sales.csv', f'product,date,quantity\n{pear.id},2025-04-21 12:00:00,1\n'.encode())
+    assert client.post('/api/inventory/sync/', data={'file': upload}).status_code == \
+        status.HTTP_201_CREATED
+    assert [row['product'] for row in low_stock()] == [pear.id]
+    assert Stock.objects.get(product=apple).reorder_point == 2
+
+    response = client.get('/api/inventory/low-stock/', {'page_size': 1})
+    assert [row['product'] for row in response.data['results']] == [pear.id]
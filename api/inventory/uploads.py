@@ -0,0 +1,84 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+
+from .exceptions import PayloadTooLarge
+
+
+@dataclass
+class StoredUpload:
+    """
+    スプールディレクトリに保存したアップロードファイル
+    """
+    file_name: str
+    stored_name: str
+    size: int
+    digest: str
+
+
+def check_content_length(request):
+    """
+    リクエスト本文を読み込む前に Content-Length で上限を超えていないかを確認する
+    """
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return
+    if length > settings.SALES_UPLOAD_MAX_SIZE:
+        raise PayloadTooLarge()
+
+
+def stored_path(sales_file):
+    """
+    売上ファイルの保存先のパスを取得する
+    保存名のない(スプールディレクトリ導入前の)売上ファイルは file_name をパスとして扱う
+    """
+    if not sales_file.stored_name:
+        return Path(sales_file.file_name)
+    return Path(settings.SALES_UPLOAD_DIR) / sales_file.stored_name
+
+
+def error_report_path(sales_file):
+    """
+    売上ファイルの取込で除外した行を書き出すエラーレポートのパスを取得する
+    """
+    return Path(settings.SALES_UPLOAD_DIR) / (
+        sales_file.error_report or f'sales-file-{sales_file.pk}.errors.csv')
+
+
+def store_upload(file):
+    """
+    アップロードされたファイルをチャンクごとにスプールディレクトリへ書き込み、
+    書き込みながらSHA-256を計算する
+    同名のファイルが同時にアップロードされても上書きしないよう、保存名は一意に生成する
+    """
+    max_size = settings.SALES_UPLOAD_MAX_SIZE
+    if file.size is not None and file.size > max_size:
+        raise PayloadTooLarge()
+
+    directory = Path(settings.SALES_UPLOAD_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    stored_name = f'{uuid.uuid4().hex}.csv'
+    partial = directory / f'{stored_name}.part'
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial, 'wb') as f:
+            for chunk in file.chunks():
+                size += len(chunk)
+                if size > max_size:
+                    raise PayloadTooLarge()
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(partial, directory / stored_name)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+    file_name = os.path.basename(file.name or '')[:100]
+    return StoredUpload(file_name, stored_name, size, digest.hexdigest())
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('products/', views.ProductView.as_view()),
@@ -8,10 +8,32 @@ urlpatterns = [
     path('products/model/',
          views.ProductModelViewSet.as_view({'get': 'list', 'post': 'create'})),
     path('purchases/', views.PurchaseView.as_view()),
+    path('purchases/bulk/', views.PurchaseBulkView.as_view()),
     path('sales/', views.SaleView.as_view()),
+    path('sales/bulk/', views.SaleBulkView.as_view()),
     path('inventories/<int:id>/', views.InventoryView.as_view()),
+    path('inventories/stock/', views.InventoryStockView.as_view()),
+    path('inventories/<int:id>/stock/', views.InventoryStockView.as_view()),
+    path('low-stock/', views.LowStockView.as_view()),
+    path('forecasts/', views.SalesForecastView.as_view()),
+    path('forecasts/<int:id>/', views.SalesForecastView.as_view()),
+    path('exports/inventories/<int:id>/<str:fmt>/', views.InventoryExportView.as_view()),
+    path('exports/sales/<str:fmt>/', views.SaleExportView.as_view()),
+    path('exports/sales-files/<int:id>/<str:fmt>/', views.SalesFileExportView.as_view()),
 
     path('sync/', views.SalesSyncView.as_view()),
     path('async/', views.SalesAsyncView.as_view()),
+    path('sales-files/<int:id>/errors/', views.SalesFileErrorsView.as_view()),
     path('summary/', views.SalesList.as_view()),
+    path('analytics/revenue/', views.AnalyticsRevenueView.as_view()),
+    path('analytics/top-products/', views.AnalyticsTopProductsView.as_view()),
+    path('analytics/rolling/', views.AnalyticsRollingView.as_view()),
+    path('analytics/stock-cover/', views.AnalyticsStockCoverView.as_view()),
+    path('metrics/', views.MetricsView.as_view()),
+
+    # 非同期ORMで処理する読み取り専用のエンドポイント(ASGIで起動した場合に使用する)
+    path('aio/products/', async_views.AsyncProductView.as_view()),
+    path('aio/products/<int:id>/', async_views.AsyncProductView.as_view()),
+    path('aio/inventories/<int:id>/', async_views.AsyncInventoryView.as_view()),
+    path('aio/summary/', async_views.AsyncSalesList.as_view()),
 ]
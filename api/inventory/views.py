@@ -1,27 +1,64 @@
-import pandas as pd
-from django.db import transaction
-from django.db.models import F, Sum, Value
-from django.db.models.functions import Coalesce, TruncMonth
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.http import FileResponse
+from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.generics import ListAPIView
 from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from . import analytics, metrics
+from .archive import sale_models
+from .cache import PRODUCTS, cached_response, inventory_scope, invalidate, product_scope
 from .exceptions import BusinessException
-from .models import Product, Purchase, Sale, SalesFile, Status
+from .exports import export_response, inventory_ledger, merge_rows
+from .ingestion import InvalidSalesFile, ingest_sales, missing_columns
+from .ledger import ledger_querysets, ledger_union
+from .models import (
+    MonthlySales,
+    Product,
+    Purchase,
+    Sale,
+    SalesFile,
+    SalesForecast,
+    Status,
+    Stock,
+)
+from .pagination import (
+    IdCursorPagination,
+    InventoryCursorPagination,
+    MonthlyCursorPagination,
+    ProductCursorPagination,
+)
+from .renderers import FastJSONRenderer
+from .rollups import add_sale_rows, month_start
 from .serializers import (
+    AnalyticsSerializer,
+    DateRangeSerializer,
     FileSerializer,
     InventorySerializer,
+    LowStockSerializer,
     ProductSerializer,
     PurchaseSerializer,
+    SaleExportSerializer,
     SaleSerializer,
+    SalesFileSerializer,
+    SalesForecastSerializer,
     SalesSerializer,
+    StockAtSerializer,
 )
+from .stocks import add_stocks, lock_stock, lock_stocks, stocks_at
+from .uploads import check_content_length, error_report_path, store_upload, stored_path
 
 
 class ProductView(APIView):
@@ -40,14 +77,25 @@ class ProductView(APIView):
         商品情報を取得する
         """
         if id is None:
-            queryset = Product.objects.all()
-            serializer = ProductSerializer(queryset, many=True)
-            return Response(serializer.data, status.HTTP_200_OK)
+            return cached_response(request, [PRODUCTS], lambda: self.list_products(request))
 
-        product = self.get_object(id)
-        serializer = ProductSerializer(product)
-        return Response(serializer.data, status.HTTP_200_OK)
+        return cached_response(
+            request, [product_scope(id)], lambda: ProductSerializer(self.get_object(id)).data)
 
+    def list_products(self, request):
+        """
+        商品情報の一覧を取得する
+        """
+        queryset = Product.objects.all()
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = ProductSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data).data
+        serializer = ProductSerializer(queryset, many=True)
+        return serializer.data
+
+    @transaction.atomic
     def post(self, request, format=None):
         """
         商品情報を登録する
@@ -57,6 +105,7 @@ class ProductView(APIView):
         serializer.save()
         return Response(serializer.data, status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def put(self, request, id, format=None):
         """
         商品情報を更新する
@@ -67,6 +116,7 @@ class ProductView(APIView):
         serializer.save()
         return Response(serializer.data, status.HTTP_200_OK)
 
+    @transaction.atomic
     def delete(self, request, id, format=None):
         """
         商品情報を削除する
@@ -80,8 +130,14 @@ class ProductModelViewSet(ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        return cached_response(
+            request, [PRODUCTS], lambda: parent.list(request, *args, **kwargs).data)
+
 
 class PurchaseView(APIView):
+    @transaction.atomic
     def post(self, request, format=None):
         """
         仕入情報を登録する
@@ -101,32 +157,272 @@ class SaleView(APIView):
         serializer = SaleSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        purchase = Purchase.objects.filter(product_id=request.data['product']).aggregate(
-            quantity_sum=Coalesce(Sum('quantity'), 0))
-        sales = Sale.objects.filter(product_id=request.data['product']).aggregate(
-            quantity_sum=Coalesce(Sum('quantity'), 0))
-
-        if purchase['quantity_sum'] < (sales['quantity_sum'] + int(request.data['quantity'])):
+        product = serializer.validated_data['product']
+        if lock_stock(product.id) < serializer.validated_data['quantity']:
             raise BusinessException('在庫数量を超過することはできません')
 
         serializer.save()
         return Response(serializer.data, status.HTTP_201_CREATED)
 
 
+class PurchaseBulkView(APIView):
+    @transaction.atomic
+    def post(self, request, format=None):
+        """
+        仕入情報をまとめて登録する
+        """
+        serializer = PurchaseSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        purchases = Purchase.objects.bulk_create(
+            [Purchase(**item) for item in serializer.validated_data])
+        totals = Counter()
+        for purchase in purchases:
+            totals[purchase.product_id] += purchase.quantity
+        add_stocks(totals)
+
+        transaction.on_commit(partial(invalidate, *map(inventory_scope, totals)))
+        return Response(PurchaseSerializer(purchases, many=True).data, status.HTTP_201_CREATED)
+
+
+class SaleBulkView(APIView):
+    @transaction.atomic
+    def post(self, request, format=None):
+        """
+        売上情報をまとめて登録する
+        在庫数量は商品ごとの合計数量で1回だけ確認する
+        """
+        serializer = SaleSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        totals = Counter()
+        for item in serializer.validated_data:
+            totals[item['product'].id] += item['quantity']
+        stocks = lock_stocks(totals)
+        errors = [
+            {'quantity': ['在庫数量を超過することはできません']}
+            if stocks[item['product'].id] < totals[item['product'].id] else {}
+            for item in serializer.validated_data
+        ]
+        if any(errors):
+            raise BusinessException(errors)
+
+        now = timezone.now()
+        sales = Sale.objects.bulk_create(
+            [Sale(**{'sale_date': now, **item}) for item in serializer.validated_data])
+        add_stocks({product_id: -quantity for product_id, quantity in totals.items()})
+        add_sale_rows((sale.product_id, sale.sale_date, sale.quantity) for sale in sales)
+
+        transaction.on_commit(partial(invalidate, *map(inventory_scope, totals)))
+        return Response(SaleSerializer(sales, many=True).data, status.HTTP_201_CREATED)
+
+
 class InventoryView(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     # 仕入れ・売上情報を取得する
     def get(self, request, id=None, format=None):
         if id is None:
             return Response({}, status.HTTP_400_BAD_REQUEST)
 
-        purchases = Purchase.objects.filter(product_id=id).prefetch_related('product').values(
-            "id", "quantity", type=Value('1'), date=F('purchase_date'), unit=F('product__price'))
-        sales = Sale.objects.filter(product_id=id).prefetch_related('product').values(
-            "id", "quantity", type=Value('2'), date=F('sale_date'), unit=F('product__price'))
-        queryset = purchases.union(sales).order_by(F("date"))
-        serializer = InventorySerializer(queryset, many=True)
+        return cached_response(
+            request, [inventory_scope(id), product_scope(id)],
+            lambda: self.list_inventory(request, id))
 
-        return Response(serializer.data, status.HTTP_200_OK)
+    def list_inventory(self, request, id):
+        """
+        指定された商品の仕入れ・売上情報を日時順に取得する
+        期間の開始がアーカイブの基準日時より前の場合はアーカイブ済み売上も併せて取得する
+        """
+        filters = DateRangeSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        querysets = ledger_querysets(
+            id, filters.validated_data.get('date_from'), filters.validated_data.get('date_to'))
+
+        paginator = InventoryCursorPagination()
+        page = paginator.paginate_querysets(querysets, request, view=self)
+        if page is not None:
+            serializer = InventorySerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data).data
+
+        serializer = InventorySerializer(ledger_union(querysets), many=True)
+        return serializer.data
+
+
+class InventoryStockView(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, id=None, format=None):
+        """
+        指定日時(省略時は現在)時点の在庫数量を取得する(id を省略した場合は全商品)
+        直近の在庫スナップショットと、それ以降の仕入・売上から計算する
+        """
+        filters = StockAtSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        at = filters.validated_data.get('at') or timezone.now()
+
+        if id is None:
+            return Response([{'product': product_id, 'quantity': quantity}
+                             for product_id, quantity in stocks_at(at).items()])
+
+        quantities = stocks_at(at, [id])
+        if id not in quantities:
+            raise NotFound()
+        return Response({'product': id, 'at': at, 'quantity': quantities[id]})
+
+
+class LowStockView(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, format=None):
+        """
+        在庫数量が発注点以下の商品の一覧を取得する
+        在庫数量・発注点の更新時にDBが維持する部分インデックスだけを読む
+        """
+        queryset = Stock.objects.filter(quantity__lte=F('reorder_point')).values(
+            'product', 'quantity', 'reorder_point', name=F('product__name')).order_by('product')
+        paginator = ProductCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = LowStockSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        serializer = LowStockSerializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class SalesForecastView(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, id=None, format=None):
+        """
+        forecast_sales コマンドが作成した売上予測を取得する(id を省略した場合は全商品)
+        """
+        queryset = SalesForecast.objects.values(
+            'product', 'as_of', 'window', 'alpha', 'moving_average', 'smoothed', 'horizon',
+            'quantity', 'created_at', name=F('product__name'))
+        if id is not None:
+            forecast = queryset.filter(product=id).first()
+            if forecast is None:
+                raise NotFound()
+            return Response(SalesForecastSerializer(forecast).data)
+
+        queryset = queryset.order_by('product')
+        paginator = ProductCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = SalesForecastSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        serializer = SalesForecastSerializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class InventoryExportView(APIView):
+    # 仕入れ・売上情報をストリーミングでエクスポートする
+    def get(self, request, id, fmt):
+        filters = DateRangeSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        rows = inventory_ledger(id, **filters.validated_data)
+        return export_response(rows, InventorySerializer, fmt, f'inventory-{id}')
+
+
+class SaleExportView(APIView):
+    # 期間内の売上をストリーミングでエクスポートする
+    def get(self, request, fmt):
+        filters = DateRangeSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        querysets = []
+        for model in sale_models(filters.validated_data.get('date_from')):
+            queryset = model.objects.order_by('sale_date', 'id')
+            if 'date_from' in filters.validated_data:
+                queryset = queryset.filter(sale_date__gte=filters.validated_data['date_from'])
+            if 'date_to' in filters.validated_data:
+                queryset = queryset.filter(sale_date__lte=filters.validated_data['date_to'])
+            querysets.append(queryset)
+        rows = merge_rows(querysets, key=lambda row: (row['sale_date'], row['id']))
+        return export_response(rows, SaleExportSerializer, fmt, 'sales')
+
+
+class SalesFileExportView(APIView):
+    # 売上ファイルから取り込んだ売上をストリーミングでエクスポートする
+    def get(self, request, id, fmt):
+        if not SalesFile.objects.filter(pk=id).exists():
+            raise NotFound()
+        # 売上ファイルの売上は一部がアーカイブ済みの場合がある
+        querysets = [model.objects.filter(import_file_id=id).order_by('id') for model in sale_models()]
+        rows = merge_rows(querysets, key=lambda row: row['id'])
+        return export_response(rows, SaleExportSerializer, fmt, f'sales-file-{id}')
+
+
+def save_sales_file(request, initial_status):
+    """
+    アップロードされた売上ファイルをスプールディレクトリに保存して登録する
+    Idempotency-Key または内容が一致する売上ファイルが登録済みの場合は、
+    ファイルを登録せずに登録済みの売上ファイルを返す
+    登録済みの売上ファイルの非同期の取込が失敗していた場合は、内容が一致すれば
+    アップロードし直したファイルでチェックポイントから再開させる
+    戻り値は (売上ファイル, 新規に登録したか)
+    """
+    key = request.headers.get('Idempotency-Key') or None
+    if key is not None:
+        if len(key) > SalesFile._meta.get_field('idempotency_key').max_length:
+            raise ValidationError({'Idempotency-Key': ['Idempotency key is too long.']})
+        sales_file = SalesFile.objects.filter(idempotency_key=key).first()
+        if sales_file is not None and sales_file.status != Status.ASYNC_FAILED:
+            return sales_file, False
+
+    check_content_length(request)
+    serializer = FileSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    upload = store_upload(serializer.validated_data['file'])
+    # 取込時に失敗しないよう、登録前にヘッダーの列を確認する
+    missing = missing_columns(stored_path(upload))
+    if missing:
+        stored_path(upload).unlink(missing_ok=True)
+        raise ValidationError({'file': [f"Missing columns: {', '.join(missing)}."]})
+
+    try:
+        with transaction.atomic():
+            return SalesFile.objects.create(
+                file_name=upload.file_name, stored_name=upload.stored_name,
+                status=initial_status, digest=upload.digest, idempotency_key=key), True
+    except IntegrityError:
+        # 同じ内容・冪等キーのアップロードが先に登録されている
+        duplicate = Q(digest=upload.digest)
+        if key is not None:
+            duplicate |= Q(idempotency_key=key)
+        sales_file = SalesFile.objects.filter(duplicate).order_by('id').first()
+        if sales_file is not None and sales_file.digest == upload.digest \
+                and requeue_sales_file(sales_file, upload):
+            return sales_file, False
+        stored_path(upload).unlink(missing_ok=True)
+        return sales_file, False
+
+
+def requeue_sales_file(sales_file, upload):
+    """
+    取込に失敗した売上ファイルの保存ファイルを同じ内容のアップロードに置き換え、未処理に戻す
+    取込済みの行は登録されたままのため、チェックポイントはそのままにする
+    戻り値は未処理に戻したか
+    """
+    previous = stored_path(sales_file)
+    updated = SalesFile.objects.filter(pk=sales_file.pk, status=Status.ASYNC_FAILED).update(
+        status=Status.ASYNC_UNPROCESSED, stored_name=upload.stored_name, attempts=0, last_error='')
+    if not updated:
+        return False
+    transaction.on_commit(partial(previous.unlink, missing_ok=True))
+    sales_file.refresh_from_db()
+    return True
+
+
+class SalesFileErrorsView(APIView):
+    # 売上ファイルの取込で除外した行のエラーレポートを取得する
+    def get(self, request, id):
+        sales_file = SalesFile.objects.filter(pk=id).first()
+        if sales_file is None or not sales_file.error_report:
+            raise NotFound()
+        return FileResponse(
+            open(error_report_path(sales_file), 'rb'), as_attachment=True,
+            filename=f'sales-file-{id}-errors.csv', content_type='text/csv; charset=utf-8')
 
 
 class SalesSyncView(APIView):
@@ -146,30 +442,24 @@ class SalesSyncView(APIView):
             ),
         ],
         responses={
+            200: "同じファイルが登録済みのため、登録済みの売上ファイルを返しました",
             201: "ファイルが正常に処理されました",
         },
     )
     def post(self, request, format=None):
-        serializer = FileSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        filename = serializer.validated_data['file'].name
-
-        with open(filename, 'wb') as f:
-            f.write(serializer.validated_data['file'].read())
+        sales_file, created = save_sales_file(request, Status.SYNC)
+        if not created:
+            return Response(SalesFileSerializer(sales_file).data, status.HTTP_200_OK)
 
-        sales_file = SalesFile(file_name=filename, status=Status.SYNC)
-        sales_file.save()
-
-        df = pd.read_csv(filename)
-        sales = [
-            Sale(
-                product_id=row['product'], sale_date=row['date'], quantity=row['quantity'], import_file=sales_file
-            )
-            for _, row in df.iterrows()
-        ]
-        Sale.objects.bulk_create(sales)
+        try:
+            ingest_sales(stored_path(sales_file), sales_file)
+        except InvalidSalesFile as e:
+            # 売上ファイルの登録はロールバックされるため、保存したファイルも削除する
+            stored_path(sales_file).unlink(missing_ok=True)
+            error_report_path(sales_file).unlink(missing_ok=True)
+            raise ValidationError({'file': [f'Invalid CSV: {e}']})
 
-        return Response(status=201)
+        return Response(SalesFileSerializer(sales_file).data, status.HTTP_201_CREATED)
 
 
 class SalesAsyncView(APIView):
@@ -189,26 +479,83 @@ class SalesAsyncView(APIView):
             ),
         ],
         responses={
+            200: "同じファイルが登録済みのため、登録済みの売上ファイルを返しました",
             201: "ファイルが正常にアップロードされました",
         },
     )
     def post(self, request, format=None):
-        serializer = FileSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        sales_file, created = save_sales_file(request, Status.ASYNC_UNPROCESSED)
 
-        filename = serializer.validated_data['file'].name
+        return Response(SalesFileSerializer(sales_file).data,
+                        status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
-        with open(filename, 'wb') as f:
-            f.write(serializer.validated_data['file'].read())
 
-        sales_file = SalesFile(
-            file_name=filename, status=Status.ASYNC_UNPROCESSED)
-        sales_file.save()
+class SalesList(ListAPIView):
+    queryset = MonthlySales.objects.filter(count__gt=0).values(
+        monthly_date=F('month'), monthly_price=F('quantity')).order_by('monthly_date')
+    serializer_class = SalesSerializer
+    pagination_class = MonthlyCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
-        return Response(status=201)
+    def get_queryset(self):
+        filters = DateRangeSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        queryset = super().get_queryset()
+        if 'date_from' in filters.validated_data:
+            queryset = queryset.filter(month__gte=month_start(filters.validated_data['date_from']))
+        if 'date_to' in filters.validated_data:
+            queryset = queryset.filter(month__lte=filters.validated_data['date_to'])
+        return queryset
 
 
-class SalesList(ListAPIView):
-    queryset = Sale.objects.annotate(monthly_date=TruncMonth('sale_date')).values(
-        'monthly_date').annotate(monthly_price=Sum('quantity')).order_by('monthly_date')
-    serializer_class = SalesSerializer
+class AnalyticsView(APIView):
+    """
+    メモリ上の売上・仕入から集計する(リクエストごとに売上・仕入のテーブルを集計しない)
+    """
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    # 集計する関数と、検索条件のうち関数に順に渡す項目
+    report = None
+    arguments = ()
+
+    def get(self, request, format=None):
+        filters = AnalyticsSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        return Response(self.report(*(filters.validated_data.get(name) for name in self.arguments)))
+
+
+class AnalyticsRevenueView(AnalyticsView):
+    # 商品ごとの売上数量・売上金額
+    report = staticmethod(analytics.revenue)
+    arguments = ('date_from', 'date_to')
+
+
+class AnalyticsTopProductsView(AnalyticsView):
+    # 売上金額(by=quantity の場合は売上数量)の上位 limit 件の商品
+    report = staticmethod(analytics.top_products)
+    arguments = ('limit', 'by', 'date_from', 'date_to')
+
+
+class AnalyticsRollingView(AnalyticsView):
+    # 日ごとの売上数量・売上金額と直近 window 日間の合計
+    report = staticmethod(analytics.rolling)
+    arguments = ('window', 'product', 'date_from', 'date_to')
+
+
+class AnalyticsStockCoverView(AnalyticsView):
+    # 商品ごとの在庫数量・消化率と、直近 window 日間の売上から計算した在庫日数
+    report = staticmethod(analytics.stock_cover)
+    arguments = ('window',)
+
+
+class MetricsView(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, format=None):
+        """
+        エンドポイントごとのクエリ数・SQLの時間・シリアライズの時間の累計を取得する
+        (このプロセスでサンプリングされたリクエストのみ)
+        """
+        return Response({
+            'sample_rate': settings.INVENTORY_METRICS_SAMPLE_RATE,
+            'routes': metrics.snapshot(),
+        })
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.inventory.archive import archive_sales
+
+
+class Command(BaseCommand):
+    help = '基準日時より前の売上をアーカイブ済み売上に移動し、商品ごとの繰越に加算します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            help=f'基準日時(ISO 8601、省略時は {settings.SALES_ARCHIVE_AFTER_DAYS} 日前)')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.SALES_ARCHIVE_BATCH_SIZE,
+            help='1回のトランザクションで移動する売上の件数')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.SALES_ARCHIVE_AFTER_DAYS)
+        if options['before']:
+            try:
+                cutoff = parse_datetime(options['before'])
+            except ValueError:
+                cutoff = None
+            if cutoff is None:
+                raise CommandError(f"Invalid --before: {options['before']}")
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        archived = archive_sales(cutoff, options['batch_size'])
+        self.stdout.write(f'{archived} sale(s) archived before {cutoff.isoformat()}')
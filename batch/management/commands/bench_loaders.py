@@ -0,0 +1,54 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.inventory.loaders import available_loaders, load_sales
+from api.inventory.models import Product, Sale
+
+
+def sample_frame(product_ids, rows, seed=0):
+    """
+    取り込みと同じ列(product, quantity, date)の売上を作成する
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'product': rng.choice(product_ids, rows),
+        'quantity': rng.integers(1, 10, rows),
+        'date': pd.Timestamp('2025-01-01', tz='UTC') + pd.to_timedelta(
+            rng.integers(0, 365 * 24 * 3600, rows), unit='s'),
+    })
+
+
+class Command(BaseCommand):
+    help = '売上の一括登録を登録方式ごとに計測し、1秒あたりの登録件数を比較します(登録した売上はロールバックします)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='方式ごとの登録件数')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.SALES_IMPORT_BATCH_SIZE,
+            help='1回のINSERTで登録する件数')
+        parser.add_argument(
+            '--loader', action='append', choices=available_loaders(),
+            help='計測する登録方式(省略時は使用できる全ての方式)')
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.values_list('id', flat=True)[:100])
+        if not product_ids:
+            raise CommandError('No products to load sales for.')
+
+        frame = sample_frame(product_ids, options['rows'])
+        for loader in options['loader'] or available_loaders():
+            with transaction.atomic():
+                before = Sale.objects.count()
+                started = time.perf_counter()
+                load_sales(frame, None, options['batch_size'], loader=loader)
+                elapsed = time.perf_counter() - started
+                loaded = Sale.objects.count() - before
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f'{loader}: rows={len(frame)} elapsed={elapsed:.3f}s '
+                f'rows_per_sec={len(frame) / elapsed:.0f} loaded={loaded}')
@@ -0,0 +1,103 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+
+from api.inventory.models import Product
+
+# 計測する読み取りのエンドポイント (商品IDを受け取りパスを返す)
+ROUTES = [
+    lambda id: 'products/',
+    lambda id: f'products/{id}/',
+    lambda id: f'inventories/{id}/',
+    lambda id: 'summary/',
+]
+
+
+def paths(prefix, product_ids, requests):
+    """
+    商品・エンドポイントを順に切り替えながらリクエストするパスを作成する
+    """
+    return [f'/api/inventory/{prefix}{ROUTES[i % len(ROUTES)](product_ids[i % len(product_ids)])}'
+            for i in range(requests)]
+
+
+def run_wsgi(paths, workers):
+    """
+    WSGIの同期ビューを workers 個のスレッドから呼び出し、各リクエストの所要時間を返す
+    """
+    def request(path):
+        started = time.perf_counter()
+        response = Client().get(path)
+        assert response.status_code == 200, (path, response.status_code)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(request, paths))
+
+
+async def run_asgi(paths, concurrency):
+    """
+    ASGIの非同期ビューを同時に concurrency 件まで呼び出し、各リクエストの所要時間を返す
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    client = AsyncClient()
+
+    async def request(path):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+            return time.perf_counter() - started
+
+    return await asyncio.gather(*(request(path) for path in paths))
+
+
+class Command(BaseCommand):
+    help = '読み取りのエンドポイントをWSGI(同期)とASGI(非同期)で負荷試験し、スループットを比較します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='方式ごとのリクエスト数')
+        parser.add_argument(
+            '--workers', type=int, default=4, help='WSGIで同時に処理するスレッド数')
+        parser.add_argument(
+            '--concurrency', type=int, default=50, help='ASGIで同時に処理するリクエスト数')
+        parser.add_argument(
+            '--products', type=int, default=100, help='リクエストに使用する商品数')
+        parser.add_argument(
+            '--no-cache', action='store_true', help='レスポンスのキャッシュを使用しない')
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.order_by('id').values_list(
+            'id', flat=True)[:options['products']])
+        if not product_ids:
+            raise CommandError('No products to request.')
+
+        overrides = {}
+        if options['no_cache']:
+            overrides = {
+                'CACHES': {
+                    **settings.CACHES,
+                    'bench': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+                },
+                'INVENTORY_CACHE_ALIAS': 'bench',
+            }
+        with override_settings(**overrides):
+            self.report('wsgi', options['workers'], lambda: run_wsgi(
+                paths('', product_ids, options['requests']), options['workers']))
+            self.report('asgi', options['concurrency'], lambda: asyncio.run(run_asgi(
+                paths('aio/', product_ids, options['requests']), options['concurrency'])))
+
+    def report(self, name, concurrency, run):
+        started = time.perf_counter()
+        timings = run()
+        elapsed = time.perf_counter() - started
+        cuts = statistics.quantiles(timings, n=20, method='inclusive')
+        self.stdout.write(
+            f'{name}: concurrency={concurrency} requests={len(timings)} '
+            f'rps={len(timings) / elapsed:.1f} p50={statistics.median(timings) * 1000:.1f}ms '
+            f'p95={cuts[18] * 1000:.1f}ms')
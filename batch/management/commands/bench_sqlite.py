@@ -0,0 +1,160 @@
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.utils import load_backend
+
+
+def database(path, profile):
+    """
+    プロファイルの設定で path のSQLiteに接続するための設定を作成する
+    """
+    return {
+        **connections['default'].settings_dict,
+        'NAME': str(path),
+        'OPTIONS': {},
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': False,
+        **settings.SQLITE_PROFILES[profile],
+    }
+
+
+def connect(settings_dict):
+    """
+    スレッドごとの接続を作成する(計測用のため settings.DATABASES には登録しない)
+    """
+    return load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, 'bench')
+
+
+@contextmanager
+def atomic(connection):
+    """
+    transaction.atomic と同じく、transaction_mode の BEGIN で開始するトランザクション
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'BEGIN {connection.transaction_mode or "DEFERRED"}')
+        try:
+            yield cursor
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+
+def setup(connection, products):
+    """
+    在庫数量の更新と同じ形の読み書きを行うテーブルを作成する
+    """
+    with atomic(connection) as cursor:
+        cursor.execute('CREATE TABLE ledger (id INTEGER PRIMARY KEY, product_id INTEGER, quantity INTEGER)')
+        cursor.execute('CREATE INDEX ledger_product ON ledger (product_id)')
+        cursor.execute('CREATE TABLE totals (product_id INTEGER PRIMARY KEY, quantity INTEGER)')
+        cursor.executemany('INSERT INTO totals VALUES (%s, 0)', [(id,) for id in range(products)])
+
+
+def write(connection, product_id):
+    """
+    現在の在庫数量を読んでから売上を登録し、在庫数量を更新する
+    """
+    with atomic(connection) as cursor:
+        cursor.execute('SELECT quantity FROM totals WHERE product_id = %s', [product_id])
+        cursor.fetchone()
+        cursor.execute('INSERT INTO ledger (product_id, quantity) VALUES (%s, 1)', [product_id])
+        cursor.execute('UPDATE totals SET quantity = quantity + 1 WHERE product_id = %s', [product_id])
+
+
+def read(connection, product_id):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT SUM(quantity) FROM ledger WHERE product_id = %s', [product_id])
+        cursor.fetchone()
+
+
+def run(settings_dict, operation, count, workers, products):
+    """
+    operation を workers 個のスレッドから count 回ずつ呼び出し、
+    各呼び出しの所要時間と "database is locked" などで失敗した回数を返す
+    """
+    timings, failures, lock = [], [0], threading.Lock()
+
+    def worker(index):
+        connection = connect(settings_dict)
+        try:
+            for i in range(count):
+                started = time.perf_counter()
+                try:
+                    operation(connection, (index + i) % products)
+                except OperationalError:
+                    with lock:
+                        failures[0] += 1
+                    continue
+                with lock:
+                    timings.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(worker, range(workers)))
+    return timings, failures[0]
+
+
+class Command(BaseCommand):
+    help = ('SQLiteの接続プロファイルごとに、読み取りと書き込みを同時に行った場合の'
+            'スループットと "database is locked" の件数を比較します')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile', action='append', choices=list(settings.SQLITE_PROFILES),
+            help='計測するプロファイル(省略時は全てのプロファイル)')
+        parser.add_argument('--writers', type=int, default=4, help='書き込みを行うスレッド数')
+        parser.add_argument('--readers', type=int, default=8, help='読み取りを行うスレッド数')
+        parser.add_argument('--operations', type=int, default=200, help='スレッドごとの処理回数')
+        parser.add_argument('--products', type=int, default=20, help='読み書きする商品数')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('bench_sqlite requires an SQLite database.')
+
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in options['profile'] or list(settings.SQLITE_PROFILES):
+                settings_dict = database(Path(directory) / f'{profile}.sqlite3', profile)
+                connection = connect(settings_dict)
+                try:
+                    setup(connection, options['products'])
+                finally:
+                    connection.close()
+                self.report(profile, settings_dict, options)
+
+    def report(self, profile, settings_dict, options):
+        results = {}
+
+        def run_writers():
+            results['write'] = run(
+                settings_dict, write, options['operations'], options['writers'], options['products'])
+
+        def run_readers():
+            results['read'] = run(
+                settings_dict, read, options['operations'], options['readers'], options['products'])
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=run_writers), threading.Thread(target=run_readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        for name in ('write', 'read'):
+            timings, failures = results[name]
+            p95 = 0
+            if len(timings) > 1:
+                p95 = statistics.quantiles(timings, n=20, method='inclusive')[18] * 1000
+            self.stdout.write(
+                f'{profile} {name}: ok={len(timings)} locked={failures} '
+                f'ops={len(timings) / elapsed:.1f}/s p95={p95:.1f}ms')
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from api.inventory.forecasts import run_forecasts
+
+
+class Command(BaseCommand):
+    help = '日次売上集計から全商品の売上予測(移動平均・指数平滑)を計算して保存します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--as-of', help='予測の基準日(YYYY-MM-DD、この日までの売上を使用する。省略時は前日)')
+        parser.add_argument(
+            '--window', type=int, default=settings.INVENTORY_FORECAST_WINDOW, help='移動平均の日数')
+        parser.add_argument(
+            '--alpha', type=float, default=settings.INVENTORY_FORECAST_ALPHA,
+            help='指数平滑化の係数(0より大きく1以下)')
+        parser.add_argument(
+            '--horizon', type=int, default=settings.INVENTORY_FORECAST_HORIZON, help='予測日数')
+        parser.add_argument(
+            '--processes', type=int, default=settings.INVENTORY_FORECAST_PROCESSES,
+            help='並列に計算するプロセス数')
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            try:
+                as_of = parse_date(options['as_of'])
+            except ValueError:
+                as_of = None
+            if as_of is None:
+                raise CommandError(f"Invalid --as-of: {options['as_of']}")
+        if options['window'] < 1 or options['horizon'] < 1 or options['processes'] < 1:
+            raise CommandError('--window, --horizon and --processes must be positive')
+        if not 0 < options['alpha'] <= 1:
+            raise CommandError(f"Invalid --alpha: {options['alpha']}")
+
+        with transaction.atomic():
+            count = run_forecasts(as_of, options['window'], options['alpha'], options['horizon'],
+                                  options['processes'])
+
+        self.stdout.write(f'{count} forecast(s) saved')
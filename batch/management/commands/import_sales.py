@@ -1,37 +1,165 @@
-import pandas as pd
-from django.core.management.base import BaseCommand
-from django.db import transaction
+import logging
+import multiprocessing
+import signal
+import threading
+from datetime import timedelta
 
-from api.inventory.models import Sale, SalesFile, Status
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
 
+from api.inventory.ingestion import CheckpointLost, InvalidSalesFile, resume_sales
+from api.inventory.models import SalesFile, Status
+from api.inventory.uploads import stored_path
 
-@transaction.atomic
-def execute(download_history):
-    entry = SalesFile.objects.select_for_update().get(pk=download_history.id)
-    if entry.status != Status.ASYNC_UNPROCESSED:
-        return
+logger = logging.getLogger(__name__)
 
-    filename = entry.file_name
 
-    df = pd.read_csv(filename)
-    sales_instances = [
-        Sale(product_id=row['product'], sale_date=row['date'],
-             quantity=row['quantity'], import_file=entry)
-        for _, row in df.iterrows()
-    ]
-    Sale.objects.bulk_create(sales_instances)
+def claim():
+    """
+    他のワーカーがロックしていない未処理の売上ファイル、またはハートビートが途絶えた
+    処理中の売上ファイルを1件、処理中にして確保する
+    チェックポイントが進まないまま SALES_IMPORT_MAX_ATTEMPTS 回確保した売上ファイルは
+    失敗にして確保しない
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.SALES_IMPORT_LEASE_SECONDS)
+    with transaction.atomic():
+        while True:
+            # それぞれ部分インデックスで探せるよう、未処理と中断を別のクエリで探す
+            for queryset in [
+                SalesFile.objects.filter(status=Status.ASYNC_UNPROCESSED).order_by('id'),
+                SalesFile.objects.filter(
+                    status=Status.ASYNC_IN_PROGRESS,
+                    heartbeat_at__lt=expired).order_by('heartbeat_at'),
+            ]:
+                entry = queryset.select_for_update(skip_locked=True).first()
+                if entry is not None:
+                    break
+            else:
+                return None
+            if entry.attempts < settings.SALES_IMPORT_MAX_ATTEMPTS:
+                break
+            # 取込中にワーカーが異常終了し続けている
+            logger.error('sales file %s failed after %d attempts', entry.pk, entry.attempts)
+            entry.status = Status.ASYNC_FAILED
+            entry.last_error = entry.last_error or f'worker stopped {entry.attempts} times'
+            entry.save(update_fields=['status', 'last_error'])
+        entry.status = Status.ASYNC_IN_PROGRESS
+        entry.heartbeat_at = now
+        entry.attempts += 1
+        entry.save(update_fields=['status', 'heartbeat_at', 'attempts'])
+    return entry
+
+
+def execute(entry, stop=None):
+    """
+    確保した売上ファイルをチェックポイントから取り込む
+    停止要求(stop)を受けた場合はコミット済みのチャンクまでで中断する
+    失敗した場合はエラーを記録し、ハートビートが途絶えた後に再開させる
+    (試行回数が上限に達した場合、再試行しても解析できない場合は失敗にする)
+    """
+    try:
+        resume_sales(stored_path(entry), entry, stop=stop)
+    except CheckpointLost:
+        logger.warning('sales file %s was taken over by another worker', entry.pk)
+    except Exception as e:
+        logger.exception('failed to import sales file %s', entry.pk)
+        fields = {'last_error': f'{type(e).__name__}: {e}'}
+        if entry.attempts >= settings.SALES_IMPORT_MAX_ATTEMPTS or isinstance(e, InvalidSalesFile):
+            fields['status'] = Status.ASYNC_FAILED
+        # 他のワーカーが引き継いでいない場合のみ記録する
+        SalesFile.objects.filter(
+            pk=entry.pk, status=Status.ASYNC_IN_PROGRESS,
+            checkpoint_rows=entry.checkpoint_rows).update(**fields)
+
+
+def claim_and_execute(stop=None):
+    """
+    未処理・中断された売上ファイルを1件取り込む
+    """
+    entry = claim()
+    if entry is None:
+        return False
+    execute(entry, stop)
+    return True
+
+
+def work(stop, poll_interval, max_interval):
+    """
+    停止要求を受けるまで未処理の売上ファイルを取り込み続ける
+    """
+    interval = poll_interval
+    while not stop.is_set():
+        try:
+            if claim_and_execute(stop):
+                interval = poll_interval
+                continue
+        except Exception:
+            logger.exception('failed to import sales file')
+        # 未処理がない、または失敗した場合は待機間隔を延ばす
+        stop.wait(interval)
+        interval = min(interval * 2, max_interval)
+
 
-    entry.status = Status.ASYNC_PROCESSED
-    entry.save()
+def run_worker(stop, poll_interval, max_interval):
+    """
+    ワーカーのスレッド・プロセスで使用したDB接続を終了時に閉じる
+    """
+    try:
+        work(stop, poll_interval, max_interval)
+    finally:
+        connections.close_all()
 
 
 class Command(BaseCommand):
+    help = '未処理の売上ファイルを取り込みます'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--worker', action='store_true', help='停止されるまで常駐して取り込む')
+        parser.add_argument(
+            '--concurrency', type=int, default=1, help='並列に取り込むワーカー数')
+        parser.add_argument(
+            '--processes', action='store_true', help='スレッドではなくプロセスで並列化する')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0, help='未処理がない場合の初回待機秒数')
+        parser.add_argument(
+            '--max-interval', type=float, default=30.0, help='待機秒数の上限')
+
     def handle(self, *args, **options):
-        while True:
-            download_history = SalesFile.objects.filter(
-                status=Status.ASYNC_UNPROCESSED).order_by('id').first()
-            if download_history is None:
-                # 実行中に未処理以外になった場合はスキップ
-                break
-            else:
-                execute(download_history)
+        if not options['worker']:
+            while claim_and_execute():
+                pass
+            return
+
+        concurrency = options['concurrency']
+        if concurrency > 1 and not connection.features.has_select_for_update_skip_locked:
+            raise CommandError(
+                f'{connection.vendor} does not support SELECT ... FOR UPDATE SKIP LOCKED; '
+                'run a single worker instead')
+
+        if options['processes']:
+            context = multiprocessing.get_context('fork')
+            stop = context.Event()
+            # 子プロセスに親の接続を引き継がない
+            connections.close_all()
+            workers = [context.Process(target=run_worker, args=(
+                stop, options['poll_interval'], options['max_interval'])) for _ in range(concurrency)]
+        else:
+            stop = threading.Event()
+            workers = [threading.Thread(target=run_worker, args=(
+                stop, options['poll_interval'], options['max_interval'])) for _ in range(concurrency)]
+
+        def shutdown(signum, frame):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(0.5)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.inventory.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = '売上の履歴から日次・月次の売上集計を再構築し、差異を報告します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true', help='差異の報告のみ行い、売上集計を更新しない')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifts = rebuild_rollups(dry_run=options['dry_run'])
+
+        self.stdout.write(
+            f"daily={drifts['daily']} monthly={drifts['monthly']} drift(s) found")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.inventory.stocks import rebuild_stocks
+
+
+class Command(BaseCommand):
+    help = '仕入・売上の履歴から在庫数量を再構築し、差異を報告します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true', help='差異の報告のみ行い、在庫数量を更新しない')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifts = rebuild_stocks(dry_run=options['dry_run'])
+
+        for product_id, recorded, actual in drifts:
+            self.stdout.write(
+                f'product={product_id} recorded={recorded} actual={actual}')
+        self.stdout.write(f'{len(drifts)} drift(s) found')
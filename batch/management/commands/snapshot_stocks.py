@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.inventory.stocks import prune_snapshots, take_snapshots
+
+
+class Command(BaseCommand):
+    help = '全商品の在庫スナップショットを作成し、古いスナップショットを削除します'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--at', help='スナップショットの基準日時(ISO 8601、省略時は現在日時)')
+        parser.add_argument(
+            '--keep', type=int, default=30, help='残すスナップショットの世代数(0の場合は削除しない)')
+
+    def handle(self, *args, **options):
+        at = timezone.now()
+        if options['at']:
+            try:
+                at = parse_datetime(options['at'])
+            except ValueError:
+                at = None
+            if at is None:
+                raise CommandError(f"Invalid --at: {options['at']}")
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+
+        with transaction.atomic():
+            taken = take_snapshots(at)
+            pruned = prune_snapshots(options['keep']) if options['keep'] > 0 else 0
+
+        self.stdout.write(f'{taken} snapshot(s) taken at {at.isoformat()}, {pruned} pruned')
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,7 +24,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = "django-insecure-+&t(w5#j3da)+n2uig*u-c%o_kuu(=h%f7ypx6a9l68*$^qd#1"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True  # Production should be False
+DEBUG = os.environ.get("DJANGO_DEBUG", "True") == "True"  # Production should be False
 
 ALLOWED_HOSTS = ['*']  # Change to your domain or IP address in production
 
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.inventory.metrics.query_metrics_middleware",
     "corsheaders.middleware.CorsMiddleware",
     # "django.middleware.security.SecurityMiddleware",  # Enabled in production
     # "django.contrib.sessions.middleware.SessionMiddleware",
@@ -78,14 +80,72 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite connection profiles, selected with the SQLITE_PROFILE environment variable.
+# "default" is SQLite's stock configuration. "tuned" lets the import_sales batch and API
+# writes run alongside readers: WAL journal so readers do not block the writer,
+# synchronous=NORMAL (safe with WAL), a larger page cache and mmap, waiting on locks
+# instead of failing with "database is locked", BEGIN IMMEDIATE so transactions take the
+# write lock up front instead of failing when upgrading a read lock, and persistent
+# connections so the PRAGMAs are not re-run on every request.
+# Compare them with: python manage.py bench_sqlite
+
+SQLITE_PROFILES = {
+    "default": {},
+    "tuned": {
+        "OPTIONS": {
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA mmap_size=134217728;"
+                "PRAGMA cache_size=-32000;"
+                "PRAGMA temp_store=MEMORY"
+            ),
+            "timeout": 20,
+            "transaction_mode": "IMMEDIATE",
+        },
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+    },
+}
+
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "tuned")
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        **SQLITE_PROFILES[SQLITE_PROFILE],
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Any Django cache backend can be used, e.g. "django.core.cache.backends.redis.RedisCache"
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "versions": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache" / "versions",
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    },
+}
+
+INVENTORY_CACHE_ALIAS = "default"
+
+# Generation numbers of cached responses. Every process that serves or writes inventory data
+# (web workers and import_sales) must share this cache so that a write made by one of them
+# invalidates the responses cached by the others: the file-based cache works on a single host,
+# use Redis or Memcached across hosts. Never use a per-process cache such as LocMemCache here.
+
+INVENTORY_VERSION_CACHE_ALIAS = "versions"
+
+INVENTORY_CACHE_TIMEOUT = 300
+
+
 # # Password validation
 # # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 #
@@ -127,6 +187,98 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+REST_FRAMEWORK = {
+    # Lists are paginated only when the client passes ?page_size=
+    "DEFAULT_PAGINATION_CLASS": "api.inventory.pagination.IdCursorPagination",
+}
+
+# Sales CSV import
+# Rows read from the CSV per chunk, and rows per INSERT statement.
+
+SALES_IMPORT_CHUNK_SIZE = 10000
+
+SALES_IMPORT_BATCH_SIZE = 1000
+
+# Async imports commit and checkpoint after every chunk. A file whose worker has not
+# committed a chunk for this many seconds is resumed from its checkpoint by another worker,
+# so it must be longer than importing one chunk takes.
+
+SALES_IMPORT_LEASE_SECONDS = 300
+
+# Claims of an asynchronous sales file without its checkpoint advancing before it is marked
+# failed instead of being resumed again.
+
+SALES_IMPORT_MAX_ATTEMPTS = 3
+
+# Imported sales that exceed the current stock of their product:
+# "reject" leaves those rows out, "flag" imports them. Both write them to the error report.
+
+SALES_IMPORT_STOCK_POLICY = "reject"
+
+# How imported sales are written: "copy" (PostgreSQL COPY FROM STDIN), "executemany"
+# (SQLite), "bulk_create", or "auto" for the fastest one the database supports.
+
+SALES_IMPORT_LOADER = "auto"
+
+# Uploaded sales CSV files are streamed into this directory under generated names.
+# Uploads larger than SALES_UPLOAD_MAX_SIZE bytes are rejected with 413.
+
+SALES_UPLOAD_DIR = BASE_DIR / "uploads"
+
+SALES_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+
+# Sales archive
+# archive_sales moves sales older than SALES_ARCHIVE_AFTER_DAYS days into archived_sales,
+# SALES_ARCHIVE_BATCH_SIZE rows per transaction, and adds them to a per-product carry-forward
+# total used when stocks are rebuilt. Reads whose date range starts before the latest cutoff
+# also read archived_sales; others only read sales.
+
+SALES_ARCHIVE_AFTER_DAYS = 365
+
+SALES_ARCHIVE_BATCH_SIZE = 10000
+
+# Streaming exports
+# Rows fetched per database round trip, and rows encoded per response chunk.
+
+INVENTORY_EXPORT_CHUNK_SIZE = 2000
+
+# Analytics
+# /api/inventory/analytics/ answers from sales and purchases held in memory per process.
+# New rows are loaded by id at most once per this many seconds, so reports can lag
+# writes by up to this long. Product names and prices are reloaded when products change.
+
+INVENTORY_ANALYTICS_REFRESH_SECONDS = 10
+
+# Sales forecasts
+# forecast_sales reads this many days of daily sales up to the day before it runs, and stores
+# a moving average over the last WINDOW days and an exponentially smoothed daily demand
+# (ALPHA: weight of the latest day) per product. The forecast quantity covers HORIZON days.
+# Products are forecast CHUNK_SIZE at a time; with more than one chunk, chunks run on a pool
+# of PROCESSES worker processes.
+
+INVENTORY_FORECAST_HISTORY_DAYS = 90
+
+INVENTORY_FORECAST_WINDOW = 7
+
+INVENTORY_FORECAST_ALPHA = 0.3
+
+INVENTORY_FORECAST_HORIZON = 14
+
+INVENTORY_FORECAST_CHUNK_SIZE = 2000
+
+INVENTORY_FORECAST_PROCESSES = os.cpu_count() or 1
+
+# Query metrics
+# The share of requests (0.0 - 1.0) whose query count, SQL time, slowest query and
+# serialization time are measured. Measured responses get a Server-Timing header and are
+# added to the per-route counters at /api/inventory/metrics/. Other requests are not
+# instrumented, so keep this low in production.
+
+INVENTORY_METRICS_SAMPLE_RATE = float(os.environ.get("INVENTORY_METRICS_SAMPLE_RATE", "0.05"))
+
+# Every SQL statement is formatted and written to the console when django.db.backends is
+# at DEBUG (and only while DEBUG is True). Use DJANGO_DB_LOG_LEVEL=DEBUG to turn it on.
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -137,11 +289,11 @@ LOGGING = {
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': os.environ.get("DJANGO_LOG_LEVEL", "INFO"),
     },
     'loggers': {
         'django.db.backends': {
-            'level': 'DEBUG',
+            'level': os.environ.get("DJANGO_DB_LOG_LEVEL", "INFO"),
             'handlers': ['console'],
             'propagate': False,
         }